@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Shared by every worker process: event log for the bus + scheduler lease
+BUS_DB_PATH = os.getenv("BUS_DB_PATH", "./bus.db")
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def encode(payload: Dict[str, Any]) -> str:
+    # same compact encoding as WebSocket.send_json
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+class LocalBus:
+    """Single process: publish() delivers straight to the local WS clients."""
+
+    def __init__(self, deliver: Callable[[str], None]):
+        self.deliver = deliver
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, payload: Dict[str, Any]):
+        self.deliver(encode(payload))
+
+
+class SqliteBus:
+    """
+    Multi-worker fan-out through a SQLite event log: publish() appends the
+    encoded event, every worker polls for ids past the last one it saw and
+    delivers them to its own WS clients (the publisher included).
+    Events older than `retention_s` are pruned.
+    """
+
+    def __init__(self, deliver: Callable[[str], None], path: str = BUS_DB_PATH,
+                 poll_interval: float = 0.2, retention_s: float = 300):
+        self.deliver = deliver
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_s = retention_s
+        self._last_id = 0
+        self._task: Optional[asyncio.Task] = None
+        self._ready = False
+
+    def _setup(self) -> int:
+        conn = _connect(self.path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bus_event ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._ready = True
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM bus_event").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _insert(self, text: str):
+        if not self._ready:
+            self._setup()  # publish-only process (e.g. ingest.py): start() never ran
+        conn = _connect(self.path)
+        try:
+            conn.execute("INSERT INTO bus_event (payload, created_at) VALUES (?, ?)", (text, time.time()))
+        finally:
+            conn.close()
+
+    def _fetch(self, after: int, prune: bool) -> List[Tuple[int, str]]:
+        conn = _connect(self.path)
+        try:
+            if prune:
+                conn.execute("DELETE FROM bus_event WHERE created_at < ?", (time.time() - self.retention_s,))
+            return conn.execute("SELECT id, payload FROM bus_event WHERE id > ? ORDER BY id", (after,)).fetchall()
+        finally:
+            conn.close()
+
+    async def start(self):
+        # only events published from now on
+        self._last_id = await asyncio.to_thread(self._setup)
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def publish(self, payload: Dict[str, Any]):
+        await asyncio.to_thread(self._insert, encode(payload))
+
+    async def _poll(self):
+        rounds = 0
+        while True:
+            rounds += 1
+            try:
+                rows = await asyncio.to_thread(self._fetch, self._last_id, rounds % 300 == 0)
+            except sqlite3.Error:
+                rows = []
+            for event_id, text in rows:
+                self._last_id = event_id
+                self.deliver(text)
+            await asyncio.sleep(self.poll_interval)
+
+
+def make_bus(deliver: Callable[[str], None]):
+    """NOTIFY_BUS=local (default, single worker) or sqlite (uvicorn --workers N)."""
+    if os.getenv("NOTIFY_BUS", "local") == "sqlite":
+        return SqliteBus(deliver, poll_interval=float(os.getenv("BUS_POLL_S", 0.2)))
+    return LocalBus(deliver)
+
+
+class LeaderLease:
+    """
+    Leader election between worker processes: a row per lease name in BUS_DB_PATH,
+    owned by one process until it stops renewing it for `ttl` seconds.
+    """
+
+    def __init__(self, name: str, path: str = BUS_DB_PATH, ttl: float = 30):
+        self.name = name
+        self.path = path
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def try_acquire(self) -> bool:
+        """Acquire or renew; True if this process is the leader."""
+        now = time.time()
+        conn = _connect(self.path)
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lease ("
+                " name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR IGNORE INTO lease (name, owner, expires_at) VALUES (?, ?, ?)",
+                         (self.name, self.owner, now + self.ttl))
+            conn.execute("UPDATE lease SET owner = ?, expires_at = ? WHERE name = ? AND (owner = ? OR expires_at < ?)",
+                         (self.owner, now + self.ttl, self.name, self.owner, now))
+            owner = conn.execute("SELECT owner FROM lease WHERE name = ?", (self.name,)).fetchone()[0]
+            conn.execute("COMMIT")
+            return owner == self.owner
+        finally:
+            conn.close()
+
+    def release(self):
+        conn = _connect(self.path)
+        try:
+            conn.execute("DELETE FROM lease WHERE name = ? AND owner = ?", (self.name, self.owner))
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
@@ -0,0 +1,98 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlmodel import create_engine
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./finance.db")
+# Optional separate engine for the listing endpoints, e.g.
+# "sqlite:///file:./finance.db?mode=ro&uri=true" (opened read-only)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """
+    SQLite PRAGMAs applied to every new connection, plus pool sizing.
+    None leaves SQLite's own default in place.
+    """
+    journal_mode: Optional[str] = None
+    synchronous: Optional[str] = None
+    mmap_size: Optional[int] = None
+    cache_size: Optional[int] = None       # pages, or -KiB when negative
+    busy_timeout_ms: Optional[int] = None
+    pool_size: int = 5
+    max_overflow: int = 10
+
+    @classmethod
+    def from_env(cls) -> "StorageProfile":
+        """
+        SQLITE_PROFILE=tuned (default) or legacy; every value can be overridden:
+        SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE,
+        SQLITE_BUSY_TIMEOUT_MS, DB_POOL_SIZE, DB_MAX_OVERFLOW.
+        """
+        base = LEGACY if os.getenv("SQLITE_PROFILE", "tuned") == "legacy" else TUNED
+
+        def env(name: str, default, cast=str):
+            raw = os.getenv(name)
+            return default if raw is None else cast(raw)
+
+        return cls(
+            journal_mode=env("SQLITE_JOURNAL_MODE", base.journal_mode),
+            synchronous=env("SQLITE_SYNCHRONOUS", base.synchronous),
+            mmap_size=env("SQLITE_MMAP_SIZE", base.mmap_size, int),
+            cache_size=env("SQLITE_CACHE_SIZE", base.cache_size, int),
+            busy_timeout_ms=env("SQLITE_BUSY_TIMEOUT_MS", base.busy_timeout_ms, int),
+            pool_size=env("DB_POOL_SIZE", base.pool_size, int),
+            max_overflow=env("DB_MAX_OVERFLOW", base.max_overflow, int),
+        )
+
+
+# What create_engine("sqlite:///./finance.db") gave us before
+LEGACY = StorageProfile()
+
+TUNED = StorageProfile(
+    journal_mode="WAL",          # readers never block the writer (and vice versa)
+    synchronous="NORMAL",        # fsync at checkpoints only, safe with WAL
+    mmap_size=256 * 1024 * 1024,
+    cache_size=-64 * 1024,       # 64 MiB
+    busy_timeout_ms=5000,        # wait for the write lock instead of "database is locked"
+    pool_size=8,
+    max_overflow=8,
+)
+
+
+def make_engine(url: str, profile: StorageProfile, read_only: bool = False) -> Engine:
+    engine = create_engine(
+        url,
+        echo=False,
+        pool_size=profile.pool_size,
+        max_overflow=profile.max_overflow,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        if profile.busy_timeout_ms is not None:
+            cur.execute(f"PRAGMA busy_timeout={int(profile.busy_timeout_ms)}")
+        if profile.journal_mode and not read_only:
+            cur.execute(f"PRAGMA journal_mode={profile.journal_mode}")
+        if profile.synchronous:
+            cur.execute(f"PRAGMA synchronous={profile.synchronous}")
+        if profile.mmap_size is not None:
+            cur.execute(f"PRAGMA mmap_size={int(profile.mmap_size)}")
+        if profile.cache_size is not None:
+            cur.execute(f"PRAGMA cache_size={int(profile.cache_size)}")
+        if read_only:
+            cur.execute("PRAGMA query_only=ON")
+        cur.close()
+
+    return engine
+
+
+profile = StorageProfile.from_env()
+engine = make_engine(DATABASE_URL, profile)
+# Listing endpoints read through this one; same engine unless DATABASE_READ_URL is set
+read_engine = make_engine(DATABASE_READ_URL, profile, read_only=True) if DATABASE_READ_URL else engine
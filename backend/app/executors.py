@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class PoolBusy(Exception):
+    """Raised when a pool already has max_workers + max_queue jobs in flight."""
+
+
+class BoundedPool:
+    """
+    Wraps a concurrent.futures executor for use from the event loop.
+    At most max_workers + max_queue jobs are accepted at once; beyond that
+    submit() raises PoolBusy instead of letting the backlog grow unbounded.
+    """
+
+    def __init__(self, name: str, kind: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.kind = kind  # "thread" | "process"
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor: Optional[Executor] = None
+        self.pending = 0
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        # created lazily: nothing is spawned until the first job
+        if self._executor is None:
+            if self.kind == "process":
+                # concurrent.futures.process (multiprocessing) only loads if a process pool is used
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.pending - self.max_workers)
+
+    async def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise PoolBusy(f"{self.name} pool saturated ({self.pending} jobs in flight)")
+
+        self.pending += 1
+        self.submitted += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._get_executor(), functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class WorkerPools:
+    """
+    Thread pool for blocking DB / disk I/O, process pool for CPU-bound XML parsing,
+    and a separate thread pool for model-server calls (seconds each, up to the
+    client timeout) so they never hold the DB threads.
+    Configured from the environment:
+      DB_WORKERS (default 4), PARSE_WORKERS (default cpu count),
+      PARSE_EXECUTOR ("process" | "thread", default "process"),
+      MODEL_WORKERS (default 2), EXECUTOR_MAX_QUEUE (default 64, per pool).
+    """
+
+    def __init__(self):
+        max_queue = int(os.getenv("EXECUTOR_MAX_QUEUE", 64))
+        self.db = BoundedPool("db", "thread", int(os.getenv("DB_WORKERS", 4)), max_queue)
+        self.parse = BoundedPool(
+            "parse",
+            os.getenv("PARSE_EXECUTOR", "process"),
+            int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1)),
+            max_queue,
+        )
+        self.model = BoundedPool("model", "thread", int(os.getenv("MODEL_WORKERS", 2)), max_queue)
+
+    async def run_db(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await self.db.submit(fn, *args, **kwargs)
+
+    async def run_parse(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await self.parse.submit(fn, *args, **kwargs)
+
+    async def run_model(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await self.model.submit(fn, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"db": self.db.stats(), "parse": self.parse.stats(), "model": self.model.stats()}
+
+    def shutdown(self):
+        self.db.shutdown()
+        self.parse.shutdown()
+        self.model.shutdown()
+
+
+pools = WorkerPools()
@@ -0,0 +1,236 @@
+import dataclasses
+import json
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "./jobs.db")
+
+_COLUMNS = ("id", "kind", "status", "attempts", "max_attempts", "error",
+            "created_at", "updated_at", "finished_at", "progress", "result")
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+@dataclasses.dataclass
+class Job:
+    id: str
+    kind: str
+    payload: Any
+    attempts: int
+    max_attempts: int
+    owner: str = ""
+
+
+class JobQueue:
+    """
+    Durable job queue in a SQLite file shared by every process. A job goes
+    queued -> running -> done; claim() hands it to one worker with a lease of
+    `lease_s` seconds (a worker that dies without finishing loses it and the
+    job is claimed again). Failures are retried after retry_base_s * 2^n
+    seconds; after `max_attempts` attempts the job is 'dead' and stays there
+    for inspection until retry() puts it back in the queue.
+
+    Env: JOBS_DB_PATH (default ./jobs.db), JOB_LEASE_S (300), JOB_MAX_ATTEMPTS (5),
+    JOB_RETRY_BASE_S (5), JOB_RETENTION_S (7 days, finished jobs are pruned after it).
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH, lease_s: float = 300, max_attempts: int = 5,
+                 retry_base_s: float = 5, retention_s: float = 7 * 86400):
+        self.path = path
+        self.lease_s = lease_s
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_s = retry_base_s
+        self.retention_s = retention_s
+        self._ready = False
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        return cls(
+            lease_s=float(os.getenv("JOB_LEASE_S", 300)),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", 5)),
+            retry_base_s=float(os.getenv("JOB_RETRY_BASE_S", 5)),
+            retention_s=float(os.getenv("JOB_RETENTION_S", 7 * 86400)),
+        )
+
+    def _open(self) -> sqlite3.Connection:
+        conn = _connect(self.path)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job ("
+                " id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL,"
+                " progress TEXT, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL,"
+                " available_at REAL NOT NULL, lease_owner TEXT, lease_expires_at REAL,"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL, finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_job_status_available_at ON job (status, available_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_job_status_lease ON job (status, lease_expires_at)")
+            self._ready = True
+        return conn
+
+    def enqueue(self, kind: str, payload: Any, job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        conn = self._open()
+        try:
+            conn.execute(
+                "INSERT INTO job (id, kind, status, payload, max_attempts, available_at, created_at, updated_at)"
+                " VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), self.max_attempts, now, now, now),
+            )
+        finally:
+            conn.close()
+        return job_id
+
+    def claim(self, owner: str) -> Optional[Job]:
+        """Oldest available job, leased to `owner`; None when there is nothing to do."""
+        now = time.time()
+        conn = self._open()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # lease expired on the last allowed attempt: dead letter, not another run
+            conn.execute(
+                "UPDATE job SET status = 'dead', error = coalesce(error, 'lease expired'), lease_owner = NULL,"
+                " updated_at = ?, finished_at = ?"
+                " WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts",
+                (now, now, now),
+            )
+            row = conn.execute(
+                "SELECT id FROM job WHERE status = 'queued' AND available_at <= ? ORDER BY available_at LIMIT 1",
+                (now,),
+            ).fetchone() or conn.execute(
+                "SELECT id FROM job WHERE status = 'running' AND lease_expires_at < ? LIMIT 1", (now,)
+            ).fetchone()
+            job = None
+            if row is not None:
+                job = Job(*conn.execute(
+                    "UPDATE job SET status = 'running', lease_owner = ?, lease_expires_at = ?,"
+                    " attempts = attempts + 1, updated_at = ? WHERE id = ?"
+                    " RETURNING id, kind, payload, attempts, max_attempts",
+                    (owner, now + self.lease_s, now, row[0]),
+                ).fetchone())
+                job.payload = json.loads(job.payload)
+                job.owner = owner
+            conn.execute("COMMIT")
+            return job
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def complete(self, job: Job, owner: str, result: Any) -> bool:
+        """False if the lease was lost meanwhile (another worker owns the job now)."""
+        now = time.time()
+        conn = self._open()
+        try:
+            cur = conn.execute(
+                "UPDATE job SET status = 'done', result = ?, error = NULL, lease_owner = NULL,"
+                " updated_at = ?, finished_at = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (json.dumps(result), now, now, job.id, owner),
+            )
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def heartbeat(self, job: Job, progress: Any = None) -> bool:
+        """
+        Renews the lease of a long job and records its progress (shown by get()).
+        False if the lease was lost: the job now belongs to another worker.
+        """
+        now = time.time()
+        conn = self._open()
+        try:
+            cur = conn.execute(
+                "UPDATE job SET progress = coalesce(?, progress), lease_expires_at = ?, updated_at = ?"
+                " WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (None if progress is None else json.dumps(progress), now + self.lease_s, now, job.id, job.owner),
+            )
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def fail(self, job: Job, owner: str, error: str) -> str:
+        """Schedules a retry with backoff, or dead-letters the job. Returns the new status."""
+        now = time.time()
+        status = "dead" if job.attempts >= job.max_attempts else "queued"
+        conn = self._open()
+        try:
+            conn.execute(
+                "UPDATE job SET status = ?, error = ?, lease_owner = NULL, available_at = ?, updated_at = ?,"
+                " finished_at = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (status, error, now + self.retry_base_s * 2 ** (job.attempts - 1), now,
+                 now if status == "dead" else None, job.id, owner),
+            )
+        finally:
+            conn.close()
+        return status
+
+    def retry(self, job_id: str) -> bool:
+        """Puts a dead job back in the queue with a fresh set of attempts."""
+        now = time.time()
+        conn = self._open()
+        try:
+            cur = conn.execute(
+                "UPDATE job SET status = 'queued', attempts = 0, available_at = ?, updated_at = ?, finished_at = NULL"
+                " WHERE id = ? AND status = 'dead'",
+                (now, now, job_id),
+            )
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._open()
+        try:
+            row = conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM job WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        out = dict(zip(_COLUMNS, row))
+        for name in ("progress", "result"):
+            out[name] = json.loads(out[name]) if out[name] else None
+        return out
+
+    def active(self, kind: str) -> Optional[str]:
+        """Id of a queued or running job of this kind, if any."""
+        conn = self._open()
+        try:
+            row = conn.execute(
+                "SELECT id FROM job WHERE status IN ('queued', 'running') AND kind = ? LIMIT 1", (kind,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def prune(self) -> List[str]:
+        """Deletes done / dead jobs finished more than retention_s ago; returns their ids."""
+        conn = self._open()
+        try:
+            rows = conn.execute(
+                "DELETE FROM job WHERE status IN ('done', 'dead') AND finished_at < ? RETURNING id",
+                (time.time() - self.retention_s,),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [r[0] for r in rows]
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._open()
+        try:
+            counts = dict(conn.execute("SELECT status, count(*) FROM job GROUP BY status").fetchall())
+        finally:
+            conn.close()
+        return {status: counts.get(status, 0) for status in ("queued", "running", "done", "dead")}
+
+
+job_queue = JobQueue.from_env()
@@ -1,34 +1,81 @@
-from fastapi import FastAPI, UploadFile, File, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.responses import JSONResponse
-from scripts.check_pagata_api import check_pagata
-from scripts.check_importo_api import check_importo
-from scripts.check_date_api import check_date
-from scripts.check_data_fornitore_api import check_date_fornitore
-from contextlib import asynccontextmanager
+import time
+# startup breakdown: everything below, framework imports included, counts as "import"
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import APIRouter, FastAPI, Request, UploadFile, File, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
+from starlette.formparsers import MultiPartException, MultiPartParser
+from scripts.check_pagata_api import pagata_payload
+from scripts.check_importo_api import importo_payload
+from scripts.check_date_api import date_payload
+from scripts.check_data_fornitore_api import fornitore_payload
+from scripts.fattura_extractor import EXTRACTOR_VERSION, FatturaInfo, extract_fattura
+from app.executors import pools, PoolBusy
+from app.db import engine, read_engine
+from app.ws import WSManager, PONG
+from app.bus import LeaderLease, make_bus
+from app.parse_cache import parse_cache
+from app.storage import content_store, extract_file, open_stored
+from app.metrics import TimingMiddleware, job_rows, job_seconds, profiler, queue_job_seconds, registry, span
+from app.migrations import Migration, migrate
+from pydantic import BaseModel
+from app.jobs import Job, job_queue
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
 from fastapi import UploadFile, File
 
 
-import tempfile
 import os
+import json
+import itertools
+import collections
+import hashlib
+import base64
+import dataclasses
+import asyncio
+import tempfile
+import shutil
+import socket
+import threading
+import uuid
 from datetime import datetime, date, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Union
 from zoneinfo import ZoneInfo
 
 
 # --- NEW: persistence & scheduler ---
-from sqlmodel import SQLModel, Field, create_engine, Session, select
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlmodel import SQLModel, Field, Session, select, or_, and_
+from sqlalchemy import Index, Date, Integer, String, cast, delete, exists, func, insert, literal, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 
-FILES_DIR = Path("./files")
-FILES_DIR.mkdir(exist_ok=True)
+# created at startup (prepare_storage), not at import
+FILES_DIR = content_store.root
 
-TZ = ZoneInfo("Europe/Amsterdam")
+# Upload fino a questa soglia restano in memoria nel parser multipart (UploadParser),
+# oltre vengono spoolati su disco
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", 1024 * 1024))
 
-app = FastAPI(title="Finance Dashboard API")
+# Limiti sugli upload (413 oltre soglia): per file e per richiesta batch
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", 500 * 1024 * 1024))
+# margine per boundary e header multipart sul corpo della richiesta, oltre ai limiti sui file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_CHUNK = 64 * 1024
+# gli upload vengono copiati qui a blocchi; stesso filesystem di FILES_DIR per os.replace
+INCOMING_DIR = FILES_DIR / "incoming"
+# files of queued upload jobs, one directory per job, until the job is done
+JOBS_DIR = FILES_DIR / "jobs"
+
+TZ = ZoneInfo("Europe/Amsterdam")
 
 # ---------- NEW: DB models ----------
 class Invoice(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_invoice_paid_due_date", "paid", "due_date"),
+        Index("ix_invoice_source_created_at", "source", "created_at"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     filename: str
     due_date: date
@@ -38,9 +85,49 @@ class Invoice(SQLModel, table=True):
     created_at: datetime = Field(default_factory=lambda: datetime.now(TZ))
     # NEW
     source: str = "invoice_xml"     # "receipt_upload" per le ricevute
-    file_path: Optional[str] = None # dove salviamo il file caricato
+    file_path: Optional[str] = None # chiave del file nel content store (app.storage)
+    # dedup: sha256 del file caricato + identificativo SdI (se presente)
+    content_hash: Optional[str] = Field(default=None, index=True, unique=True)
+    id_sdi: Optional[str] = Field(default=None, index=True)
+    amount: Optional[float] = None  # importo letto dalla fattura (None se non trovato)
+    # versione di extract_fattura che ha prodotto i campi: le righe più vecchie le rilegge il backfill
+    extractor_version: Optional[int] = EXTRACTOR_VERSION
+    # anagrafica del fornitore (supplier resta il nome letto da questa fattura)
+    supplier_id: Optional[int] = Field(default=None, foreign_key="supplier.id")
+
+class Supplier(SQLModel, table=True):
+    # un fornitore per partita IVA (IdPaese + IdCodice) o, in mancanza, codice fiscale
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tax_id: str = Field(index=True, unique=True)
+    name: Optional[str] = None  # nome con cui è stato visto la prima volta
+
+class InvoiceStat(SQLModel, table=True):
+    # aggregati aggiornati ad ogni insert / pagamento: /analytics legge solo questi
+    dimension: str = Field(primary_key=True)  # "day" | "week" | "month" | "supplier"
+    bucket: str = Field(primary_key=True)     # inizio del periodo (ISO) o id del fornitore
+    paid: bool = Field(primary_key=True)
+    count: int = 0
+    amount: float = 0.0
+
+class NotificationLedger(SQLModel, table=True):
+    # una riga per (fattura, tipo, giorno) già notificata: rende idempotente lo scan;
+    # servono solo quelle di oggi, le altre le cancella _fire_due_events
+    invoice_id: int = Field(primary_key=True)
+    kind: str = Field(primary_key=True)
+    day: date = Field(primary_key=True)
+
+class DueEvent(SQLModel, table=True):
+    # prossimo evento di scadenza per (fattura, tipo): la coda con priorità è l'indice su fire_at
+    __table_args__ = (Index("ix_dueevent_fire_at", "fire_at"),)
+    invoice_id: int = Field(primary_key=True)
+    kind: str = Field(primary_key=True)  # "due_soon" | "due_today" | "overdue"
+    fire_at: datetime
 
 class Notification(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_notification_read_created_at", "read", "created_at"),
+        Index("ix_notification_created_at", "created_at"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     kind: str  # e.g., "due_soon"
     message: str
@@ -50,33 +137,75 @@ class Notification(SQLModel, table=True):
     read: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(TZ))
 
-engine = create_engine("sqlite:///./finance.db", echo=False)
+# ---------- NEW: supplier registry ----------
+# the supplier as an invoice names it: CedentePrestatore tax id + name
+SupplierRef = collections.namedtuple("SupplierRef", "tax_id name")
 
-# ---------- NEW: WebSocket manager ----------
-class WSManager:
-    def __init__(self):
-        self.connections: List[WebSocket] = []
-
-    async def connect(self, ws: WebSocket):
-        await ws.accept()
-        self.connections.append(ws)
-
-    def disconnect(self, ws: WebSocket):
-        if ws in self.connections:
-            self.connections.remove(ws)
-
-    async def broadcast(self, payload: Dict[str, Any]):
-        # Send to all; drop broken sockets quietly
-        dead = []
-        for ws in self.connections:
-            try:
-                await ws.send_json(payload)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            self.disconnect(ws)
+def supplier_ref(info: FatturaInfo) -> Optional[SupplierRef]:
+    if not info.id_fornitore:
+        return None
+    return SupplierRef(info.id_fornitore, info.nome_fornitore)
+
+class SupplierRegistry:
+    """
+    tax id -> Supplier.id, with an in-process LRU of `max_items` entries in
+    front of the supplier table: known suppliers cost no query. Unknown ones
+    are inserted in the caller's session, so they commit (or roll back) with
+    the invoices that reference them; only ids read back from the table are
+    cached, never those of rows inserted by a transaction still open.
+    Safe to call from the DB thread pool.
+
+    Env: SUPPLIER_CACHE_ITEMS (default 10000).
+    """
+
+    def __init__(self, max_items: int = 10000):
+        self.max_items = max(1, max_items)
+        self._cache: "collections.OrderedDict[str, int]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, sess: Session, refs: Iterable[SupplierRef]) -> Dict[str, int]:
+        """SupplierRefs -> {tax_id: supplier id}, registering new suppliers in `sess` (not committed)."""
+        names = {ref.tax_id: ref.name for ref in refs}
+        ids: Dict[str, int] = {}
+        with self._lock:
+            for tax_id in names:
+                supplier_id = self._cache.get(tax_id)
+                if supplier_id is not None:
+                    self._cache.move_to_end(tax_id)
+                    ids[tax_id] = supplier_id
+            self.hits += len(ids)
+            self.misses += len(names) - len(ids)
+        missing = [tax_id for tax_id in names if tax_id not in ids]
+        if not missing:
+            return ids
+        known = dict(sess.exec(select(Supplier.tax_id, Supplier.id).where(Supplier.tax_id.in_(missing))).all())
+        with self._lock:
+            for tax_id, supplier_id in known.items():
+                self._cache[tax_id] = supplier_id
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+        ids.update(known)
+        new = [tax_id for tax_id in missing if tax_id not in known]
+        if new:
+            sess.execute(
+                sqlite_insert(Supplier).on_conflict_do_nothing(index_elements=["tax_id"]),
+                [{"tax_id": tax_id, "name": names[tax_id]} for tax_id in new],
+            )
+            ids.update(sess.exec(select(Supplier.tax_id, Supplier.id).where(Supplier.tax_id.in_(new))).all())
+        return ids
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"items": len(self._cache), "max_items": self.max_items, "hits": self.hits, "misses": self.misses}
+
+supplier_registry = SupplierRegistry(int(os.getenv("SUPPLIER_CACHE_ITEMS", 10000)))
 
+# ---------- NEW: WebSocket manager ----------
 ws_manager = WSManager()
+# Notifications go through the bus so every worker process fans them out
+bus = make_bus(ws_manager.broadcast_text)
 
 # ---------- NEW: helpers ----------
 def parse_due_date(payload: Dict[str, Any]) -> date:
@@ -116,124 +245,879 @@ def parse_supplier(payload: Dict[str, Any]) -> Optional[str]:
             return str(payload[key])
     return None
 
-async def create_due_soon_notification(sess: Session, inv: Invoice, days_left: int):
+def content_hash(contents: bytes) -> str:
+    return hashlib.sha256(contents).hexdigest()
+
+@dataclasses.dataclass
+class SpooledUpload:
+    """
+    An upload read once, with its sha256 computed on the way: kept in memory up
+    to UPLOAD_SPOOL_MAX_BYTES (data), copied to INCOMING_DIR above it (path).
+    """
+    filename: str
+    digest: str
+    size: int
+    data: Optional[bytes] = None
+    path: Optional[Path] = None
+
+    @property
+    def source(self) -> Union[bytes, Path]:
+        """What parse_invoice / content_store.put take: the bytes or the spooled file."""
+        return self.data if self.data is not None else self.path
+
+    def discard(self):
+        # the content store keeps its own compressed copy
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+
+def _too_large(filename: Optional[str], limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"{filename or 'upload'} exceeds {limit} bytes")
+
+def _spool_upload(src, filename: Optional[str]) -> SpooledUpload:
+    """
+    Blocking: chunked read of the upload, hashing as it goes. Up to
+    UPLOAD_SPOOL_MAX_BYTES it stays in memory (as the multipart parser kept
+    it); past that the chunks go to a temp file (flat memory).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    chunks: List[bytes] = []
+    out = tmp = None
+    try:
+        src.seek(0)
+        for chunk in iter(lambda: src.read(UPLOAD_CHUNK), b""):
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise _too_large(filename, MAX_UPLOAD_BYTES)
+            digest.update(chunk)
+            if out is None and size > UPLOAD_SPOOL_MAX_BYTES:
+                fd, tmp = tempfile.mkstemp(dir=INCOMING_DIR, suffix=".xml")
+                out = os.fdopen(fd, "wb")
+                out.writelines(chunks)
+                chunks = []
+            if out is not None:
+                out.write(chunk)
+            else:
+                chunks.append(chunk)
+        if out is not None:
+            out.close()
+    except BaseException:
+        if out is not None:
+            out.close()
+            os.unlink(tmp)
+        raise
+    if tmp is not None:
+        return SpooledUpload(filename or "invoice.xml", digest.hexdigest(), size, path=Path(tmp))
+    return SpooledUpload(filename or "invoice.xml", digest.hexdigest(), size, data=b"".join(chunks))
+
+async def spool_upload(file: UploadFile) -> SpooledUpload:
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _too_large(file.filename, MAX_UPLOAD_BYTES)
+    if file.size is not None and file.size <= UPLOAD_SPOOL_MAX_BYTES:
+        # still in the parser's memory buffer: no thread hop, no disk
+        await file.seek(0)
+        data = await file.read()
+        return SpooledUpload(file.filename or "invoice.xml", content_hash(data), len(data), data=data)
+    return await pools.run_db(_spool_upload, file.file, file.filename)
+
+@asynccontextmanager
+async def spooled(file: UploadFile):
+    """async with spooled(file) as upload: ... -> the temp copy (if any) is removed afterwards."""
+    upload = await spool_upload(file)
+    try:
+        yield upload
+    finally:
+        upload.discard()
+
+class UploadParser(MultiPartParser):
+    # files up to UPLOAD_SPOOL_MAX_BYTES stay in memory, larger ones go to a temp file
+    spool_max_size = UPLOAD_SPOOL_MAX_BYTES
+
+async def read_upload_form(request: Request, limit: int):
+    """
+    Parses a multipart body with UploadParser before the endpoint runs (request.form()
+    then returns it): 413 without reading a byte when Content-Length is over `limit`,
+    or as soon as the bytes received pass it (chunked bodies).
+    """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise _too_large("request", limit)
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        return  # left to FastAPI's own validation
+
+    async def limited():
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > limit:
+                raise _too_large("request", limit)
+            yield chunk
+
+    try:
+        # the parser closes the files it opened when reading fails
+        request._form = await UploadParser(request.headers, limited()).parse()
+    except MultiPartException as exc:
+        raise HTTPException(status_code=400, detail=exc.message)
+
+class UploadRoute(APIRoute):
+    """Route of a single-file upload endpoint: body limited to MAX_UPLOAD_BYTES (plus multipart framing)."""
+    max_body_bytes = MAX_UPLOAD_BYTES
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        limit = self.max_body_bytes + MULTIPART_OVERHEAD_BYTES
+
+        async def upload_handler(request: Request) -> Response:
+            await read_upload_form(request, limit)
+            return await handler(request)
+        return upload_handler
+
+class BatchUploadRoute(UploadRoute):
+    """Route of a multi-file upload endpoint: body limited to MAX_BATCH_BYTES."""
+    max_body_bytes = MAX_BATCH_BYTES
+
+# upload endpoints are declared on these, included in the app at the end of the module
+upload_router = APIRouter(route_class=UploadRoute)
+batch_upload_router = APIRouter(route_class=BatchUploadRoute)
+
+def invoice_summary(inv: Invoice) -> Dict[str, Any]:
+    return {
+        "id": inv.id,
+        "filename": inv.filename,
+        "due_date": inv.due_date.isoformat(),
+        "supplier": inv.supplier,
+        "supplier_id": inv.supplier_id,
+        "days_left": (inv.due_date - datetime.now(TZ).date()).days
+    }
+
+def find_invoices(digests: List[str]) -> Dict[str, Invoice]:
+    """Already stored invoices by content hash (indexed lookup, no parsing)."""
+    with Session(engine) as sess:
+        rows = sess.exec(select(Invoice).where(Invoice.content_hash.in_(digests))).all()
+        return {inv.content_hash: inv for inv in rows}
+
+async def parse_invoice(source: Union[bytes, Path], filename: Optional[str], digest: Optional[str] = None) -> FatturaInfo:
+    """
+    Every field of the invoice: from the parse cache when this exact file was
+    analysed before (no XML parsing at all), otherwise parsed in the parse pool
+    and cached for next time. `source` is the content or the path of a spooled
+    upload / stored file (the parse worker then streams it from disk).
+    """
+    digest = digest or content_hash(source)
+    info = parse_cache.get_memory(digest)
+    if info is None:
+        info = await pools.run_db(parse_cache.get, digest)
+    if info is None:
+        info = await pools.run_parse(extract_file, str(source)) if isinstance(source, Path) \
+            else await pools.run_parse(extract_fattura, source)
+        await pools.run_db(parse_cache.put, digest, info)
+    return dataclasses.replace(info, file=filename or "invoice.xml")
+
+def guess_amounts(sources: List[Union[bytes, Path]]) -> List[float]:
+    """
+    Total amounts of invoices whose XML has none, asked to the model in one
+    batch (same contents asked once, cached, OLLAMA_CONCURRENCY at a time);
+    0.0 where it has no answer. Blocking: run it on the model pool.
+    """
+    # imported on first use: most invoices carry their amount, the model client is rarely needed
+    from utils.ollama_utils import deduci_importi_ai
+    contents = []
+    for source in sources:
+        if isinstance(source, Path):
+            with open_stored(source) as f:
+                source = f.read()
+        contents.append(source)
+    return deduci_importi_ai(contents)
+
+async def amount_payload(info: FatturaInfo, source: Union[bytes, Path]) -> Dict[str, Any]:
+    """importo_payload, asking the model (cached per content) when the XML has no amount."""
+    amount = importo_payload(info)
+    if amount["importo"] is None:
+        guess, = await pools.run_model(guess_amounts, [source])
+        if guess:
+            amount.update(importo=guess, fonte_importo="ai")
+    return amount
+
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque keyset cursor: position of the last row returned."""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def build_due_soon_notification(inv: Invoice, days_left: int) -> Notification:
     msg = f"Fattura '{inv.filename}' in scadenza il {inv.due_date} (tra {days_left} giorni)."
-    n = Notification(
+    inv.notified_5d = True
+    return Notification(
         kind="due_soon",
         message=msg,
         invoice_id=inv.id,
         due_date=inv.due_date,
         days_left=days_left,
     )
+
+def notification_payload(n: Notification) -> Dict[str, Any]:
+    """WS message for a stored notification."""
+    return {"type": n.kind, "notification": {
+        "id": n.id, "message": n.message, "invoice_id": n.invoice_id,
+        "due_date": str(n.due_date), "days_left": n.days_left, "created_at": n.created_at.isoformat()
+    }}
+
+def add_due_soon_notification(sess: Session, inv: Invoice, days_left: int) -> Dict[str, Any]:
+    """Stores the due_soon notification (blocking) and returns the WS payload to broadcast."""
+    n = build_due_soon_notification(inv, days_left)
     sess.add(n)
-    inv.notified_5d = True
     sess.commit()
     sess.refresh(n)
-    await ws_manager.broadcast({"type": "due_soon", "notification": {
-        "id": n.id, "message": n.message, "invoice_id": inv.id,
-        "due_date": str(inv.due_date), "days_left": days_left, "created_at": n.created_at.isoformat()
-    }})
+    return notification_payload(n)
 
-# ---------- NEW: scheduler ----------
-scheduler = AsyncIOScheduler(timezone="Europe/Amsterdam")
+STAT_PERIODS = ("day", "week", "month")
+# what bump_invoice_stats reads from an invoice, for rows that are not Invoice objects
+StatRow = collections.namedtuple("StatRow", "due_date supplier_id paid amount")
+
+def stat_buckets(due_date: date, supplier_id: Optional[int]) -> List[tuple]:
+    """InvoiceStat (dimension, bucket) rows an invoice counts towards (supplier: its id, "" if unknown)."""
+    return [
+        ("day", due_date.isoformat()),
+        ("week", (due_date - timedelta(days=due_date.weekday())).isoformat()),
+        ("month", due_date.replace(day=1).isoformat()),
+        ("supplier", "" if supplier_id is None else str(supplier_id)),
+    ]
+
+def bump_invoice_stats(sess: Session, invoices, sign: int = 1):
+    """
+    Adds (sign=1) or removes (sign=-1) invoices from the aggregates with one
+    upsert, inside the caller's transaction. Cost is O(buckets touched).
+    """
+    deltas: Dict[tuple, list] = {}
+    for inv in invoices:
+        for dimension, bucket in stat_buckets(inv.due_date, inv.supplier_id):
+            d = deltas.setdefault((dimension, bucket, bool(inv.paid)), [0, 0.0])
+            d[0] += sign
+            d[1] += sign * (inv.amount or 0.0)
+    if not deltas:
+        return
+    stmt = sqlite_insert(InvoiceStat)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["dimension", "bucket", "paid"],
+        set_={"count": InvoiceStat.count + stmt.excluded.count, "amount": InvoiceStat.amount + stmt.excluded.amount},
+    )
+    sess.execute(stmt, [
+        {"dimension": dimension, "bucket": bucket, "paid": paid, "count": count, "amount": amount}
+        for (dimension, bucket, paid), (count, amount) in deltas.items()
+    ])
+
+@contextmanager
+def stored_files_guard():
+    """
+    Wraps a transaction that content_store.put()s its files before committing:
+    if it fails, the files stay in the store unreferenced, so the store GC is
+    told to look for them.
+    """
+    try:
+        yield
+    except BaseException:
+        content_store.note_orphans()
+        raise
+
+def _store_invoice(inv: Invoice, supplier: Optional[SupplierRef] = None):
+    """
+    Blocking part of an upload, run on the DB thread pool: if no invoice with the
+    same content hash / SdI id exists, insert the invoice (linked to its
+    supplier, registered if new) and its due_soon notification (0..5 days).
+    Returns (invoice dict, WS payload or None, duplicate).
+    """
+    keys = []
+    if inv.content_hash:
+        keys.append(Invoice.content_hash == inv.content_hash)
+    if inv.id_sdi:
+        keys.append(Invoice.id_sdi == inv.id_sdi)
+    dup = select(Invoice).where(or_(*keys)) if keys else None
 
-async def scan_due_soon_job():
-    today = datetime.now(TZ).date()
     with Session(engine) as sess:
-        # 5 giorni
-        target_5 = today + timedelta(days=5)
-        q5 = select(Invoice).where(
-            Invoice.due_date == target_5,
-            Invoice.paid == False,
-            Invoice.notified_5d == False
-        )
-        for inv in sess.exec(q5).all():
-            await create_due_soon_notification(sess, inv, 5)
+        existing = sess.exec(dup).first() if dup is not None else None
+        if existing is None:
+            if supplier is not None:
+                inv.supplier_id = supplier_registry.resolve(sess, [supplier])[supplier.tax_id]
+            sess.add(inv)
+            try:
+                sess.flush()  # assigns inv.id
+                bump_invoice_stats(sess, [inv])
+                add_due_events(sess, [inv])
+                sess.commit()
+            except IntegrityError:
+                # same file stored concurrently by another request
+                sess.rollback()
+                if dup is None:
+                    raise
+                existing = sess.exec(dup).first()
+        if existing is not None:
+            return invoice_summary(existing), None, True
 
-        # OGGI in scadenza (days_left=0) → notifica dedicata
-        q_today = select(Invoice).where(
-            Invoice.due_date == today,
-            Invoice.paid == False
+        sess.refresh(inv)
+        summary = invoice_summary(inv)
+        ws_payload = None
+        if 0 <= summary["days_left"] <= 5 and not inv.paid and not inv.notified_5d:
+            ws_payload = add_due_soon_notification(sess, inv, summary["days_left"])
+
+        return summary, ws_payload, False
+
+async def store_due_invoice(
+    tool_result: Dict[str, Any],
+    filename: str,
+    supplier: Optional[str] = None,
+    digest: Optional[str] = None,
+    id_sdi: Optional[str] = None,
+    amount: Optional[float] = None,
+    supplier_ref: Optional[SupplierRef] = None,
+) -> Dict[str, Any]:
+    """
+    Persist the invoice described by a check_date payload and notify if due soon.
+    Returns the 'data_scadenza_iso' + 'backend' block shared by the upload endpoints.
+    If 'data_scadenza' = "Da verificare" or unparseable, we do NOT store an invoice.
+    If the same file (or SdI id) was already stored, the existing invoice is returned
+    with backend.duplicate = true.
+    """
+    stored_invoice = None
+    notification_sent = False
+    duplicate = False
+    due_iso = None
+    note = None
+
+    try:
+        due = parse_due_date(tool_result)      # uses data_scadenza
+        due_iso = due.isoformat()
+
+        inv = Invoice(
+            filename=filename, due_date=due, supplier=supplier, content_hash=digest, id_sdi=id_sdi, amount=amount,
         )
-        for inv in sess.exec(q_today).all():
-            n = Notification(
-                kind="due_today",
-                message=f"Fattura '{inv.filename}' **in scadenza oggi** ({inv.due_date}).",
-                invoice_id=inv.id,
-                due_date=inv.due_date,
-                days_left=0,
+        with span("db_commit"):
+            stored_invoice, ws_payload, duplicate = await pools.run_db(_store_invoice, inv, supplier_ref)
+
+        # Immediate notify if 0..5 days (inclusive)
+        if ws_payload:
+            with span("broadcast"):
+                await bus.publish(ws_payload)
+            notification_sent = True
+
+    except PoolBusy:
+        raise
+    except Exception as e:
+        # Keep front payload intact; just annotate backend info
+        note = f"Due date not stored: {e}"
+
+    return {
+        "data_scadenza_iso": due_iso,
+        "backend": {
+            "stored_invoice": stored_invoice,
+            "notification_sent": notification_sent,
+            "duplicate": duplicate,
+            **({"note": note} if note else {})
+        }
+    }
+
+def store_receipts(items: List[tuple], today: date):
+    """
+    Batch variant of _store_invoice (blocking: the DB thread pool, or a CLI
+    such as ingest.py): stores every new file, inserts all invoices and their
+    due_soon notifications in ONE transaction. Invoices whose SdI id is
+    already known are not inserted again.
+    items = [(filename, contents or spooled Path, due, digest, id_sdi, amount, supplier, SupplierRef or None)];
+    returns ([row per item, same order], [WS payload]): the caller publishes
+    the payloads on the bus, as {"type": "batch", "notifications": [...]}.
+    """
+    with Session(engine, expire_on_commit=False) as sess, stored_files_guard():
+        sdi_ids = {item[4] for item in items if item[4]}
+        by_sdi = {}
+        if sdi_ids:
+            by_sdi = {inv.id_sdi: inv for inv in sess.exec(select(Invoice).where(Invoice.id_sdi.in_(sdi_ids))).all()}
+        refs = [item[7] for item in items if item[7] is not None and item[4] not in by_sdi]
+        supplier_ids = supplier_registry.resolve(sess, refs) if refs else {}
+
+        invoices = []
+        stored = []  # (filename, invoice, duplicate)
+        for filename, contents, due, digest, id_sdi, amount, supplier, ref in items:
+            existing = by_sdi.get(id_sdi) if id_sdi else None
+            if existing is not None:
+                stored.append((filename, existing, True))
+                continue
+            inv = Invoice(
+                filename=filename,
+                due_date=due,
+                supplier=supplier,
+                supplier_id=supplier_ids.get(ref.tax_id) if ref is not None else None,
+                source="receipt_upload",
+                file_path=content_store.put(contents, digest),
+                content_hash=digest,
+                id_sdi=id_sdi,
+                amount=amount,
             )
-            sess.add(n)
-            sess.commit()
-            sess.refresh(n)
-            await ws_manager.broadcast({"type": "due_today", "notification": {
-                "id": n.id, "message": n.message, "invoice_id": inv.id,
-                "due_date": str(inv.due_date), "days_left": 0, "created_at": n.created_at.isoformat()
-            }})
+            if id_sdi:
+                by_sdi[id_sdi] = inv
+            invoices.append(inv)
+            stored.append((filename, inv, False))
+        sess.add_all(invoices)
+        sess.flush()  # assigns ids (bulk INSERT ... RETURNING)
+        bump_invoice_stats(sess, invoices)
+
+        notifications = []
+        for inv in invoices:
+            days_left = (inv.due_date - today).days
+            if 0 <= days_left <= 5:
+                notifications.append(build_due_soon_notification(inv, days_left))
+        add_due_events(sess, invoices)
+        sess.add_all(notifications)
+        sess.flush()
+        sess.commit()
+
+        notified = {n.invoice_id for n in notifications}
+        rows = [{
+            "file": filename,
+            "status": "ok",
+            "invoice_id": inv.id,
+            "due_date": inv.due_date.isoformat(),
+            "days_left": (inv.due_date - today).days,
+            "notification_sent": not duplicate and inv.id in notified,
+            "duplicate": duplicate,
+        } for filename, inv, duplicate in stored]
+        return rows, [notification_payload(n) for n in notifications]
+
+# ---------- NEW: due-date events ----------
+# Local wall-clock hour at which due-date events fire
+DUE_EVENT_HOUR = int(os.getenv("DUE_EVENT_HOUR", 9))
+# Longest sleep of the firing loop: bounds the delay for events registered by other workers
+DUE_EVENT_POLL_S = float(os.getenv("DUE_EVENT_POLL_S", 60))
+
+# with several workers only the lease holder fires the events
+scheduler_lease = LeaderLease("scheduler")
+
+def _slot(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, DUE_EVENT_HOUR, tzinfo=TZ)
+
+def due_event_times(due_date: date, notified_5d: bool, now: datetime) -> List[tuple]:
+    """(kind, fire_at) still ahead for an unpaid invoice, at DUE_EVENT_HOUR of the day."""
+    today = now.astimezone(TZ).date()
+    next_slot = _slot(today) if now < _slot(today) else _slot(today + timedelta(days=1))
+    events = []
+    # within 5 days the upload itself sends the due_soon notification
+    if not notified_5d and (due_date - today).days > 5:
+        events.append(("due_soon", _slot(due_date - timedelta(days=5))))
+    if _slot(due_date) >= next_slot:
+        events.append(("due_today", _slot(due_date)))
+    # overdue repeats every day until paid: _fire_due_events moves it to the next day
+    events.append(("overdue", max(_slot(due_date + timedelta(days=1)), next_slot)))
+    return events
 
+# what add_due_events reads from an invoice, for rows that are not Invoice objects
+DueRow = collections.namedtuple("DueRow", "id due_date paid notified_5d")
+
+def add_due_events(sess: Session, invoices, now: Optional[datetime] = None) -> int:
+    """Registers the events of stored (flushed) invoices, inside the caller's transaction."""
+    now = now or datetime.now(TZ)
+    rows = [
+        {"invoice_id": inv.id, "kind": kind, "fire_at": fire_at}
+        for inv in invoices if not inv.paid
+        for kind, fire_at in due_event_times(inv.due_date, inv.notified_5d, now)
+    ]
+    if rows:
+        sess.execute(sqlite_insert(DueEvent).on_conflict_do_nothing(), rows)
+    return len(rows)
+
+def rebuild_due_events() -> int:
+    """
+    Run by the leader before firing: drops the events of paid invoices and
+    registers those of unpaid invoices that have none (stored before the
+    events existed). Invoices that have events are not touched.
+    """
+    with Session(engine) as sess:
+        sess.execute(delete(DueEvent).where(
+            DueEvent.invoice_id.in_(select(Invoice.id).where(Invoice.paid == True))
+        ))
+        missing = sess.exec(
+            select(Invoice.id, Invoice.due_date, Invoice.paid, Invoice.notified_5d)
+            .where(Invoice.paid == False, ~exists().where(DueEvent.invoice_id == Invoice.id))
+        ).all()
+        added = add_due_events(sess, missing)
+        sess.commit()
+        return added
+
+def _event_rules(today: date):
+    """
+    (kind, condition, message SQL expr, days_left SQL expr) for each event kind.
+    The condition drops one-shot events that fire late (e.g. after downtime)
+    once their day is over.
+    """
+    fattura = literal("Fattura '") + Invoice.filename
+    due_str = cast(Invoice.due_date, String)
+    days_left = cast(func.julianday(Invoice.due_date) - func.julianday(literal(today, Date)), Integer)
+    return [
+        # 5 giorni (days_left reale se l'evento parte in ritardo)
+        ("due_soon",
+         Invoice.due_date > today,
+         fattura + literal("' in scadenza il ") + due_str + literal(" (tra ") + cast(days_left, String) + literal(" giorni)."),
+         days_left),
+        # OGGI in scadenza (days_left=0) → notifica dedicata
+        ("due_today",
+         Invoice.due_date == today,
+         fattura + literal("' **in scadenza oggi** (") + due_str + literal(")."),
+         days_left),
         # SCADUTE (days_left<0) → notifica “overdue” (solo una volta al giorno)
-        q_over = select(Invoice).where(
-            Invoice.due_date < today,
-            Invoice.paid == False
-        )
-        for inv in sess.exec(q_over).all():
-            n = Notification(
-                kind="overdue",
-                message=f"Fattura '{inv.filename}' **scaduta** il {inv.due_date}.",
-                invoice_id=inv.id,
-                due_date=inv.due_date,
-                days_left=(inv.due_date - today).days,
+        ("overdue",
+         Invoice.due_date < today,
+         fattura + literal("' **scaduta** il ") + due_str + literal("."),
+         days_left),
+    ]
+
+def _fire_due_events(now: datetime):
+    """
+    Fires every DueEvent with fire_at <= now, on the DB thread pool, in one
+    transaction: per kind one INSERT ... SELECT into notification and one into
+    the ledger (which keeps re-runs idempotent; rows of past days are dropped,
+    only today's are checked). One-shot events are deleted, overdue ones move
+    to the next day. Work is proportional to the events due,
+    not to the invoice table.
+    Returns (WS payloads of the notifications created, next fire_at or None).
+    """
+    today = now.astimezone(TZ).date()
+    due = DueEvent.fire_at <= now
+    created = []
+    with Session(engine) as sess:
+        for kind, cond, message, days_left in _event_rules(today):
+            todo = and_(
+                DueEvent.kind == kind,
+                due,
+                Invoice.paid == False,
+                cond,
+                ~exists().where(
+                    NotificationLedger.invoice_id == Invoice.id,
+                    NotificationLedger.kind == kind,
+                    NotificationLedger.day == today,
+                ),
             )
-            sess.add(n)
-            sess.commit()
-            sess.refresh(n)
-            await ws_manager.broadcast({"type": "overdue", "notification": {
-                "id": n.id, "message": n.message, "invoice_id": inv.id,
-                "due_date": str(inv.due_date), "days_left": (inv.due_date - today).days,
-                "created_at": n.created_at.isoformat()
-            }})
-
-def ensure_schema():
-     with engine.connect() as conn:
-        cols = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info('invoice')").fetchall()]
-        if "source" not in cols:
-            conn.exec_driver_sql("ALTER TABLE invoice ADD COLUMN source VARCHAR NOT NULL DEFAULT 'invoice_xml';")
-        if "file_path" not in cols:
-            conn.exec_driver_sql("ALTER TABLE invoice ADD COLUMN file_path VARCHAR;")
+            rows = sess.execute(
+                insert(Notification).from_select(
+                    ["kind", "message", "invoice_id", "due_date", "days_left", "read", "created_at"],
+                    select(literal(kind), message, Invoice.id, Invoice.due_date, days_left,
+                           literal(False), literal(datetime.now(TZ), Notification.__table__.c.created_at.type))
+                    .select_from(DueEvent).join(Invoice, Invoice.id == DueEvent.invoice_id).where(todo),
+                ).returning(Notification.id, Notification.kind, Notification.message, Notification.invoice_id,
+                            Notification.due_date, Notification.days_left, Notification.created_at)
+            ).all()
+            sess.execute(
+                insert(NotificationLedger).prefix_with("OR IGNORE").from_select(
+                    ["invoice_id", "kind", "day"],
+                    select(Invoice.id, literal(kind), literal(today, Date))
+                    .select_from(DueEvent).join(Invoice, Invoice.id == DueEvent.invoice_id).where(todo),
+                )
+            )
+            if kind == "due_soon":
+                sess.execute(update(Invoice).where(
+                    Invoice.id.in_(select(DueEvent.invoice_id).where(DueEvent.kind == kind, due))
+                ).values(notified_5d=True))
+            created.extend(rows)
+        sess.execute(delete(NotificationLedger).where(NotificationLedger.day < today))
+        sess.execute(delete(DueEvent).where(due, DueEvent.kind != "overdue"))
+        sess.execute(update(DueEvent).where(due, DueEvent.kind == "overdue").values(fire_at=_slot(today + timedelta(days=1))))
+        next_at = sess.exec(select(func.min(DueEvent.fire_at))).one()
+        sess.commit()
+
+    payloads = [{"type": r.kind, "notification": {
+        "id": r.id, "message": r.message, "invoice_id": r.invoice_id,
+        "due_date": str(r.due_date), "days_left": r.days_left, "created_at": r.created_at.isoformat()
+    }} for r in created]
+    return payloads, next_at
+
+async def fire_due_events_job(now: Optional[datetime] = None) -> Optional[datetime]:
+    """Fires the events due at `now` (default: now); returns the next fire_at."""
+    with job_seconds.time(job="due_events"):
+        payloads, next_at = await pools.run_db(_fire_due_events, now or datetime.now(TZ))
+        # one WS message per run instead of one per notification
+        if payloads:
+            await bus.publish({"type": "batch", "notifications": payloads})
+    job_rows.inc(len(payloads), job="due_events")
+    return next_at
+
+async def due_event_loop():
+    """
+    Priority queue persisted in SQLite (DueEvent, indexed on fire_at): rebuilds
+    the missing events (and queues the file / extraction backfills if needed), then fires what is due and sleeps until the earliest
+    pending event, waking at least every DUE_EVENT_POLL_S (and queuing the store GC when a failed write was noted).
+    """
+    rebuilt = False
+    while True:
+        next_at = None
+        try:
+            if not rebuilt:
+                await pools.run_db(rebuild_due_events)
+                # files saved before the content store, rows left behind by an
+                # extractor upgrade: both handled in the background
+                if await pools.run_db(enqueue_once, "store_files", count_legacy_files):
+                    job_wakeup.set()
+                if await pools.run_db(enqueue_backfill):
+                    job_wakeup.set()
+                rebuilt = True
+            if store_gc_pending() and await pools.run_db(enqueue_store_gc):
+                job_wakeup.set()
+            next_at = await fire_due_events_job()
+        except Exception as e:
+            print(f"⚠️  Due-date events: {e}")
+        wait = DUE_EVENT_POLL_S
+        if next_at is not None:
+            wait = min(max((next_at - datetime.now(TZ)).total_seconds(), 0.0), DUE_EVENT_POLL_S)
+        await asyncio.sleep(wait)
+
+async def scheduler_leader_loop():
+    """Runs the due-event loop while this process holds the lease, stops it otherwise."""
+    task = None
+    try:
+        while True:
+            try:
+                leading = await asyncio.to_thread(scheduler_lease.try_acquire)
+            except Exception:
+                leading = False
+            if leading and task is None:
+                task = asyncio.create_task(due_event_loop())
+            elif not leading and task is not None:
+                task.cancel()
+                task = None
+            await asyncio.sleep(scheduler_lease.ttl / 3)
+    finally:
+        if task is not None:
+            task.cancel()
+
+def ensure_schema(conn):
+    # DBs created before these columns existed (probed once, by the baseline migration)
+    cols = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info('invoice')").fetchall()]
+    if not cols:
+        return  # fresh DB: the baseline DDL builds the full table
+    if "source" not in cols:
+        conn.exec_driver_sql("ALTER TABLE invoice ADD COLUMN source VARCHAR NOT NULL DEFAULT 'invoice_xml';")
+    if "file_path" not in cols:
+        conn.exec_driver_sql("ALTER TABLE invoice ADD COLUMN file_path VARCHAR;")
+    if "content_hash" not in cols:
+        conn.exec_driver_sql("ALTER TABLE invoice ADD COLUMN content_hash VARCHAR;")
+    if "id_sdi" not in cols:
+        conn.exec_driver_sql("ALTER TABLE invoice ADD COLUMN id_sdi VARCHAR;")
+    if "amount" not in cols:
+        conn.exec_driver_sql("ALTER TABLE invoice ADD COLUMN amount FLOAT;")
+
+def ensure_invoice_stats(conn):
+    # one-off backfill of the aggregates for invoices stored before they existed
+    # (reads baseline columns only)
+    with Session(bind=conn) as sess:
+        if sess.exec(select(InvoiceStat.dimension).limit(1)).first() is not None:
+            return
+        rows = sess.exec(select(Invoice.due_date, Invoice.paid, Invoice.amount)).all()
+        if rows:
+            # no supplier ids yet: all in the "" bucket until the suppliers step regroups them
+            bump_invoice_stats(sess, [StatRow(r.due_date, None, r.paid, r.amount) for r in rows])
+            sess.flush()
+
+# Schema as of the first versioned release, frozen as DDL: what the models said
+# then, not what they say now (later columns and tables come from later steps).
+# IF NOT EXISTS: DBs from before versioning already have some of it.
+_BASELINE_DDL = (
+    """CREATE TABLE IF NOT EXISTS invoice (
+    id INTEGER NOT NULL,
+    filename VARCHAR NOT NULL,
+    due_date DATE NOT NULL,
+    supplier VARCHAR,
+    paid BOOLEAN NOT NULL,
+    notified_5d BOOLEAN NOT NULL,
+    created_at DATETIME NOT NULL,
+    source VARCHAR NOT NULL,
+    file_path VARCHAR,
+    content_hash VARCHAR,
+    id_sdi VARCHAR,
+    amount FLOAT,
+    PRIMARY KEY (id)
+)""",
+    """CREATE TABLE IF NOT EXISTS invoicestat (
+    dimension VARCHAR NOT NULL,
+    bucket VARCHAR NOT NULL,
+    paid BOOLEAN NOT NULL,
+    count INTEGER NOT NULL,
+    amount FLOAT NOT NULL,
+    PRIMARY KEY (dimension, bucket, paid)
+)""",
+    """CREATE TABLE IF NOT EXISTS notification (
+    id INTEGER NOT NULL,
+    kind VARCHAR NOT NULL,
+    message VARCHAR NOT NULL,
+    invoice_id INTEGER,
+    due_date DATE,
+    days_left INTEGER,
+    read BOOLEAN NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id)
+)""",
+    """CREATE TABLE IF NOT EXISTS notificationledger (
+    invoice_id INTEGER NOT NULL,
+    kind VARCHAR NOT NULL,
+    day DATE NOT NULL,
+    PRIMARY KEY (invoice_id, kind, day)
+)""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_invoice_content_hash ON invoice (content_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_invoice_id_sdi ON invoice (id_sdi)",
+    "CREATE INDEX IF NOT EXISTS ix_invoice_paid_due_date ON invoice (paid, due_date)",
+    "CREATE INDEX IF NOT EXISTS ix_invoice_source_created_at ON invoice (source, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_notification_created_at ON notification (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_notification_read_created_at ON notification (read, created_at)",
+)
+
+def _migrate_baseline(conn):
+    # whatever state the DB was left in before versioning
+    ensure_schema(conn)
+    for ddl in _BASELINE_DDL:
+        conn.exec_driver_sql(ddl)
+    ensure_invoice_stats(conn)
+
+# Append only: a schema change is a new (version, name, step), never an edit of a
+# released one, and steps spell out their DDL instead of reading it from the models.
+# Steps run in migrate()'s transaction, on the connection they get.
+def _migrate_due_events(conn):
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS dueevent ("
+        " invoice_id INTEGER NOT NULL, kind VARCHAR NOT NULL, fire_at DATETIME NOT NULL,"
+        " PRIMARY KEY (invoice_id, kind))"
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_dueevent_fire_at ON dueevent (fire_at)")
+
+def _migrate_extractor_version(conn):
+    # NULL on existing rows: extracted by an unknown version, the backfill re-reads them
+    cols = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info('invoice')").fetchall()]
+    if "extractor_version" not in cols:
+        conn.exec_driver_sql("ALTER TABLE invoice ADD COLUMN extractor_version INTEGER;")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_invoice_extractor_version ON invoice (extractor_version);")
+
+def _migrate_suppliers(conn):
+    # invoices already stored get their supplier_id from the re-extraction backfill
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS supplier ("
+        " id INTEGER NOT NULL, tax_id VARCHAR NOT NULL, name VARCHAR, PRIMARY KEY (id))"
+    )
+    conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_supplier_tax_id ON supplier (tax_id)")
+    cols = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info('invoice')").fetchall()]
+    if "supplier_id" not in cols:
+        conn.exec_driver_sql("ALTER TABLE invoice ADD COLUMN supplier_id INTEGER REFERENCES supplier (id);")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_invoice_supplier_id_created_at ON invoice (supplier_id, created_at);"
+    )
+
+def _migrate_supplier_stats(conn):
+    # the supplier aggregates were keyed by the name read from each invoice:
+    # regrouped by supplier_id ("" until the backfill links the invoice)
+    conn.exec_driver_sql("DELETE FROM invoicestat WHERE dimension = 'supplier'")
+    conn.exec_driver_sql(
+        "INSERT INTO invoicestat (dimension, bucket, paid, count, amount)"
+        " SELECT 'supplier', COALESCE(CAST(supplier_id AS VARCHAR), ''), paid, COUNT(*), COALESCE(SUM(amount), 0.0)"
+        " FROM invoice GROUP BY supplier_id, paid"
+    )
+
+MIGRATIONS: List[Migration] = [
+    (1, "baseline", _migrate_baseline),
+    (2, "due_events", _migrate_due_events),
+    (3, "extractor_version", _migrate_extractor_version),
+    (4, "suppliers", _migrate_suppliers),
+    (5, "supplier_stats", _migrate_supplier_stats),
+]
+
+def migrate_db() -> List[Dict[str, Any]]:
+    """Latest schema version; costs one SELECT when the DB is already there."""
+    return migrate(engine, MIGRATIONS)
+
+def prepare_storage():
+    FILES_DIR.mkdir(parents=True, exist_ok=True)
+    INCOMING_DIR.mkdir(exist_ok=True)
+    JOBS_DIR.mkdir(exist_ok=True)
+    # spooled uploads left behind by a crashed run (other workers' are recent)
+    for leftover in INCOMING_DIR.glob("*.xml"):
+        if time.time() - leftover.stat().st_mtime > 3600:
+            leftover.unlink(missing_ok=True)
+    content_store.sweep()
+
+# import + per-phase startup times of this worker, served by /health/startup
+startup_report: Dict[str, Any] = {"import_ms": None, "phases_ms": {}, "migrations": []}
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # STARTUP
-    ensure_schema()
-    SQLModel.metadata.create_all(engine)
-    scheduler.add_job(scan_due_soon_job, "cron", hour=9, minute=0, id="scan_due_soon", replace_existing=True)
-    scheduler.start()
+    phases = startup_report["phases_ms"]
+    mark = time.perf_counter()
+
+    def done(phase: str):
+        nonlocal mark
+        now = time.perf_counter()
+        phases[phase] = round((now - mark) * 1000, 1)
+        mark = now
+
+    prepare_storage()
+    done("storage")
+    startup_report["migrations"] = migrate_db()
+    done("migrations")
+    leader_task = asyncio.create_task(scheduler_leader_loop())
+    done("scheduler")
+    await bus.start()
+    done("bus")
+    job_tasks = start_job_workers(JOB_WORKERS)
+    print("🚀 Startup: " + ", ".join(
+        [f"import {startup_report['import_ms']} ms"] + [f"{k} {v} ms" for k, v in phases.items()]
+    ) + "".join(f"\n   migration {m['version']} ({m['name']}) {m['ms']} ms" for m in startup_report["migrations"]))
     try:
         yield
     finally:
         # SHUTDOWN
-        scheduler.shutdown(wait=False)
+        for task in job_tasks:
+            task.cancel()
+        leader_task.cancel()
+        await bus.stop()
+        await asyncio.to_thread(scheduler_lease.release)
+        pools.shutdown()
 
 app = FastAPI(title="Finance Dashboard API", lifespan=lifespan)
+app.add_middleware(TimingMiddleware)
+
+@app.exception_handler(PoolBusy)
+async def pool_busy_handler(request, exc: PoolBusy):
+    # Backpressure: tell the client to retry instead of queueing without bound
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
 # ---------- NEW: WebSocket endpoint ----------
 @app.websocket("/ws/notifications")
 async def ws_notifications(ws: WebSocket):
     await ws_manager.connect(ws)
     try:
         while True:
-            # We don't expect messages from client; keep alive by receiving
-            await ws.receive_text()
+            # Only client heartbeats are expected; anything else just keeps the socket alive
+            if await ws.receive_text() == "ping":
+                ws_manager.send_text(ws, PONG)
     except WebSocketDisconnect:
+        pass
+    finally:
         ws_manager.disconnect(ws)
 
 # ---------- NEW: notifications REST ----------
 @app.get("/notifications", tags=["Notifications"])
-def list_notifications(limit: int = 50, unread_only: bool = False):
-    with Session(engine) as sess:
-        q = select(Notification).order_by(Notification.created_at.desc())
-        notifs = sess.exec(q).all()
+def list_notifications(limit: int = 50, unread_only: bool = False, cursor: Optional[str] = None):
+    """
+    Newest first, keyset-paginated: pass back 'next_cursor' to get the next page
+    (null on the last one). Filters and LIMIT run in SQL on the (read, created_at) index.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    with Session(read_engine) as sess:
+        q = select(Notification)
         if unread_only:
-            notifs = [n for n in notifs if not n.read]
+            q = q.where(Notification.read == False)
+        if cursor:
+            q = q.where(tuple_(Notification.created_at, Notification.id) < tuple_(*decode_cursor(cursor)))
+        q = q.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit)
+        notifs = sess.exec(q).all()
         out = [{
             "id": n.id,
             "kind": n.kind,
@@ -243,8 +1127,9 @@ def list_notifications(limit: int = 50, unread_only: bool = False):
             "days_left": n.days_left,
             "read": n.read,
             "created_at": n.created_at.isoformat(),
-        } for n in notifs[:limit]]
-        return JSONResponse(content={"notifications": out})
+        } for n in notifs]
+        next_cursor = encode_cursor(notifs[-1].created_at, notifs[-1].id) if len(notifs) == limit else None
+        return JSONResponse(content={"notifications": out, "next_cursor": next_cursor})
 
 @app.post("/notifications/{notif_id}/read", tags=["Notifications"])
 def mark_notification_read(notif_id: int):
@@ -257,16 +1142,125 @@ def mark_notification_read(notif_id: int):
         sess.commit()
         return {"ok": True}
 
-@app.post("/invoices/{invoice_id}/paid", tags=["Fatture"])
-def mark_invoice_paid(invoice_id: int):
+def mark_invoices_paid(ids: List[int]) -> List[int]:
+    """
+    Blocking: flips paid on the unpaid invoices among `ids` with batched
+    UPDATE ... RETURNING, moves them from the unpaid to the paid aggregates and
+    drops their due-date events, all in one transaction. Returns the ids changed.
+    """
+    changed = []
     with Session(engine) as sess:
-        inv = sess.get(Invoice, invoice_id)
-        if not inv:
-            raise HTTPException(status_code=404, detail="Invoice not found")
-        inv.paid = True
-        sess.add(inv)
+        for i in range(0, len(ids), 500):
+            rows = sess.execute(
+                update(Invoice).where(Invoice.id.in_(ids[i:i + 500]), Invoice.paid == False).values(paid=True)
+                .returning(Invoice.id, Invoice.due_date, Invoice.supplier_id, Invoice.amount)
+            ).all()
+            if not rows:
+                continue
+            bump_invoice_stats(sess, [StatRow(r.due_date, r.supplier_id, False, r.amount) for r in rows], sign=-1)
+            bump_invoice_stats(sess, [StatRow(r.due_date, r.supplier_id, True, r.amount) for r in rows])
+            # nothing left to remind about
+            sess.execute(delete(DueEvent).where(DueEvent.invoice_id.in_([r.id for r in rows])))
+            changed += [r.id for r in rows]
         sess.commit()
-        return {"ok": True}
+    return changed
+
+@app.post("/invoices/{invoice_id}/paid", tags=["Fatture"])
+def mark_invoice_paid(invoice_id: int):
+    if not mark_invoices_paid([invoice_id]):
+        with Session(engine) as sess:
+            if sess.get(Invoice, invoice_id) is None:
+                raise HTTPException(status_code=404, detail="Invoice not found")
+    return {"ok": True}
+
+class PaidIds(BaseModel):
+    ids: List[int]
+
+@app.post("/invoices/paid", tags=["Fatture"])
+def mark_invoices_paid_bulk(body: PaidIds):
+    """
+    Bulk version of /invoices/{id}/paid: {"ids": [...]} -> {"updated": [ids changed], "count"}.
+    Unknown or already paid ids are skipped.
+    """
+    changed = mark_invoices_paid(sorted(set(body.ids)))
+    return {"updated": changed, "count": len(changed)}
+
+# ---------- NEW: analytics ----------
+def _stat_totals(rows) -> Dict[str, Any]:
+    out = {"paid": {"count": 0, "amount": 0.0}, "unpaid": {"count": 0, "amount": 0.0}}
+    for row in rows:
+        side = out["paid" if row.paid else "unpaid"]
+        side["count"] += row.count
+        side["amount"] += row.amount
+    for side in out.values():
+        side["amount"] = round(side["amount"], 2)
+    return out
+
+def _stat_sum(sess: Session, *conds) -> Dict[str, Any]:
+    count, amount = sess.exec(
+        select(func.coalesce(func.sum(InvoiceStat.count), 0), func.coalesce(func.sum(InvoiceStat.amount), 0.0))
+        .where(*conds)
+    ).one()
+    return {"count": count, "amount": round(amount, 2)}
+
+@app.get("/analytics", tags=["Analytics"])
+def analytics(period: str = "month", date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """
+    Dashboard totals read from the InvoiceStat aggregates (O(buckets), never a scan of invoice):
+      {
+        today, totals: {paid, unpaid},
+        overdue, due_this_week,                       # unpaid {count, amount}
+        buckets: [{bucket, paid, unpaid}],            # per period = day | week | month
+        suppliers: [{supplier_id, supplier, paid, unpaid}]  # most unpaid amount first
+      }
+    date_from / date_to limit the buckets by due date (bucket start).
+    Amounts only include invoices whose amount could be read.
+    """
+    if period not in STAT_PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(STAT_PERIODS)}")
+    today = datetime.now(TZ).date()
+    unpaid_day = (InvoiceStat.dimension == "day", InvoiceStat.paid == False)
+
+    with Session(read_engine) as sess:
+        q = select(InvoiceStat).where(InvoiceStat.dimension == period)
+        if date_from:
+            q = q.where(InvoiceStat.bucket >= dict(stat_buckets(date_from, None))[period])
+        if date_to:
+            q = q.where(InvoiceStat.bucket <= date_to.isoformat())
+        period_rows = sess.exec(q.order_by(InvoiceStat.bucket)).all()
+        supplier_rows = sess.exec(select(InvoiceStat).where(InvoiceStat.dimension == "supplier")).all()
+        supplier_ids = {int(row.bucket) for row in supplier_rows if row.bucket}
+        names = dict(sess.exec(select(Supplier.id, Supplier.name).where(Supplier.id.in_(supplier_ids))).all()) \
+            if supplier_ids else {}
+        overdue = _stat_sum(sess, *unpaid_day, InvoiceStat.bucket < today.isoformat())
+        due_this_week = _stat_sum(
+            sess, *unpaid_day,
+            InvoiceStat.bucket >= today.isoformat(),
+            InvoiceStat.bucket <= (today + timedelta(days=6)).isoformat(),
+        )
+
+    def grouped(rows, key: str) -> List[Dict[str, Any]]:
+        groups: Dict[str, list] = {}
+        for row in rows:
+            groups.setdefault(row.bucket, []).append(row)
+        return [{key: bucket or None, **_stat_totals(group)} for bucket, group in groups.items()]
+
+    suppliers = []
+    for s in grouped(supplier_rows, "supplier_id"):
+        key = s.pop("supplier_id")
+        supplier_id = int(key) if key else None
+        suppliers.append({"supplier_id": supplier_id, "supplier": names.get(supplier_id), **s})
+    suppliers.sort(key=lambda s: (-s["unpaid"]["amount"], -s["unpaid"]["count"]))
+    return {
+        "today": today.isoformat(),
+        # every invoice is in exactly one supplier bucket
+        "totals": _stat_totals(supplier_rows),
+        "overdue": overdue,
+        "due_this_week": due_this_week,
+        "period": period,
+        "buckets": grouped(period_rows, "bucket"),
+        "suppliers": suppliers,
+    }
 
 # ---------- Existing endpoints (unchanged signatures) ----------
 
@@ -274,31 +1268,91 @@ def mark_invoice_paid(invoice_id: int):
 def health():
     return JSONResponse(content={"status": "ok"})
 
-@app.post("/check_pagata", tags=["Fatture"])
-async def check_pagata_fastapi(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xml") as tmp:
-        contents = await file.read()
-        tmp.write(contents)
-        tmp_path = tmp.name
+@app.get("/health/executors", tags=["Health"])
+def executors_health():
+    # pending / queue depth / counters for the DB and parse pools
+    return JSONResponse(content=pools.stats())
+
+@app.get("/health/parse_cache", tags=["Health"])
+def parse_cache_health():
+    # memory / disk hits, misses, evictions of the parse-result cache
+    return JSONResponse(content=parse_cache.stats())
+
+def _runtime_gauges():
+    pool_stats = pools.stats()
+    yield ("executor_pending", "Jobs in flight per pool", ("pool",),
+           {(name,): st["pending"] for name, st in pool_stats.items()})
+    yield ("executor_queue_depth", "Jobs waiting for a worker per pool", ("pool",),
+           {(name,): st["queue_depth"] for name, st in pool_stats.items()})
+    yield ("executor_rejected", "Jobs rejected with PoolBusy per pool", ("pool",),
+           {(name,): st["rejected"] for name, st in pool_stats.items()})
+    ws = ws_manager.stats()
+    yield ("ws_clients", "Connected WebSocket clients", (), {(): ws["clients"]})
+    yield ("ws_queued_messages", "Messages waiting in WebSocket client queues", (), {(): ws["queued"]})
+    yield ("ws_dropped_messages", "Messages dropped for slow WebSocket clients", (), {(): ws["dropped"]})
+    cache = parse_cache.stats()
+    yield ("parse_cache_lookups", "Parse cache lookups by result", ("result",), {
+        ("memory_hit",): cache["memory_hits"], ("disk_hit",): cache["disk_hits"], ("miss",): cache["misses"],
+    })
+    suppliers = supplier_registry.stats()
+    yield ("supplier_cache_lookups", "Supplier registry lookups by result", ("result",), {
+        ("hit",): suppliers["hits"], ("miss",): suppliers["misses"],
+    })
+
+def _job_gauges():
+    yield ("job_queue_jobs", "Upload jobs per status", ("status",),
+           {(status,): n for status, n in job_queue.stats().items()})
+
+registry.gauges.append(_runtime_gauges)
+registry.gauges.append(_job_gauges)
+
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+def metrics():
+    # Prometheus text format, per worker process
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profile", tags=["Health"], include_in_schema=False)
+async def debug_profile(seconds: float = 10, interval_ms: float = 5):
+    """
+    Samples every thread's stack for `seconds` and returns collapsed stacks
+    (flamegraph.pl / speedscope). Only with PROFILER_ENABLED=1.
+    """
+    if os.getenv("PROFILER_ENABLED") != "1":
+        raise HTTPException(status_code=404, detail="Not Found")
     try:
-        result = check_pagata(tmp_path)
-    finally:
-        os.remove(tmp_path)
-    return JSONResponse(content=result)
+        text = await asyncio.to_thread(profiler.run, min(max(seconds, 0.1), 60), max(interval_ms, 1) / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(text)
+
+@app.get("/health/jobs", tags=["Health"])
+def jobs_health():
+    # upload jobs per status (queue depth = queued)
+    return JSONResponse(content=job_queue.stats())
+
+@app.get("/health/startup", tags=["Health"])
+def startup_health():
+    # where this worker's cold start went: imports, storage, migrations, scheduler, bus
+    return JSONResponse(content=startup_report)
+
+@app.get("/health/ws", tags=["Health"])
+async def ws_health():
+    # connected dashboards, queued / dropped messages
+    return JSONResponse(content=ws_manager.stats())
 
-@app.post("/check_importo", tags=["Fatture"])
+@upload_router.post("/check_pagata", tags=["Fatture"])
+async def check_pagata_fastapi(file: UploadFile = File(...)):
+    async with spooled(file) as upload:
+        info = await parse_invoice(upload.source, file.filename, upload.digest)
+    return JSONResponse(content=pagata_payload(info))
+
+@upload_router.post("/check_importo", tags=["Fatture"])
 async def check_importo_fastapi(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xml") as tmp:
-        contents = await file.read()
-        tmp.write(contents)
-        tmp_path = tmp.name
-    try:
-        result = check_importo(tmp_path)
-    finally:
-        os.remove(tmp_path)
-    return JSONResponse(content=result)
+    async with spooled(file) as upload:
+        info = await parse_invoice(upload.source, file.filename, upload.digest)
+        return JSONResponse(content=await amount_payload(info, upload.source))
 
-@app.post("/check_data_scadenza", tags=["Fatture"])
+@upload_router.post("/check_data_scadenza", tags=["Fatture"])
 async def check_data_fastapi(file: UploadFile = File(...)):
     """
     Pass-through for frontend (status, file, data_scadenza), PLUS backend info:
@@ -308,151 +1362,747 @@ async def check_data_fastapi(file: UploadFile = File(...)):
         "backend": {
           "stored_invoice": {id, filename, due_date, supplier, days_left} | null,
           "notification_sent": bool,
+          "duplicate": bool,           # same file / SdI id already stored
           "note": "...optional..."
         }
       }
     If 'data_scadenza' = "Da verificare" or unparseable, we do NOT store an invoice.
+    The amount stored is the one in the XML or, if it has none, the model's guess
+    (as /invoices/analyze and /receipts/upload).
+    """
+    async with spooled(file) as upload:
+        digest = upload.digest
+
+        # 0) Same file already stored: answer from the DB; data_scadenza as the
+        #    checker reads it, from the parse cache (parsed again only if evicted)
+        with span("db_lookup"):
+            existing = (await pools.run_db(find_invoices, [digest])).get(digest)
+        if existing is not None:
+            with span("parse"):
+                info = await parse_invoice(upload.source, file.filename, digest)
+            return JSONResponse(content={
+                "status": "ok",
+                "file": file.filename or "invoice.xml",
+                "data_scadenza": date_payload(info)["data_scadenza"],
+                "data_scadenza_iso": existing.due_date.isoformat(),
+                "backend": {
+                    "stored_invoice": invoice_summary(existing),
+                    "notification_sent": False,
+                    "duplicate": True,
+                }
+            })
+
+        # 1) Run your checker and keep its payload intact for the frontend
+        with span("parse"):
+            info = await parse_invoice(upload.source, file.filename, digest)
+        tool_result = date_payload(info)
+
+        # 2) Try to normalise and persist if possible
+        stored = await store_due_invoice(
+            tool_result, file.filename or tool_result.get("file") or "invoice.xml",
+            supplier=info.nome_fornitore, digest=digest, id_sdi=info.id_sdi,
+            amount=(await amount_payload(info, upload.source))["importo"],
+            supplier_ref=supplier_ref(info),
+        )
+
+        # 3) Build a coherent, back-compatible response
+        #    - Top-level mirrors your original payload fields for the frontend
+        #    - Extras live under 'data_scadenza_iso' and 'backend'
+        response = {
+            "status": tool_result.get("status", "ok"),
+            "file": tool_result.get("file", file.filename or "invoice.xml"),
+            "data_scadenza": tool_result.get("data_scadenza"),
+            **stored
+        }
+        return JSONResponse(content=response)
+
+
+@upload_router.post("/check_data_emissione", tags=["Fatture"])
+async def check_data_emissione_fastapi(file: UploadFile = File(...)):
+    async with spooled(file) as upload:
+        info = await parse_invoice(upload.source, file.filename, upload.digest)
+    return JSONResponse(content=fornitore_payload(info))
+
+@upload_router.post("/invoices/analyze", tags=["Fatture"])
+async def analyze_invoice(file: UploadFile = File(...)):
+    """
+    Upload once, run every check on a single parse:
+      {
+        status, file,
+        pagata, label, color, dettagli,      # /check_pagata
+        importo, fonte_importo,              # /check_importo
+        data_scadenza,                       # /check_data_scadenza
+        data_emissione, fornitore,           # /check_data_emissione
+        data_scadenza_iso, backend           # persistence, as /check_data_scadenza
+      }
+    The supplier found in the XML is stored on the invoice and in the supplier registry.
     """
-    # 1) Run your checker and keep its payload intact for the frontend
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xml") as tmp:
-        contents = await file.read()
-        tmp.write(contents)
-        tmp_path = tmp.name
+    filename = file.filename or "invoice.xml"
+    async with spooled(file) as upload:
+        digest = upload.digest
+        info = await parse_invoice(upload.source, filename, digest)
+
+        date_result = date_payload(info)
+        response = {
+            **pagata_payload(info),
+            **await amount_payload(info, upload.source),
+            **date_result,
+            **fornitore_payload(info),
+        }
+        response.update(await store_due_invoice(
+            date_result, filename, supplier=info.nome_fornitore, digest=digest, id_sdi=info.id_sdi,
+            amount=response["importo"], supplier_ref=supplier_ref(info),
+        ))
+        return JSONResponse(content=response)
+
+async def spool_batch(files: List[UploadFile]) -> List[SpooledUpload]:
+    """Spools every file of a multi-file upload, 413 past MAX_UPLOAD_BYTES / MAX_BATCH_BYTES."""
+    uploads: List[SpooledUpload] = []
     try:
-        tool_result = check_date(tmp_path)  # <-- your function (unchanged)
-    finally:
-        os.remove(tmp_path)
+        for f in files:
+            uploads.append(await spool_upload(f))
+            if sum(u.size for u in uploads) > MAX_BATCH_BYTES:
+                raise _too_large("batch", MAX_BATCH_BYTES)
+    except BaseException:
+        for upload in uploads:
+            upload.discard()
+        raise
+    return uploads
 
-    # 2) Try to normalise and persist if possible
-    stored_invoice = None
-    notification_sent = False
-    due_iso = None
-    note = None
+def _enqueue_receipts(uploads: List[SpooledUpload]) -> str:
+    """Blocking: writes / moves the uploads under JOBS_DIR/<job id>/ and queues the job."""
+    job_id = uuid.uuid4().hex
+    job_dir = JOBS_DIR / job_id
+    job_dir.mkdir()
+    files = []
+    for n, upload in enumerate(uploads):
+        name = f"{n}.xml"
+        if upload.path is not None:
+            os.replace(upload.path, job_dir / name)
+        else:
+            (job_dir / name).write_bytes(upload.data)
+        files.append({"filename": upload.filename, "path": name, "digest": upload.digest, "size": upload.size})
+    # the row is written last: a queued job always has its files
+    return job_queue.enqueue("receipts", {"files": files}, job_id=job_id)
 
+@batch_upload_router.post("/receipts/upload", status_code=202, tags=["Fatture"])
+async def upload_receipts(files: List[UploadFile] = File(...)):
+    """
+    Carica una o più ricevute (XML): i file vengono salvati e accodati come un job,
+    la risposta (202) arriva subito: {job_id, status: "queued", files, status_url}.
+    Parsing, registrazione come 'receipt_upload' e notifiche avvengono in un job
+    worker; GET /jobs/{job_id} riporta lo stato e, a job finito, in result.uploaded
+    le righe per file {ok/errore, invoice_id se creato, days_left, ...}.
+    """
+    uploads = await spool_batch(files)
     try:
-        due = parse_due_date(tool_result)      # uses data_scadenza
-        due_iso = due.isoformat()
-        today = datetime.now(TZ).date()
-        days_left = (due - today).days
+        with span("enqueue"):
+            job_id = await pools.run_db(_enqueue_receipts, uploads)
+        job_wakeup.set()
+    finally:
+        # no-op for the files already moved into the job directory
+        for upload in uploads:
+            upload.discard()
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id, "status": "queued", "files": len(uploads), "status_url": f"/jobs/{job_id}",
+    })
 
-        # Supplier unknown here; leave None (or integrate check_date_fornitore later)
-        with Session(engine) as sess:
-            inv = Invoice(
-                filename=file.filename or tool_result.get("file") or "invoice.xml",
-                due_date=due,
-                supplier=None
-            )
-            sess.add(inv)
-            sess.commit()
-            sess.refresh(inv)
+async def _receipts_batch_stream(uploads: List[SpooledUpload]):
+    try:
+        async for row in receipt_rows(uploads):
+            yield json.dumps(row) + "\n"
+    finally:
+        # spooled copies (stored files were compressed into the content store)
+        for upload in uploads:
+            upload.discard()
+
+# files parsed between two progress reports of a receipts job
+RECEIPTS_REPORT_EVERY = int(os.getenv("RECEIPTS_REPORT_EVERY", 100))
+
+async def receipt_rows(uploads: List[SpooledUpload], raise_retryable: bool = False, report=None):
+    """
+    Dedups, parses (concurrently, in the parse pool) and stores a set of uploads
+    in one transaction. Yields one /receipts/upload row per file (duplicates and
+    errors first, the stored ones after the commit) and a final
+    {"done": true, "ok": n, "errors": m}. Files are only read, never discarded.
+    DB failures and a full parse pool become error rows, unless raise_retryable
+    (jobs retry instead). `report(progress)` (awaited) gets {total, parsed,
+    errors} every RECEIPTS_REPORT_EVERY parsed files.
+    """
+    today = datetime.now(TZ).date()
+    # keep the parse pool busy without taking all of its queue from other requests
+    window = asyncio.Semaphore(pools.parse.max_workers * 2)
 
-            # Immediate notify if 0..5 days (inclusive)
-            if 0 <= days_left <= 5 and not inv.paid and not inv.notified_5d:
-                await create_due_soon_notification(sess, inv, days_left)
-                notification_sent = True
+    async def parse_one(filename: str, contents: Union[bytes, Path], digest: str):
+        async with window:
+            try:
+                with span("parse"):
+                    info = await parse_invoice(contents, filename, digest)
+                due = parse_due_date(date_payload(info))
+                return (filename, contents, due, digest, info.id_sdi, importo_payload(info)["importo"],
+                        info.nome_fornitore, supplier_ref(info), None)
+            except PoolBusy as e:
+                if raise_retryable:
+                    raise  # not the file's fault: the job is retried later
+                return filename, contents, None, digest, None, None, None, None, str(e)
+            except Exception as e:
+                return filename, contents, None, digest, None, None, None, None, str(e)
+
+    # dedup by content hash before parsing: against the DB and inside the batch
+    by_digest: Dict[str, List[tuple]] = {}
+    for upload in uploads:
+        by_digest.setdefault(upload.digest, []).append((upload.filename, upload.source))
+    try:
+        existing = await pools.run_db(find_invoices, list(by_digest))
+    except Exception as e:
+        if raise_retryable:
+            raise
+        for upload in uploads:
+            name = upload.filename
+            yield {"file": name, "status": "error", "message": str(e)}
+        yield {"done": True, "ok": 0, "errors": len(uploads)}
+        return
 
-            stored_invoice = {
-                "id": inv.id,
-                "filename": inv.filename,
+    ok = 0
+    errors = 0
+    for digest, inv in existing.items():
+        for name, _ in by_digest.pop(digest):
+            ok += 1
+            yield {
+                "file": name,
+                "status": "ok",
+                "invoice_id": inv.id,
                 "due_date": inv.due_date.isoformat(),
-                "supplier": inv.supplier,
-                "days_left": days_left
+                "days_left": (inv.due_date - today).days,
+                "notification_sent": False,
+                "duplicate": True,
             }
 
-    except Exception as e:
-        # Keep front payload intact; just annotate backend info
-        note = f"Due date not stored: {e}"
+    parsed = []
+    tasks = [asyncio.ensure_future(parse_one(group[0][0], group[0][1], digest)) for digest, group in by_digest.items()]
+    try:
+        for done, fut in enumerate(asyncio.as_completed(tasks), 1):
+            *item, error = await fut
+            if error is not None:
+                for name, _ in by_digest[item[3]]:
+                    errors += 1
+                    yield {"file": name, "status": "error", "message": error}
+            else:
+                parsed.append(tuple(item))
+            if report is not None and done % RECEIPTS_REPORT_EVERY == 0:
+                await report({"total": len(tasks), "parsed": done, "errors": errors})
+    except BaseException:
+        # PoolBusy, or the client went away: drop the parses still queued
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
 
-    # 3) Build a coherent, back-compatible response
-    #    - Top-level mirrors your original payload fields for the frontend
-    #    - Extras live under 'data_scadenza_iso' and 'backend'
-    response = {
-        "status": tool_result.get("status", "ok"),
-        "file": tool_result.get("file", file.filename or "invoice.xml"),
-        "data_scadenza": tool_result.get("data_scadenza"),
-        "data_scadenza_iso": due_iso,
-        "backend": {
-            "stored_invoice": stored_invoice,
-            "notification_sent": notification_sent,
-            **({"note": note} if note else {})
-        }
-    }
-    return JSONResponse(content=response)
+    # amounts the XML does not carry: one batch for the model, off the DB threads
+    unknown = [i for i, item in enumerate(parsed) if item[5] is None]
+    if unknown:
+        try:
+            with span("model"):
+                guesses = await pools.run_model(guess_amounts, [parsed[i][1] for i in unknown])
+        except PoolBusy:
+            if raise_retryable:
+                raise
+            guesses = []  # stored without an amount, as before
+        for i, guess in zip(unknown, guesses):
+            if guess:
+                item = list(parsed[i])
+                item[5] = guess
+                parsed[i] = tuple(item)
 
+    if parsed:
+        try:
+            with span("db_commit"):
+                rows, ws_payloads = await pools.run_db(store_receipts, parsed, today)
+        except Exception as e:
+            if raise_retryable:
+                raise
+            for item in parsed:
+                for name, _ in by_digest[item[3]]:
+                    errors += 1
+                    yield {"file": name, "status": "error", "message": str(e)}
+        else:
+            for item, row in zip(parsed, rows):
+                ok += 1
+                yield row
+                # same bytes uploaded more than once in this batch
+                for name, _ in by_digest[item[3]][1:]:
+                    ok += 1
+                    yield {**row, "file": name, "notification_sent": False, "duplicate": True}
+            if ws_payloads:
+                with span("broadcast"):
+                    await bus.publish({"type": "batch", "notifications": ws_payloads})
 
-@app.post("/check_data_emissione", tags=["Fatture"])
-async def check_data_emissione_fastapi(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xml") as tmp:
-        contents = await file.read()
-        tmp.write(contents)
-        tmp_path = tmp.name
+    yield {"done": True, "ok": ok, "errors": errors}
+
+@batch_upload_router.post("/receipts/upload/batch", tags=["Fatture"])
+async def upload_receipts_batch(files: List[UploadFile] = File(...)):
+    """
+    Variante sincrona di /receipts/upload: parsing concorrente nel pool, tutte le
+    fatture e le notifiche in un'unica transazione. Risposta NDJSON, una riga per
+    file (stesso formato di result.uploaded in /jobs/{id}; duplicati ed errori
+    arrivano subito, gli ok dopo il commit) e una riga finale {"done": true, "ok": n, "errors": m}.
+    """
+    # spool everything now: the uploads are closed once the endpoint returns
+    uploads = await spool_batch(files)
+    return StreamingResponse(_receipts_batch_stream(uploads), media_type="application/x-ndjson")
+
+# ---------- NEW: upload jobs ----------
+# Job worker tasks per API process; 0 when separate `python worker.py` processes run them
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 1))
+JOB_POLL_S = float(os.getenv("JOB_POLL_S", 0.5))
+# set on enqueue: this process' idle workers start at once instead of at the next poll
+job_wakeup = asyncio.Event()
+
+def job_reporter(job: Job):
+    """report(progress) for long jobs: saves it on the job row and renews the lease."""
+    async def report(progress):
+        if not await pools.run_db(job_queue.heartbeat, job, progress):
+            raise RuntimeError("lease lost")  # another worker took the job over
+    return report
+
+async def run_receipts_job(job: Job) -> Dict[str, Any]:
+    job_dir = JOBS_DIR / job.id
+    uploads = [
+        SpooledUpload(f["filename"], f["digest"], f["size"], path=job_dir / f["path"])
+        for f in job.payload["files"]
+    ]
+    rows = [row async for row in receipt_rows(uploads, raise_retryable=True, report=job_reporter(job))]
+    return {"uploaded": rows[:-1], "ok": rows[-1]["ok"], "errors": rows[-1]["errors"]}
+
+async def parse_stored(row) -> FatturaInfo:
+    """parse_invoice on an invoice's stored file (row: filename, file_path, content_hash)."""
+    if row.content_hash:
+        return await parse_invoice(content_store.path(row.file_path), row.filename, row.content_hash)
+    return await parse_invoice(await pools.run_db(content_store.read, row.file_path), row.filename)
+
+# unpaid invoices read per round of the reconciliation (one batched UPDATE each)
+RECONCILE_CHUNK = int(os.getenv("RECONCILE_CHUNK", 500))
+
+def _unpaid_with_files(after_id: int, limit: int):
+    with Session(read_engine) as sess:
+        return sess.exec(
+            select(Invoice.id, Invoice.filename, Invoice.file_path, Invoice.content_hash)
+            .where(Invoice.paid == False, Invoice.file_path != None, Invoice.id > after_id)
+            .order_by(Invoice.id).limit(limit)
+        ).all()
+
+async def reconcile_payments(report=None, chunk: int = RECONCILE_CHUNK) -> Dict[str, Any]:
+    """
+    Re-reads the stored file of every unpaid invoice (parse cache first, else the
+    parse pool, concurrently) and marks paid those whose payment mode says so
+    (MP09 / MP19, as check_pagata), with one batched UPDATE per chunk of invoices.
+    `report(progress)` (awaited) gets {scanned, marked_paid, errors} after each chunk.
+    """
+    window = asyncio.Semaphore(pools.parse.max_workers * 2)
+
+    async def is_paid(row) -> Optional[bool]:
+        async with window:
+            try:
+                info = await parse_stored(row)
+            except PoolBusy:
+                raise  # the job is retried later
+            except Exception:
+                return None  # file gone or unreadable: counted, left unpaid
+            return info.pagata
+
+    scanned = errors = 0
+    marked: List[int] = []
+    after = 0
+    while rows := await pools.run_db(_unpaid_with_files, after, chunk):
+        after = rows[-1].id
+        with span("parse"):
+            results = await asyncio.gather(*(is_paid(r) for r in rows))
+        scanned += len(rows)
+        errors += sum(1 for paid in results if paid is None)
+        paid_ids = [r.id for r, paid in zip(rows, results) if paid]
+        if paid_ids:
+            with span("db_commit"):
+                marked += await pools.run_db(mark_invoices_paid, paid_ids)
+        if report is not None:
+            await report({"scanned": scanned, "marked_paid": len(marked), "errors": errors})
+    return {"scanned": scanned, "marked_paid": len(marked), "errors": errors, "invoice_ids": marked}
+
+async def run_reconcile_job(job: Job) -> Dict[str, Any]:
+    return await reconcile_payments(job_reporter(job))
+
+# ---------- NEW: re-extraction backfill ----------
+# stale invoices re-parsed per round (one transaction each)
+BACKFILL_CHUNK = int(os.getenv("BACKFILL_CHUNK", 200))
+# share of wall time the backfill keeps working: after each round it sleeps the rest
+BACKFILL_DUTY = min(max(float(os.getenv("BACKFILL_DUTY", 0.5)), 0.05), 1.0)
+# pause while live requests are queued on the parse pool
+BACKFILL_BACKOFF_S = float(os.getenv("BACKFILL_BACKOFF_S", 0.2))
+# fields the backfill re-derives from the file (paid is reconcile_payments' business)
+EXTRACTED_FIELDS = ("due_date", "supplier", "supplier_id", "id_sdi", "amount")
+
+def _stale():
+    return and_(
+        Invoice.file_path != None,
+        or_(Invoice.extractor_version == None, Invoice.extractor_version < EXTRACTOR_VERSION),
+    )
+
+def count_stale_invoices() -> int:
+    with Session(read_engine) as sess:
+        return sess.exec(select(func.count()).select_from(Invoice).where(_stale())).one()
+
+def _stale_invoices(after_id: int, limit: int):
+    with Session(read_engine) as sess:
+        return sess.exec(
+            select(Invoice.id, Invoice.filename, Invoice.file_path, Invoice.content_hash, Invoice.source,
+                   Invoice.paid, Invoice.notified_5d, *(getattr(Invoice, f) for f in EXTRACTED_FIELDS))
+            .where(_stale(), Invoice.id > after_id)
+            .order_by(Invoice.id).limit(limit)
+        ).all()
+
+def reextracted_fields(row, info: FatturaInfo) -> Dict[str, Any]:
+    """
+    EXTRACTED_FIELDS of a stored invoice as the current extractor reads them,
+    with the supplier's SupplierRef in place of supplier_id (apply_reextraction
+    looks it up). What it can no longer read keeps the stored value (e.g. an
+    amount once guessed by the model).
+    """
     try:
-        result = check_date_fornitore(tmp_path)
-    finally:
-        os.remove(tmp_path)
-    return JSONResponse(content=result)
+        due = parse_due_date(date_payload(info))
+    except ValueError:
+        due = row.due_date
+    amount = importo_payload(info)["importo"]
+    return {
+        "due_date": due,
+        "supplier": info.nome_fornitore or row.supplier,
+        "supplier_ref": supplier_ref(info),
+        "id_sdi": info.id_sdi or row.id_sdi,
+        "amount": row.amount if amount is None else amount,
+    }
 
-@app.post("/receipts/upload", tags=["Fatture"])
-async def upload_receipts(files: List[UploadFile] = File(...)):
+def apply_reextraction(rows, fields: List[Optional[Dict[str, Any]]]) -> int:
     """
-    Carica una o più ricevute (XML), ne estrae la data di scadenza e le registra come 'receipt_upload'.
-    Ritorna: per-file {ok/errore, invoice_id se creato, days_left, ...}
+    Writes back, in one transaction, only the rows whose fields changed (stats
+    moved from the old buckets to the new ones, due events re-registered when
+    the due date moved) and stamps every row of the round with EXTRACTOR_VERSION.
+    fields[i] is None when row i could not be parsed: it is stamped too, so it
+    is not re-read on every run. Returns the number of rows changed.
     """
-    results = []
-    today = datetime.now(TZ).date()
+    with Session(engine) as sess:
+        refs = [new["supplier_ref"] for new in fields if new is not None and new["supplier_ref"] is not None]
+        supplier_ids = supplier_registry.resolve(sess, refs) if refs else {}
+        for row, new in zip(rows, fields):
+            if new is not None:
+                ref = new.pop("supplier_ref")
+                new["supplier_id"] = supplier_ids[ref.tax_id] if ref is not None else row.supplier_id
+        changed = [
+            (row, new) for row, new in zip(rows, fields)
+            if new is not None and any(getattr(row, f) != new[f] for f in EXTRACTED_FIELDS)
+        ]
+        if changed:
+            bump_invoice_stats(sess, [StatRow(r.due_date, r.supplier_id, r.paid, r.amount) for r, _ in changed], -1)
+            bump_invoice_stats(sess, [StatRow(n["due_date"], n["supplier_id"], r.paid, n["amount"]) for r, n in changed])
+            sess.execute(update(Invoice), [{"id": r.id, **n} for r, n in changed])
+            moved = [(r, n) for r, n in changed if r.due_date != n["due_date"]]
+            if moved:
+                sess.execute(delete(DueEvent).where(DueEvent.invoice_id.in_([r.id for r, _ in moved])))
+                add_due_events(sess, [DueRow(r.id, n["due_date"], r.paid, r.notified_5d) for r, n in moved])
+        sess.execute(update(Invoice).where(Invoice.id.in_([r.id for r in rows])).values(extractor_version=EXTRACTOR_VERSION))
+        sess.commit()
+    return len(changed)
+
+async def backfill_extraction(report=None, chunk: int = BACKFILL_CHUNK) -> Dict[str, Any]:
+    """
+    Re-extracts every invoice whose extractor_version is older than
+    EXTRACTOR_VERSION from its stored file, in rounds of `chunk` rows parsed
+    concurrently, and applies only what changed (apply_reextraction). Throttled
+    so live traffic keeps the parse pool: at most max_workers files in flight,
+    none submitted while requests are queued, and a pause after each round so
+    the backfill works BACKFILL_DUTY of the time. `report(progress)` (awaited)
+    gets {total, done, changed, errors, files_per_s} after each round.
+    """
+    progress = {"extractor_version": EXTRACTOR_VERSION, "total": await pools.run_db(count_stale_invoices),
+                "done": 0, "changed": 0, "errors": 0, "files_per_s": None}
+    window = asyncio.Semaphore(pools.parse.max_workers)
+
+    async def reextract(row) -> Optional[Dict[str, Any]]:
+        async with window:
+            while pools.parse.queue_depth > 0:
+                await asyncio.sleep(BACKFILL_BACKOFF_S)
+            try:
+                return reextracted_fields(row, await parse_stored(row))
+            except PoolBusy:
+                raise
+            except Exception:
+                return None  # file gone or unreadable: counted, keeps its fields
+
+    started = time.perf_counter()
+    busy = 0.0
+    after = 0
+    while rows := await pools.run_db(_stale_invoices, after, chunk):
+        round_start = time.perf_counter()
+        after = rows[-1].id
+        with span("parse"):
+            fields = await asyncio.gather(*(reextract(r) for r in rows))
+        with span("db_commit"):
+            progress["changed"] += await pools.run_db(apply_reextraction, rows, fields)
+        progress["done"] += len(rows)
+        progress["errors"] += sum(1 for f in fields if f is None)
+        elapsed = time.perf_counter() - round_start
+        busy += elapsed
+        progress["files_per_s"] = round(progress["done"] / busy, 1) if busy else None
+        progress["elapsed_s"] = round(time.perf_counter() - started, 1)
+        if report is not None:
+            await report(dict(progress))
+        await asyncio.sleep(elapsed * (1 - BACKFILL_DUTY) / BACKFILL_DUTY)
+    return progress
+
+async def run_backfill_job(job: Job) -> Dict[str, Any]:
+    return await backfill_extraction(job_reporter(job))
 
-    for f in files:
-        saved_path = FILES_DIR / f.filename
-        # salva su disco in modo persistente
-        with saved_path.open("wb") as out:
-            out.write(await f.read())
+def enqueue_once(kind: str, pending) -> Optional[str]:
+    """Queues a `kind` job when pending() finds work and none is queued or running; returns its id."""
+    active = job_queue.active(kind)
+    if active is not None:
+        return active
+    return job_queue.enqueue(kind, {}) if pending() else None
 
-        # prova a leggere la data con il tuo parser
+def enqueue_backfill() -> Optional[str]:
+    return enqueue_once("backfill", count_stale_invoices)
+
+# ---------- NEW: legacy files -> content store ----------
+# "keep" (default): the original files stay where they are once copied into the
+# store; "delete": removed as soon as no invoice points to them any more
+STORE_LEGACY_FILES = os.getenv("STORE_LEGACY_FILES", "keep")
+
+def _legacy():
+    # plain files saved before the content store (flat in FILES_DIR or anywhere else)
+    return and_(Invoice.file_path != None, Invoice.file_path.not_like("%.xml.gz"))
+
+def count_legacy_files() -> int:
+    with Session(read_engine) as sess:
+        return sess.exec(select(func.count()).select_from(Invoice).where(_legacy())).one()
+
+def _legacy_files(after_id: int, limit: int):
+    with Session(read_engine) as sess:
+        return sess.exec(
+            select(Invoice.id, Invoice.file_path).where(_legacy(), Invoice.id > after_id)
+            .order_by(Invoice.id).limit(limit)
+        ).all()
+
+def adopt_legacy_files(rows) -> Dict[str, int]:
+    """
+    Blocking: compresses the files of `rows` into the content store (keyed by
+    the bytes actually on disk) and re-keys the rows in one transaction. The
+    old files no invoice points to any more are deleted only with
+    STORE_LEGACY_FILES=delete. Missing files are counted and their rows left
+    as they are.
+    """
+    keys: Dict[int, str] = {}
+    out = {"moved": 0, "errors": 0, "deleted": 0, "bytes_before": 0, "bytes_after": 0}
+    for row in rows:
+        src = Path(row.file_path)
         try:
-            tool_result = check_date(str(saved_path))
-            due = parse_due_date(tool_result)  # usa data_scadenza
-            days_left = (due - today).days
-
-            with Session(engine) as sess:
-                inv = Invoice(
-                    filename=f.filename,
-                    due_date=due,
-                    supplier=None,
-                    source="receipt_upload",
-                    file_path=str(saved_path),
-                )
-                sess.add(inv)
-                sess.commit()
-                sess.refresh(inv)
-
-                # se entro 5 giorni, notifica subito
-                notified = False
-                if 0 <= days_left <= 5 and not inv.notified_5d:
-                    await create_due_soon_notification(sess, inv, days_left)
-                    notified = True
-
-                results.append({
-                    "file": f.filename,
-                    "status": "ok",
-                    "invoice_id": inv.id,
-                    "due_date": due.isoformat(),
-                    "days_left": days_left,
-                    "notification_sent": notified,
-                })
+            size = src.stat().st_size
+            keys[row.id] = content_store.put(src)
+        except OSError:
+            out["errors"] += 1
+            continue
+        out["bytes_before"] += size
+        out["bytes_after"] += content_store.path(keys[row.id]).stat().st_size
+    old = {row.file_path for row in rows if row.id in keys}
+    with Session(engine) as sess, stored_files_guard():
+        if keys:
+            sess.execute(update(Invoice), [{"id": i, "file_path": key} for i, key in keys.items()])
+            sess.commit()
+        still_used = set(sess.exec(select(Invoice.file_path).where(Invoice.file_path.in_(old))).all()) if old else set()
+    if STORE_LEGACY_FILES == "delete":
+        for path in old - still_used:
+            Path(path).unlink(missing_ok=True)
+            out["deleted"] += 1
+    out["moved"] = len(keys)
+    return out
+
+async def migrate_legacy_files(report=None, chunk: int = BACKFILL_CHUNK) -> Dict[str, Any]:
+    """
+    Moves every invoice file saved before the content store into it, chunk by
+    chunk, paced like the backfill (works BACKFILL_DUTY of the time).
+    `report(progress)` gets {total, done, moved, errors, deleted, bytes_before, bytes_after}.
+    """
+    progress = {"total": await pools.run_db(count_legacy_files), "done": 0,
+                "moved": 0, "errors": 0, "deleted": 0, "bytes_before": 0, "bytes_after": 0}
+    after = 0
+    while rows := await pools.run_db(_legacy_files, after, chunk):
+        round_start = time.perf_counter()
+        after = rows[-1].id
+        for name, value in (await pools.run_db(adopt_legacy_files, rows)).items():
+            progress[name] += value
+        progress["done"] += len(rows)
+        if report is not None:
+            await report(dict(progress))
+        elapsed = time.perf_counter() - round_start
+        await asyncio.sleep(elapsed * (1 - BACKFILL_DUTY) / BACKFILL_DUTY)
+    return progress
+
+async def run_store_files_job(job: Job) -> Dict[str, Any]:
+    return await migrate_legacy_files(job_reporter(job))
+
+# ---------- NEW: content store GC ----------
+# stored files younger than this are never collected: the transaction that put
+# them may still commit (it has to take less than this)
+STORE_GC_GRACE_S = float(os.getenv("STORE_GC_GRACE_S", 3600))
+
+def store_gc_pending() -> bool:
+    # a failed transaction was noted, long enough ago that its files are collectable
+    noted = content_store.orphans_noted()
+    return noted is not None and noted < time.time() - STORE_GC_GRACE_S
+
+def enqueue_store_gc() -> Optional[str]:
+    return enqueue_once("store_gc", store_gc_pending) if store_gc_pending() else None
 
+def remove_unreferenced(keys: List[str], older_than: float) -> int:
+    """Blocking: deletes the stored files of `keys` no invoice points to; returns how many."""
+    with Session(engine) as sess:
+        used = set(sess.exec(select(Invoice.file_path).where(Invoice.file_path.in_(keys))).all())
+    return sum(content_store.remove_unused(key, older_than) for key in keys if key not in used)
+
+async def collect_store_garbage(report=None, chunk: int = BACKFILL_CHUNK) -> Dict[str, Any]:
+    """
+    Walks the content store and deletes the files no invoice points to (left
+    by transactions that failed after storing them), except those stored or
+    reused in the last STORE_GC_GRACE_S. One DB lookup per `chunk` files,
+    paced like the backfill. `report(progress)` gets {scanned, removed}.
+    """
+    noted = content_store.orphans_noted()
+    older_than = time.time() - STORE_GC_GRACE_S
+    keys = content_store.keys(older_than)
+    progress = {"scanned": 0, "removed": 0}
+    while batch := await pools.run_db(lambda: list(itertools.islice(keys, chunk))):
+        round_start = time.perf_counter()
+        progress["removed"] += await pools.run_db(remove_unreferenced, batch, older_than)
+        progress["scanned"] += len(batch)
+        if report is not None:
+            await report(dict(progress))
+        elapsed = time.perf_counter() - round_start
+        await asyncio.sleep(elapsed * (1 - BACKFILL_DUTY) / BACKFILL_DUTY)
+    if noted is not None and noted < older_than:
+        await pools.run_db(content_store.clear_orphans, noted)
+    return progress
+
+async def run_store_gc_job(job: Job) -> Dict[str, Any]:
+    return await collect_store_garbage(job_reporter(job))
+
+JOB_HANDLERS = {
+    "receipts": run_receipts_job,
+    "reconcile": run_reconcile_job,
+    "backfill": run_backfill_job,
+    "store_files": run_store_files_job,
+    "store_gc": run_store_gc_job,
+}
+
+def _remove_job_files(job_ids: List[str]):
+    for job_id in job_ids:
+        shutil.rmtree(JOBS_DIR / job_id, ignore_errors=True)
+
+async def job_worker_loop(owner: str):
+    """Claims jobs from job_queue and runs them until cancelled (a job cut short is retried once its lease expires)."""
+    idle = 0
+    while True:
+        try:
+            job = await pools.run_db(job_queue.claim, owner)
         except Exception as e:
-            results.append({
-                "file": f.filename,
-                "status": "error",
-                "message": str(e),
-            })
+            print(f"⚠️  Job queue: {e}")
+            job = None
+        if job is None:
+            idle += 1
+            if idle % 1000 == 0:
+                await pools.run_db(lambda: _remove_job_files(job_queue.prune()))
+            job_wakeup.clear()
+            try:
+                await asyncio.wait_for(job_wakeup.wait(), JOB_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        idle = 0
+        start = time.perf_counter()
+        try:
+            result = await JOB_HANDLERS[job.kind](job)
+        except Exception as e:
+            status = await pools.run_db(job_queue.fail, job, owner, f"{type(e).__name__}: {e}")
+            queue_job_seconds.observe(time.perf_counter() - start, kind=job.kind, outcome="failed")
+            print(f"⚠️  Job {job.id} ({job.kind}) attempt {job.attempts}/{job.max_attempts} failed: {e} -> {status}")
+            continue
+        queue_job_seconds.observe(time.perf_counter() - start, kind=job.kind, outcome="done")
+        if await pools.run_db(job_queue.complete, job, owner, result):
+            await pools.run_db(_remove_job_files, [job.id])
+
+def start_job_workers(count: int) -> List[asyncio.Task]:
+    base = f"{socket.gethostname()}:{os.getpid()}"
+    return [asyncio.create_task(job_worker_loop(f"{base}:{n}")) for n in range(count)]
+
+@app.post("/invoices/reconcile", status_code=202, tags=["Fatture"])
+async def reconcile_invoices():
+    """
+    Queues a payment reconciliation over the stored files of all unpaid invoices
+    (202 {job_id, status_url}); the job result is {scanned, marked_paid, errors, invoice_ids}.
+    """
+    job_id = await pools.run_db(job_queue.enqueue, "reconcile", {})
+    job_wakeup.set()
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"})
+
+@app.post("/invoices/backfill", status_code=202, tags=["Fatture"])
+async def backfill_invoices():
+    """
+    Queues the re-extraction of invoices stored by an older extractor (202
+    {job_id, status_url}, the job already queued or running if there is one;
+    job_id null when nothing is stale). /jobs/{id} shows its progress.
+    """
+    job_id = await pools.run_db(enqueue_backfill)
+    if job_id is not None:
+        job_wakeup.set()
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id, "extractor_version": EXTRACTOR_VERSION,
+        "status_url": f"/jobs/{job_id}" if job_id else None,
+    })
+
+@app.post("/store/gc", status_code=202, tags=["Jobs"])
+async def store_gc():
+    """
+    Queues a content store GC run (202 {job_id, status_url}, the one already
+    queued or running if there is one): deletes stored files no invoice points
+    to, e.g. left by a process killed between storing a file and committing.
+    Runs by itself when a failed write is noted.
+    """
+    job_id = await pools.run_db(enqueue_once, "store_gc", lambda: True)
+    job_wakeup.set()
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status_url": f"/jobs/{job_id}"})
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+def get_job(job_id: str):
+    """
+    Status of a job: queued | running | done | dead (failed max_attempts times),
+    with attempts, last error, progress of long jobs and, once done, the result.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job)
 
-    return {"uploaded": results}
+@app.post("/jobs/{job_id}/retry", tags=["Jobs"])
+def retry_job(job_id: str):
+    # dead letter -> queue, e.g. after fixing what made it fail
+    if not job_queue.retry(job_id):
+        raise HTTPException(status_code=409, detail="Only dead jobs can be retried")
+    return {"ok": True}
 
 @app.get("/receipts", tags=["Fatture"])
-def list_receipts(limit: int = 100):
-    with Session(engine) as sess:
-        q = select(Invoice).where(Invoice.source == "receipt_upload").order_by(Invoice.created_at.desc())
+def list_receipts(limit: int = 100, cursor: Optional[str] = None):
+    """Newest first, keyset-paginated like /notifications (index on source, created_at)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    with Session(read_engine) as sess:
+        q = select(Invoice).where(Invoice.source == "receipt_upload")
+        if cursor:
+            q = q.where(tuple_(Invoice.created_at, Invoice.id) < tuple_(*decode_cursor(cursor)))
+        q = q.order_by(Invoice.created_at.desc(), Invoice.id.desc()).limit(limit)
         rows = sess.exec(q).all()
         return {"receipts": [{
             "id": r.id,
@@ -461,5 +2111,58 @@ def list_receipts(limit: int = 100):
             "paid": r.paid,
             "file_path": r.file_path,
             "created_at": r.created_at.isoformat(),
-        } for r in rows[:limit]]}
+        } for r in rows],
+            "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if len(rows) == limit else None}
+
+# ---------- NEW: suppliers ----------
+def _supplier_totals(sess: Session, supplier_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    # GROUP BY on the indexed integer column, only for the suppliers of the page
+    totals = {sid: {"paid": {"count": 0, "amount": 0.0}, "unpaid": {"count": 0, "amount": 0.0}} for sid in supplier_ids}
+    rows = sess.exec(
+        select(Invoice.supplier_id, Invoice.paid, func.count(), func.coalesce(func.sum(Invoice.amount), 0.0))
+        .where(Invoice.supplier_id.in_(supplier_ids))
+        .group_by(Invoice.supplier_id, Invoice.paid)
+    ).all()
+    for supplier_id, paid, count, amount in rows:
+        totals[supplier_id]["paid" if paid else "unpaid"] = {"count": count, "amount": round(amount, 2)}
+    return totals
+
+@app.get("/suppliers", tags=["Suppliers"])
+def list_suppliers(limit: int = 100, after_id: int = 0, tax_id: Optional[str] = None):
+    """
+    Supplier registry (one row per partita IVA / codice fiscale) by id, with the
+    invoice totals of each: {suppliers: [{id, tax_id, name, paid, unpaid}], next_after_id}.
+    tax_id looks up a single supplier.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    with Session(read_engine) as sess:
+        q = select(Supplier)
+        if tax_id:
+            q = q.where(Supplier.tax_id == tax_id.strip().upper())
+        rows = sess.exec(q.where(Supplier.id > after_id).order_by(Supplier.id).limit(limit)).all()
+        totals = _supplier_totals(sess, [r.id for r in rows]) if rows else {}
+    return {
+        "suppliers": [{"id": r.id, "tax_id": r.tax_id, "name": r.name, **totals[r.id]} for r in rows],
+        "next_after_id": rows[-1].id if len(rows) == limit else None,
+    }
+
+@app.get("/suppliers/{supplier_id}/invoices", tags=["Suppliers"])
+def list_supplier_invoices(supplier_id: int, paid: Optional[bool] = None, limit: int = 100, cursor: Optional[str] = None):
+    """A supplier's invoices, newest first, keyset-paginated (index on supplier_id, created_at)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    with Session(read_engine) as sess:
+        if sess.get(Supplier, supplier_id) is None:
+            raise HTTPException(status_code=404, detail="Supplier not found")
+        q = select(Invoice).where(Invoice.supplier_id == supplier_id)
+        if paid is not None:
+            q = q.where(Invoice.paid == paid)
+        if cursor:
+            q = q.where(tuple_(Invoice.created_at, Invoice.id) < tuple_(*decode_cursor(cursor)))
+        rows = sess.exec(q.order_by(Invoice.created_at.desc(), Invoice.id.desc()).limit(limit)).all()
+        return {"invoices": [{**invoice_summary(r), "paid": r.paid, "amount": r.amount} for r in rows],
+                "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if len(rows) == limit else None}
+
+app.include_router(upload_router)
+app.include_router(batch_upload_router)
 
+startup_report["import_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
@@ -0,0 +1,227 @@
+import bisect
+import collections
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds (Prometheus' defaults plus a finer low end)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_INF = 'le="+Inf"'
+
+# gauge collector output: (name, help, label names, {label values: value})
+GaugeFamily = Tuple[str, str, Tuple[str, ...], Dict[Tuple[str, ...], float]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_num(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket (non cumulative) + overflow, sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(s[0]), s[1], s[2]) for key, s in sorted(self._series.items())]
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_num(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, _INF)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text format (0.0.4)."""
+
+    def __init__(self):
+        self.metrics: List = []
+        # callbacks read at scrape time (pool / WS / cache state)
+        self.gauges: List[Callable[[], Iterable[GaugeFamily]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for collect in self.gauges:
+            for name, help, labelnames, values in collect():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+                for key, value in values.items():
+                    lines.append(f"{name}{_labels(labelnames, key)} {_num(value or 0)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status"),
+))
+phase_seconds = registry.register(Histogram(
+    "app_phase_duration_seconds", "Time spent in one phase of a request or job", ("phase",),
+))
+job_seconds = registry.register(Histogram(
+    "scheduler_job_duration_seconds", "Scheduler job run time", ("job",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+))
+job_rows = registry.register(Counter(
+    "scheduler_job_rows_total", "Rows processed by scheduler jobs", ("job",),
+))
+queue_job_seconds = registry.register(Histogram(
+    "queue_job_duration_seconds", "Run time of queued upload jobs by kind and outcome", ("kind", "outcome"),
+    buckets=(0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+))
+
+
+def span(phase: str):
+    """with span("parse"): ... -> app_phase_duration_seconds{phase="parse"}"""
+    return phase_seconds.time(phase=phase)
+
+
+class SamplingProfiler:
+    """
+    Poor man's sampling profiler: a thread snapshots every other thread's stack
+    (sys._current_frames) every `interval` seconds and counts identical stacks.
+    Output is the collapsed "frame;frame;frame count" format read by
+    flamegraph.pl / speedscope. Off unless explicitly started.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+
+    def run(self, seconds: float, interval: float = 0.005) -> str:
+        with self._lock:
+            if self.running:
+                raise RuntimeError("profiler already running")
+            self.running = True
+        try:
+            stacks: Dict[str, int] = collections.Counter()
+            me = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stop = time.perf_counter() + seconds
+            while time.perf_counter() < stop:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    stacks[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+            return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
+        finally:
+            self.running = False
+
+
+profiler = SamplingProfiler()
+
+
+def route_label(scope: dict) -> Optional[str]:
+    # the route template keeps label cardinality bounded (/invoices/{invoice_id}/paid)
+    route = scope.get("route")
+    return getattr(route, "path", None)
+
+
+class TimingMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware overhead): observes
+    http_request_duration_seconds once the response body is fully sent,
+    so streamed responses count their whole duration.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route_label(scope) or "unmatched",
+                status=status,
+            )
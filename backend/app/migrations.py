@@ -0,0 +1,47 @@
+import time
+from typing import Callable, List, Sequence, Tuple
+
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+# (version, name, step): steps run in order, each one exactly once per database
+Migration = Tuple[int, str, Callable[[Connection], None]]
+
+
+def current_version(engine: Engine) -> int:
+    """Last migration applied; 0 for an empty DB or one created before schema_version existed."""
+    with engine.connect() as conn:
+        try:
+            row = conn.exec_driver_sql("SELECT version FROM schema_version WHERE id = 1").first()
+        except OperationalError:
+            return 0
+    return row[0] if row else 0
+
+
+def migrate(engine: Engine, migrations: Sequence[Migration]) -> List[dict]:
+    """
+    Applies the migrations newer than the DB's schema_version, all in one
+    transaction. An up-to-date DB costs a single SELECT. Returns
+    [{version, name, ms}] for the steps that ran.
+    """
+    if not migrations or current_version(engine) >= migrations[-1][0]:
+        return []
+
+    applied = []
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS schema_version "
+            "(id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)"
+        )
+        # the first write takes SQLite's write lock: a worker booting at the same
+        # time waits here (busy_timeout) and then finds the migrations applied
+        conn.exec_driver_sql("INSERT OR IGNORE INTO schema_version (id, version) VALUES (1, 0)")
+        version = conn.exec_driver_sql("SELECT version FROM schema_version WHERE id = 1").scalar()
+        for number, name, step in migrations:
+            if number <= version:
+                continue
+            start = time.perf_counter()
+            step(conn)
+            conn.exec_driver_sql("UPDATE schema_version SET version = ? WHERE id = 1", (number,))
+            applied.append({"version": number, "name": name, "ms": round((time.perf_counter() - start) * 1000, 1)})
+    return applied
@@ -0,0 +1,223 @@
+import dataclasses
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from scripts.fattura_extractor import EXTRACTOR_VERSION, FatturaInfo
+
+PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", "./parse_cache.db")
+
+_DECIMALS = ("importo_pagamenti", "importo_riepilogo")
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def dump_info(info: FatturaInfo) -> str:
+    data = dataclasses.asdict(info)
+    for name in _DECIMALS:
+        if data[name] is not None:
+            data[name] = str(data[name])
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def load_info(text: str) -> FatturaInfo:
+    data = json.loads(text)
+    for name in _DECIMALS:
+        if data.get(name) is not None:
+            data[name] = Decimal(data[name])
+    return FatturaInfo(**data)
+
+
+class ParseCache:
+    """
+    Full extract_fattura() results keyed by content hash + EXTRACTOR_VERSION:
+    an in-process LRU of `memory_items` entries in front of a SQLite table,
+    which is trimmed (least recently used first) once its payloads exceed
+    `max_bytes`. The table is shared by every worker process: its size lives
+    in the file too (parse_usage, kept by triggers), not in one process'
+    counter. Safe to call from the DB thread pool.
+
+    Env: PARSE_CACHE_PATH (default ./parse_cache.db), PARSE_CACHE_MEMORY_ITEMS
+    (default 1024), PARSE_CACHE_MAX_BYTES (default 64 MiB, 0 disables the disk tier).
+    """
+
+    def __init__(self, path: str = PARSE_CACHE_PATH, memory_items: int = 1024,
+                 max_bytes: int = 64 * 1024 * 1024, version: int = EXTRACTOR_VERSION):
+        self.path = path
+        self.memory_items = max(0, memory_items)
+        self.max_bytes = max(0, max_bytes)
+        self.version = version
+        self._memory: "OrderedDict[str, FatturaInfo]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready = False
+        self._disk_bytes: Optional[int] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "ParseCache":
+        return cls(
+            memory_items=int(os.getenv("PARSE_CACHE_MEMORY_ITEMS", 1024)),
+            max_bytes=int(os.getenv("PARSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        )
+
+    def _key(self, digest: str) -> str:
+        return f"{digest}:{self.version}"
+
+    def _setup(self, conn: sqlite3.Connection):
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # one transaction: no row can change between the triggers and the initial sum
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS parse_result ("
+                    " key TEXT PRIMARY KEY, payload TEXT NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_parse_result_accessed_at ON parse_result (accessed_at)")
+                conn.execute("CREATE TABLE IF NOT EXISTS parse_usage (id INTEGER PRIMARY KEY CHECK (id = 1), bytes INTEGER NOT NULL)")
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS parse_result_insert AFTER INSERT ON parse_result"
+                    " BEGIN UPDATE parse_usage SET bytes = bytes + NEW.size WHERE id = 1; END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS parse_result_update AFTER UPDATE OF size ON parse_result"
+                    " BEGIN UPDATE parse_usage SET bytes = bytes + NEW.size - OLD.size WHERE id = 1; END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER IF NOT EXISTS parse_result_delete AFTER DELETE ON parse_result"
+                    " BEGIN UPDATE parse_usage SET bytes = bytes - OLD.size WHERE id = 1; END"
+                )
+                conn.execute("INSERT OR IGNORE INTO parse_usage (id, bytes) SELECT 1, COALESCE(SUM(size), 0) FROM parse_result")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._ready = True
+
+    def _remember(self, key: str, info: FatturaInfo):
+        if not self.memory_items:
+            return
+        with self._lock:
+            self._memory[key] = info
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get_memory(self, digest: str) -> Optional[FatturaInfo]:
+        """LRU only, no I/O: cheap enough to call from the event loop."""
+        with self._lock:
+            info = self._memory.get(self._key(digest))
+            if info is not None:
+                self._memory.move_to_end(self._key(digest))
+                self.memory_hits += 1
+        return info
+
+    def get(self, digest: str) -> Optional[FatturaInfo]:
+        info = self.get_memory(digest)
+        if info is not None:
+            return info
+        if not self.max_bytes:
+            self.misses += 1
+            return None
+
+        key = self._key(digest)
+        try:
+            conn = _connect(self.path)
+            try:
+                self._setup(conn)
+                row = conn.execute("SELECT payload FROM parse_result WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE parse_result SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        info = load_info(row[0])
+        self._remember(key, info)
+        return info
+
+    def put(self, digest: str, info: FatturaInfo):
+        key = self._key(digest)
+        self._remember(key, info)
+        self.stores += 1
+        if not self.max_bytes:
+            return
+
+        payload = dump_info(info)
+        try:
+            conn = _connect(self.path)
+            try:
+                self._setup(conn)
+                # an upsert, not INSERT OR REPLACE: the replaced row's size must leave parse_usage
+                conn.execute(
+                    "INSERT INTO parse_result (key, payload, size, accessed_at) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT (key) DO UPDATE SET payload = excluded.payload, size = excluded.size,"
+                    " accessed_at = excluded.accessed_at",
+                    (key, payload, len(payload), time.time()),
+                )
+                self._evict(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _usage(self, conn: sqlite3.Connection) -> int:
+        # what every process has stored, not just this one
+        self._disk_bytes = conn.execute("SELECT bytes FROM parse_usage WHERE id = 1").fetchone()[0]
+        return self._disk_bytes
+
+    def _evict(self, conn: sqlite3.Connection):
+        if self._usage(conn) <= self.max_bytes:
+            return
+
+        # drop the least recently used rows down to 90% of the budget
+        target = self._disk_bytes - int(self.max_bytes * 0.9)
+        cutoff = conn.execute(
+            "SELECT accessed_at FROM ("
+            " SELECT accessed_at, SUM(size) OVER (ORDER BY accessed_at) AS freed FROM parse_result"
+            ") WHERE freed >= ? LIMIT 1",
+            (target,),
+        ).fetchone()
+        if cutoff is None:
+            return
+        deleted = conn.execute("DELETE FROM parse_result WHERE accessed_at <= ?", (cutoff[0],)).rowcount
+        self.evictions += deleted
+        self._usage(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "version": self.version,
+            "memory_items": len(self._memory),
+            "memory_max_items": self.memory_items,
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+parse_cache = ParseCache.from_env()
@@ -0,0 +1,176 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Union
+
+from scripts.fattura_extractor import FatturaInfo, extract_fattura
+
+_CHUNK = 64 * 1024
+_SUFFIX = ".xml.gz"
+# touched when a transaction that put files did not commit: the GC has work
+_ORPHANS_NOTE = ".orphans"
+
+
+def _touch(path: Path) -> bool:
+    """Marks a stored file as just (re)written; False if it is not there (any more)."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _is_key(key: str) -> bool:
+    return not os.path.isabs(key) and key.endswith(_SUFFIX)
+
+
+def open_stored(path: Union[str, Path]) -> BinaryIO:
+    """The file's plain bytes as a stream: .gz files are decompressed while read."""
+    return gzip.open(path, "rb") if str(path).endswith(".gz") else open(path, "rb")
+
+
+def extract_file(path: str) -> FatturaInfo:
+    """extract_fattura streaming a stored (compressed) or spooled file; picklable for the parse pool."""
+    with open_stored(path) as f:
+        return extract_fattura(f)
+
+
+class ContentStore:
+    """
+    Content-addressed file store: every distinct file is kept once, gzip
+    compressed (XML shrinks 5-10x), at <root>/<sha[:2]>/<sha>.xml.gz: 256
+    directories (as git's objects/), ~4000 entries each at a million files,
+    instead of one flat directory. The storage key saved
+    in Invoice.file_path is that path relative to root. Writes go to a temp
+    file in root and are renamed into place: readers never see a partial file.
+    Paths saved before the store existed are still accepted as keys.
+
+    put() runs before the transaction that references the file commits, so a
+    failed one leaves the file behind: every put() (a reused file included)
+    refreshes its mtime, and remove_unused() only drops files that no put()
+    touched within the grace period.
+
+    Env: FILES_DIR (root, default ./files), CONTENT_STORE_LEVEL (gzip level, default 6).
+    """
+
+    def __init__(self, root: Path, level: int = 6):
+        self.root = root
+        self.level = min(max(level, 1), 9)
+
+    @classmethod
+    def from_env(cls) -> "ContentStore":
+        return cls(Path(os.getenv("FILES_DIR", "./files")), int(os.getenv("CONTENT_STORE_LEVEL", 6)))
+
+    @staticmethod
+    def key_for(digest: str) -> str:
+        return f"{digest[:2]}/{digest}{_SUFFIX}"
+
+    def path(self, key: str) -> Path:
+        return self.root / key if _is_key(key) else Path(key)
+
+    def open(self, key: str) -> BinaryIO:
+        return open_stored(self.path(key))
+
+    def read(self, key: str) -> bytes:
+        with self.open(key) as f:
+            return f.read()
+
+    def put(self, source: Union[bytes, Path], digest: Optional[str] = None) -> str:
+        """
+        Stores `source` (content or a file, which is left in place) and returns
+        its key. With the digest known, an already stored file costs one stat;
+        otherwise the sha256 is computed while compressing.
+        """
+        if digest is not None and _touch(self.root / self.key_for(digest)):
+            return self.key_for(digest)
+        sha = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=self.level, mtime=0) as out:
+                if isinstance(source, Path):
+                    with open_stored(source) as src:
+                        for chunk in iter(lambda: src.read(_CHUNK), b""):
+                            sha.update(chunk)
+                            out.write(chunk)
+                else:
+                    sha.update(source)
+                    out.write(source)
+            key = self.key_for(sha.hexdigest())
+            path = self.root / key
+            if _touch(path):
+                os.unlink(tmp)
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return key
+
+    def keys(self, older_than: float) -> Iterator[str]:
+        """Keys of the stored files not put since `older_than` (epoch seconds), shard by shard."""
+        for shard in sorted(self.root.glob("??")):
+            with os.scandir(shard) as entries:
+                for entry in entries:
+                    if entry.name.endswith(_SUFFIX) and not entry.name.startswith(".") \
+                            and entry.stat().st_mtime < older_than:
+                        yield f"{shard.name}/{entry.name}"
+
+    def remove_unused(self, key: str, older_than: float) -> bool:
+        """
+        Deletes a file the caller found unreferenced, unless a put() reused it
+        meanwhile: the file is first renamed aside (a put() from then on writes
+        it again) and renamed back if its mtime shows a put() since `older_than`.
+        """
+        path = self.path(key)
+        aside = path.with_name(f".{path.name}.gc")
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return False
+        try:
+            if aside.stat().st_mtime >= older_than:
+                os.replace(aside, path)
+                return False
+        except FileNotFoundError:
+            pass  # settled by sweep() meanwhile, the same way
+        aside.unlink(missing_ok=True)
+        return True
+
+    def note_orphans(self):
+        """Records that files were put for a transaction that did not commit."""
+        (self.root / _ORPHANS_NOTE).touch()
+
+    def orphans_noted(self) -> Optional[float]:
+        """When the last failed transaction was noted (mtime), None if none since the last GC."""
+        try:
+            return (self.root / _ORPHANS_NOTE).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def clear_orphans(self, noted: float):
+        """Drops the note the GC started from, unless another failure was noted since."""
+        if self.orphans_noted() == noted:
+            (self.root / _ORPHANS_NOTE).unlink(missing_ok=True)
+
+    def sweep(self, max_age_s: float = 3600):
+        # temp files of writes cut short by a crash (others' are recent)
+        for leftover in self.root.glob(".*.tmp"):
+            if time.time() - leftover.stat().st_mtime > max_age_s:
+                leftover.unlink(missing_ok=True)
+        # files a GC run had set aside when it died: finished as remove_unused would
+        for aside in self.root.glob("??/.*.gc"):
+            try:
+                if time.time() - aside.stat().st_mtime > max_age_s:
+                    aside.unlink(missing_ok=True)
+                else:
+                    os.replace(aside, aside.with_name(aside.name[1:-3]))
+            except FileNotFoundError:
+                pass
+
+
+content_store = ContentStore.from_env()
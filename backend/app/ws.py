@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, List
+
+from fastapi import WebSocket
+
+PING = json.dumps({"type": "ping"})
+PONG = json.dumps({"type": "pong"})
+
+
+class _Client:
+    __slots__ = ("ws", "queue", "task", "dropped")
+
+    def __init__(self, ws: WebSocket, queue_size: int):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: asyncio.Task = None
+        self.dropped = 0
+
+
+class WSManager:
+    """
+    Notification fan-out. Every connection has a bounded outbound queue drained
+    by its own writer task, so broadcast() only encodes the payload once and
+    enqueues it: a slow or half-dead dashboard never delays the caller or the
+    other clients.
+
+    Env: WS_QUEUE_SIZE (default 100 messages per client),
+         WS_SLOW_POLICY ("drop_oldest" default, or "disconnect") when a queue is full,
+         WS_HEARTBEAT_S (default 25): a {"type": "ping"} is sent after that much idle time.
+    """
+
+    def __init__(self):
+        self.queue_size = int(os.getenv("WS_QUEUE_SIZE", 100))
+        self.policy = os.getenv("WS_SLOW_POLICY", "drop_oldest")
+        self.heartbeat = float(os.getenv("WS_HEARTBEAT_S", 25))
+        self.clients: Dict[WebSocket, _Client] = {}
+        self.dropped = 0
+        self.disconnected_slow = 0
+
+    @property
+    def connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    async def connect(self, ws: WebSocket):
+        await ws.accept()
+        client = _Client(ws, self.queue_size)
+        client.task = asyncio.create_task(self._writer(client))
+        self.clients[ws] = client
+
+    def disconnect(self, ws: WebSocket):
+        client = self.clients.pop(ws, None)
+        if client is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    async def broadcast(self, payload: Dict[str, Any]):
+        # Serialise once (same encoding as send_json), then just enqueue
+        self.broadcast_text(json.dumps(payload, separators=(",", ":"), ensure_ascii=False))
+
+    def broadcast_text(self, text: str):
+        for client in list(self.clients.values()):
+            self._enqueue(client, text)
+
+    def send_text(self, ws: WebSocket, text: str):
+        client = self.clients.get(ws)
+        if client is not None:
+            self._enqueue(client, text)
+
+    def _enqueue(self, client: _Client, text: str):
+        try:
+            client.queue.put_nowait(text)
+            return
+        except asyncio.QueueFull:
+            pass
+        if self.policy == "disconnect":
+            self.disconnected_slow += 1
+            self.disconnect(client.ws)
+            asyncio.create_task(self._close(client.ws))
+            return
+        # drop_oldest: the dashboard refetches /notifications anyway
+        client.queue.get_nowait()
+        client.queue.put_nowait(text)
+        client.dropped += 1
+        self.dropped += 1
+
+    async def _writer(self, client: _Client):
+        while True:
+            try:
+                text = await asyncio.wait_for(client.queue.get(), timeout=self.heartbeat)
+            except asyncio.TimeoutError:
+                text = PING
+            try:
+                await client.ws.send_text(text)
+            except Exception:
+                # broken socket: drop it quietly
+                self.disconnect(client.ws)
+                return
+
+    @staticmethod
+    async def _close(ws: WebSocket):
+        try:
+            await ws.close(code=1008)
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self.clients),
+            "queued": sum(c.queue.qsize() for c in self.clients.values()),
+            "queue_size": self.queue_size,
+            "policy": self.policy,
+            "dropped": self.dropped,
+            "disconnected_slow": self.disconnected_slow,
+        }
@@ -0,0 +1,108 @@
+"""
+Concurrent write/read throughput of the SQLite storage profiles (legacy vs tuned).
+
+    cd backend && python -m benchmarks.bench_storage --seconds 5 --writers 4 --readers 4
+
+Writers insert one invoice per transaction (like an upload), readers run the
+/notifications listing query. Prints (or writes with --out) a JSON report.
+"""
+import argparse
+import json
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, select
+
+from app.db import LEGACY, TUNED, make_engine
+from app.main import Invoice, Notification
+
+
+def _seed(engine, rows: int):
+    with Session(engine) as sess:
+        for i in range(rows):
+            sess.add(Invoice(filename=f"seed_{i}.xml", due_date=date.today() + timedelta(days=i % 60)))
+            sess.add(Notification(kind="due_soon", message=f"seed {i}", invoice_id=i + 1))
+        sess.commit()
+
+
+def run_profile(name: str, profile, seconds: float, writers: int, readers: int, seed: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{Path(tmp) / 'bench.db'}", profile)
+        SQLModel.metadata.create_all(engine)
+        _seed(engine, seed)
+
+        counts = {"writes": 0, "reads": 0, "write_errors": 0, "read_errors": 0}
+        lock = threading.Lock()
+        stop = time.perf_counter() + seconds
+
+        def bump(key):
+            with lock:
+                counts[key] += 1
+
+        def writer(n):
+            i = 0
+            while time.perf_counter() < stop:
+                try:
+                    with Session(engine) as sess:
+                        sess.add(Invoice(filename=f"w{n}_{i}.xml", due_date=date.today()))
+                        sess.commit()
+                    bump("writes")
+                except OperationalError:
+                    bump("write_errors")  # "database is locked"
+                i += 1
+
+        def reader():
+            q = select(Notification).order_by(Notification.created_at.desc(), Notification.id.desc()).limit(50)
+            while time.perf_counter() < stop:
+                try:
+                    with Session(engine) as sess:
+                        sess.exec(q).all()
+                    bump("reads")
+                except OperationalError:
+                    bump("read_errors")
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        engine.dispose()
+
+    return {
+        "profile": name,
+        **counts,
+        "writes_per_s": round(counts["writes"] / seconds, 1),
+        "reads_per_s": round(counts["reads"] / seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=2000, help="rows preloaded in each table")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "params": vars(args),
+        "results": [
+            run_profile(name, profile, args.seconds, args.writers, args.readers, args.seed)
+            for name, profile in (("legacy", LEGACY), ("tuned", TUNED))
+        ],
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
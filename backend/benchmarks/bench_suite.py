@@ -0,0 +1,277 @@
+"""
+End-to-end benchmark suite on synthetic invoices (benchmarks.fattura_generator).
+
+    cd backend && python -m benchmarks.bench_suite --out bench.json
+    cd backend && python -m benchmarks.bench_suite --only parsers,ws --quick
+
+Sections:
+  parsers    every check_* function on small / medium / large invoices
+  endpoints  /check_* and upload endpoints through TestClient (fresh files and re-uploads;
+             /receipts/upload until its job is done)
+  scan       due-date events of N invoices: rebuild, then firing all of them at once
+  ws         WSManager broadcast to N clients until every queue is drained
+The app runs in a temporary directory with its own SQLite DB, files and caches.
+The JSON report carries the git commit so runs can be compared between commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from benchmarks.fattura_generator import generate_invoice
+
+SIZES = {
+    "small": {"lines": 2, "payments": 1, "attachment_kb": 0},
+    "medium": {"lines": 50, "payments": 3, "attachment_kb": 64},
+    "large": {"lines": 1000, "payments": 12, "attachment_kb": 1024},
+}
+SECTIONS = ("parsers", "endpoints", "scan", "ws")
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {
+        "n": repeat,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "ops_per_s": round(repeat / sum(samples), 1),
+    }
+
+
+def bench_parsers(repeat: int) -> Dict[str, Any]:
+    from scripts.check_data_fornitore_api import check_date_fornitore
+    from scripts.check_date_api import check_date
+    from scripts.check_importo_api import check_importo
+    from scripts.check_pagata_api import check_pagata
+    from scripts.fattura_extractor import extract_fattura
+
+    checks = {
+        "check_pagata": check_pagata,
+        "check_importo": check_importo,
+        "check_date": check_date,
+        "check_date_fornitore": check_date_fornitore,
+        "extract_fattura": extract_fattura,
+    }
+    results = {}
+    for size, spec in SIZES.items():
+        data = generate_invoice(1, **spec)
+        results[size] = {"bytes": len(data)}
+        for name, fn in checks.items():
+            results[size][name] = _timed(lambda: fn(data), repeat)
+    return results
+
+
+def bench_endpoints(client, files: int) -> Dict[str, Any]:
+    invoices = [generate_invoice(seq, **SIZES["medium"]) for seq in range(1, files + 1)]
+    results = {}
+
+    def post_each(path: str, offset: int):
+        for i, data in enumerate(invoices):
+            r = client.post(path, files={"file": (f"b{offset + i}.xml", data)})
+            assert r.status_code == 200, r.text
+
+    for path in ("/check_pagata", "/check_importo", "/check_data_emissione", "/check_data_scadenza", "/invoices/analyze"):
+        # first pass parses, the second one is served by the parse cache / dedup
+        results[path] = {
+            "fresh": _timed(lambda: post_each(path, 0), 1),
+            "repeat": _timed(lambda: post_each(path, 0), 1),
+        }
+        for run in results[path].values():
+            run["files_per_s"] = round(files / (run["mean_ms"] / 1000), 1)
+
+    # uploads need files the DB has not seen yet
+    batches = [
+        [generate_invoice(seq, **SIZES["small"]) for seq in range(start, start + files)]
+        for start in (10_000, 20_000)
+    ]
+    # 202 + job: accepted_s is the API latency, seconds runs until the job is done
+    start = time.perf_counter()
+    r = client.post("/receipts/upload", files=[("files", (f"r{i}.xml", d)) for i, d in enumerate(batches[0])])
+    assert r.status_code == 202, r.text
+    accepted = time.perf_counter() - start
+    while (job := client.get(r.json()["status_url"]).json())["status"] in ("queued", "running"):
+        time.sleep(0.01)
+    assert job["status"] == "done", job
+    elapsed = time.perf_counter() - start
+    results["/receipts/upload"] = {"files": files, "accepted_s": round(accepted, 3), "seconds": round(elapsed, 3),
+                                   "files_per_s": round(files / elapsed, 1)}
+
+    start = time.perf_counter()
+    r = client.post("/receipts/upload/batch", files=[("files", (f"b{i}.xml", d)) for i, d in enumerate(batches[1])])
+    assert r.status_code == 200 and '"done"' in r.text, r.text
+    elapsed = time.perf_counter() - start
+    results["/receipts/upload/batch"] = {"files": files, "seconds": round(elapsed, 3), "files_per_s": round(files / elapsed, 1)}
+    return results
+
+
+def bench_scan(invoices: int) -> Dict[str, Any]:
+    import app.main as app_main
+    from sqlalchemy import delete, insert
+    from sqlmodel import Session
+
+    today = datetime.now(app_main.TZ).date()
+    with Session(app_main.engine) as sess:
+        sess.execute(delete(app_main.NotificationLedger))
+        sess.execute(delete(app_main.DueEvent))
+        sess.execute(insert(app_main.Invoice), [
+            {
+                "filename": f"scan_{i}.xml",
+                "due_date": today + timedelta(days=i % 30),
+                "paid": i % 7 == 0,
+                "notified_5d": False,
+                "created_at": datetime.now(app_main.TZ),
+                "source": "invoice_xml",
+            }
+            for i in range(invoices)
+        ])
+        sess.commit()
+
+    start = time.perf_counter()
+    events = app_main.rebuild_due_events()
+    rebuild = time.perf_counter() - start
+    # as if the server came back after a month: every event is due
+    later = datetime.now(app_main.TZ) + timedelta(days=31)
+    start = time.perf_counter()
+    asyncio.run(app_main.fire_due_events_job(later))
+    first = time.perf_counter() - start
+    # idempotent: the second run finds nothing left to notify
+    start = time.perf_counter()
+    asyncio.run(app_main.fire_due_events_job(later))
+    second = time.perf_counter() - start
+    return {"invoices": invoices, "events": events, "rebuild_s": round(rebuild, 4),
+            "first_run_s": round(first, 4), "second_run_s": round(second, 4)}
+
+
+class _BenchSocket:
+    """Stand-in for a connected dashboard: counts what the writer task sends."""
+
+    def __init__(self):
+        self.received = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def bench_ws(clients: int, messages: int) -> Dict[str, Any]:
+    from app.ws import WSManager
+
+    async def run():
+        manager = WSManager()
+        sockets = [_BenchSocket() for _ in range(clients)]
+        for ws in sockets:
+            await manager.connect(ws)
+        payload = {"type": "due_soon", "id": 1, "message": "Fattura in scadenza", "invoice_id": 1}
+
+        start = time.perf_counter()
+        for i in range(messages):
+            await manager.broadcast({**payload, "id": i})
+        enqueue = time.perf_counter() - start
+        while sum(ws.received for ws in sockets) + manager.dropped < clients * messages:
+            await asyncio.sleep(0)
+        delivered = time.perf_counter() - start
+        stats = manager.stats()
+        for ws in sockets:
+            manager.disconnect(ws)
+        return {
+            "clients": clients,
+            "messages": messages,
+            "broadcast_ms": round(enqueue * 1000, 3),
+            "delivered_ms": round(delivered * 1000, 3),
+            "deliveries_per_s": round(clients * messages / delivered, 1),
+            "dropped": stats["dropped"],
+        }
+
+    return asyncio.run(run())
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=Path(__file__).parent, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(SECTIONS), help=f"comma separated subset of {','.join(SECTIONS)}")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per parser measurement")
+    parser.add_argument("--files", type=int, default=50, help="invoices per endpoint measurement")
+    parser.add_argument("--scan-invoices", type=int, default=20_000)
+    parser.add_argument("--ws-clients", type=int, default=200)
+    parser.add_argument("--ws-messages", type=int, default=50)
+    parser.add_argument("--quick", action="store_true", help="small sizes, for a smoke run")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.repeat, args.files, args.scan_invoices, args.ws_clients, args.ws_messages = 3, 5, 500, 10, 10
+    sections = [s for s in args.only.split(",") if s]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    out = Path(args.out).resolve() if args.out else None
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "params": vars(args),
+        "results": {},
+    }
+
+    backend = str(Path(__file__).resolve().parent.parent)
+    with tempfile.TemporaryDirectory() as tmp:
+        # the app keeps DB, files/ and caches relative to the working directory
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        sys.path.insert(0, backend)
+        os.environ.setdefault("OLLAMA_MODE", "stub")
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        try:
+            results = report["results"]
+            if "parsers" in sections:
+                results["parsers"] = bench_parsers(args.repeat)
+            if "endpoints" in sections or "scan" in sections:
+                from fastapi.testclient import TestClient
+                from app.main import app
+
+                with TestClient(app) as client:
+                    if "endpoints" in sections:
+                        results["endpoints"] = bench_endpoints(client, args.files)
+                    if "scan" in sections:
+                        results["scan"] = bench_scan(args.scan_invoices)
+            if "ws" in sections:
+                results["ws"] = bench_ws(args.ws_clients, args.ws_messages)
+        finally:
+            os.chdir(cwd)
+
+    text = json.dumps(report, indent=2)
+    if out:
+        out.write_text(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Synthetic FatturaPA (FPR12) invoices for the benchmarks.
+
+    cd backend && python -m benchmarks.fattura_generator --count 100 --lines 50 --out /tmp/fatture
+
+Same layout as the real exports in scripts/files: namespaced root, header
+with IdTrasmittente / CedentePrestatore / CessionarioCommittente (FORTUNY),
+N DettaglioLinee, one DatiRiepilogo per VAT rate, M DettaglioPagamento
+splitting the total, optionally a base64 PDF-like Allegati block.
+"""
+import argparse
+import base64
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Optional
+from xml.sax.saxutils import escape
+
+NS = "http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2"
+SUPPLIERS = ["FASTWEB SpA", "ENEL ENERGIA S.p.A.", "TIM S.p.A.", "A2A Energia S.p.A.", "Amazon EU S.a.r.l."]
+ITEMS = ["Canone mensile", "UltraFibra", "Business Class", "Energia F1", "Servizio assistenza", "Materiale ufficio"]
+VAT_RATES = [Decimal("22.00"), Decimal("10.00"), Decimal("4.00")]
+
+
+def _money(value: Decimal) -> str:
+    return str(value.quantize(Decimal("0.01")))
+
+
+def generate_invoice(
+    seq: int = 1,
+    lines: int = 10,
+    payments: int = 1,
+    attachment_kb: int = 0,
+    paid: bool = False,
+    due_date: Optional[date] = None,
+    issue_date: Optional[date] = None,
+    prefix: str = "ns3",
+    seed: Optional[int] = None,
+) -> bytes:
+    """One invoice as UTF-8 bytes; `seq` makes IdentificativoSdI / ProgressivoInvio unique."""
+    rnd = random.Random(seq if seed is None else seed)
+    issue_date = issue_date or date(2025, 1, 1) + timedelta(days=rnd.randrange(365))
+    due_date = due_date or issue_date + timedelta(days=30)
+    supplier = SUPPLIERS[seq % len(SUPPLIERS)]
+    vat_id = f"{10000000000 + seq % len(SUPPLIERS) * 1111111:011d}"
+    root = f"{prefix}:FatturaElettronica" if prefix else "FatturaElettronica"
+    xmlns = f'xmlns:{prefix}="{NS}"' if prefix else f'xmlns="{NS}"'
+
+    out = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>',
+        f'<{root} xmlns:ns2="http://www.w3.org/2000/09/xmldsig#" {xmlns} versione="FPR12">',
+        "<FatturaElettronicaHeader><DatiTrasmissione>",
+        f"<IdTrasmittente><IdPaese>IT</IdPaese><IdCodice>{vat_id}</IdCodice></IdTrasmittente>",
+        f"<ProgressivoInvio>{seq:06d}</ProgressivoInvio><FormatoTrasmissione>FPR12</FormatoTrasmissione>",
+        "<CodiceDestinatario>0000000</CodiceDestinatario></DatiTrasmissione>",
+        "<CedentePrestatore><DatiAnagrafici>",
+        f"<IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>{vat_id}</IdCodice></IdFiscaleIVA>",
+        f"<CodiceFiscale>{vat_id}</CodiceFiscale>",
+        f"<Anagrafica><Denominazione>{escape(supplier)}</Denominazione></Anagrafica>",
+        "<RegimeFiscale>RF01</RegimeFiscale></DatiAnagrafici>",
+        "<Sede><Indirizzo>Via Roma</Indirizzo><NumeroCivico>1</NumeroCivico><CAP>20100</CAP>"
+        "<Comune>MILANO</Comune><Provincia>MI</Provincia><Nazione>IT</Nazione></Sede></CedentePrestatore>",
+        "<CessionarioCommittente><DatiAnagrafici>",
+        "<IdFiscaleIVA><IdPaese>IT</IdPaese><IdCodice>02044470991</IdCodice></IdFiscaleIVA>",
+        "<Anagrafica><Denominazione>s.r.l FORTUNY S.R.L.</Denominazione></Anagrafica></DatiAnagrafici>",
+        "<Sede><Indirizzo>PZZ DEL MULINO A VENTO 18</Indirizzo><CAP>17028</CAP><Comune>SPOTORNO</Comune>"
+        "<Provincia>SV</Provincia><Nazione>IT</Nazione></Sede></CessionarioCommittente>",
+        "</FatturaElettronicaHeader>",
+        "<FatturaElettronicaBody>",
+    ]
+
+    detail = []
+    taxable = {}
+    for n in range(1, lines + 1):
+        rate = rnd.choice(VAT_RATES)
+        qty = Decimal(rnd.randint(1, 5))
+        price = Decimal(rnd.randint(100, 20000)) / 100
+        total = qty * price
+        taxable[rate] = taxable.get(rate, Decimal(0)) + total
+        detail.append(
+            f"<DettaglioLinee><NumeroLinea>{n}</NumeroLinea><Descrizione>{rnd.choice(ITEMS)}</Descrizione>"
+            f"<Quantita>{_money(qty)}</Quantita><DataInizioPeriodo>{issue_date}</DataInizioPeriodo>"
+            f"<DataFinePeriodo>{issue_date + timedelta(days=29)}</DataFinePeriodo>"
+            f"<PrezzoUnitario>{_money(price)}</PrezzoUnitario><PrezzoTotale>{_money(total)}</PrezzoTotale>"
+            f"<AliquotaIVA>{rate}</AliquotaIVA></DettaglioLinee>"
+        )
+    summary = []
+    grand_total = Decimal(0)
+    for rate, amount in sorted(taxable.items()):
+        amount = amount.quantize(Decimal("0.01"))
+        tax = (amount * rate / 100).quantize(Decimal("0.01"))
+        grand_total += amount + tax
+        summary.append(
+            f"<DatiRiepilogo><AliquotaIVA>{rate}</AliquotaIVA><ImponibileImporto>{amount}</ImponibileImporto>"
+            f"<Imposta>{tax}</Imposta><EsigibilitaIVA>I</EsigibilitaIVA></DatiRiepilogo>"
+        )
+
+    out += [
+        "<DatiGenerali><DatiGeneraliDocumento><TipoDocumento>TD01</TipoDocumento><Divisa>EUR</Divisa>",
+        f"<Data>{issue_date}</Data><Numero>B{seq:08d}</Numero>",
+        f"<ImportoTotaleDocumento>{_money(grand_total)}</ImportoTotaleDocumento>",
+        "</DatiGeneraliDocumento></DatiGenerali>",
+        "<DatiBeniServizi>", *detail, *summary, "</DatiBeniServizi>",
+        f"<DatiPagamento><CondizioniPagamento>{'TP02' if payments == 1 else 'TP01'}</CondizioniPagamento>",
+    ]
+
+    # split the total over the installments, the last one takes the rounding
+    payments = max(1, payments)
+    share = (grand_total / payments).quantize(Decimal("0.01"))
+    for n in range(payments):
+        amount = share if n < payments - 1 else grand_total - share * (payments - 1)
+        out.append(
+            f"<DettaglioPagamento><ModalitaPagamento>{'MP19' if paid else 'MP05'}</ModalitaPagamento>"
+            f"<DataRiferimentoTerminiPagamento>{issue_date}</DataRiferimentoTerminiPagamento>"
+            f"<DataScadenzaPagamento>{due_date + timedelta(days=30 * n)}</DataScadenzaPagamento>"
+            f"<ImportoPagamento>{_money(amount)}</ImportoPagamento></DettaglioPagamento>"
+        )
+    out.append("</DatiPagamento>")
+
+    if attachment_kb:
+        blob = base64.b64encode(rnd.randbytes(attachment_kb * 768)).decode()
+        out.append(
+            f"<Allegati><NomeAttachment>B{seq:08d}.PDF</NomeAttachment>"
+            f"<FormatoAttachment>PDF</FormatoAttachment><Attachment>{blob}</Attachment></Allegati>"
+        )
+    out += ["</FatturaElettronicaBody>", f"</{root}>"]
+    return "\n".join(out).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--lines", type=int, default=10, help="DettaglioLinee per invoice")
+    parser.add_argument("--payments", type=int, default=1, help="DettaglioPagamento per invoice")
+    parser.add_argument("--attachment-kb", type=int, default=0)
+    parser.add_argument("--paid-ratio", type=float, default=0.3, help="share of MP19 (paid) invoices")
+    parser.add_argument("--out", required=True, help="output directory")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    for seq in range(1, args.count + 1):
+        data = generate_invoice(
+            seq, args.lines, args.payments, args.attachment_kb,
+            paid=random.Random(seq).random() < args.paid_ratio,
+        )
+        (out / f"IT{seq:011d}_B{seq:05d}.xml").write_bytes(data)
+    print(f"{args.count} invoices written to {out}")
+
+
+if __name__ == "__main__":
+    main()
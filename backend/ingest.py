@@ -0,0 +1,229 @@
+"""
+Importazione in blocco di fatture XML / .p7m da una cartella o da un archivio ZIP.
+
+    cd backend && python ingest.py export_sdi.zip --workers 4 --chunk 500
+
+I file vengono letti uno alla volta (dallo ZIP senza estrarli su disco),
+analizzati in un pool di processi e salvati come 'receipt_upload' con una
+transazione per blocco di --chunk file. Dopo ogni blocco il nome dell'ultimo
+file salvato viene scritto nel file di checkpoint: rilanciando lo stesso
+comando l'importazione riprende dai file che lo seguono in ordine di nome
+(--restart per ricominciare da capo; i file già salvati risultano duplicati).
+
+Le notifiche delle fatture in scadenza passano dal bus come quelle dell'API:
+con l'API in esecuzione va usato NOTIFY_BUS=sqlite perché arrivino ai suoi
+WebSocket (restano comunque in /notifications).
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from scripts.check_date_api import date_payload
+from scripts.check_importo_api import importo_payload
+from scripts.fattura_extractor import extract_fattura
+from scripts.p7m import estrai_xml_p7m
+
+ESTENSIONI = (".xml", ".p7m")
+
+
+def elenca_file(sorgente: str) -> Tuple[List[str], "zipfile.ZipFile | None"]:
+    """Nomi dei file da importare, in ordine stabile (serve al checkpoint)"""
+    if zipfile.is_zipfile(sorgente):
+        archivio = zipfile.ZipFile(sorgente)
+        nomi = [i.filename for i in archivio.infolist() if not i.is_dir() and i.filename.lower().endswith(ESTENSIONI)]
+        return sorted(nomi), archivio
+    nomi = []
+    for cartella, _, files in os.walk(sorgente):
+        for f in files:
+            if f.lower().endswith(ESTENSIONI):
+                nomi.append(os.path.relpath(os.path.join(cartella, f), sorgente))
+    return sorted(nomi), None
+
+
+def leggi_file(sorgente: str, nomi: List[str], archivio) -> Iterator[Tuple[str, bytes]]:
+    for nome in nomi:
+        if archivio is not None:
+            data = archivio.read(nome)
+        else:
+            with open(os.path.join(sorgente, nome), "rb") as f:
+                data = f.read()
+        yield nome, data
+
+
+def analizza(nome: str, data: bytes):
+    """Eseguita nel pool di processi: ritorna (nome, xml, sha256, info) oppure (nome, None, None, errore)"""
+    try:
+        xml = estrai_xml_p7m(data) if nome.lower().endswith(".p7m") else data
+        return nome, xml, hashlib.sha256(xml).hexdigest(), extract_fattura(xml, nome=os.path.basename(nome))
+    except Exception as e:
+        return nome, None, None, str(e)
+
+
+def in_ordine(pool: ProcessPoolExecutor, files: Iterator[Tuple[str, bytes]], finestra: int):
+    """Come pool.map ma con al massimo `finestra` file in memoria"""
+    in_corso = []
+    for nome, data in files:
+        in_corso.append(pool.submit(analizza, nome, data))
+        if len(in_corso) >= finestra:
+            yield in_corso.pop(0).result()
+    for fut in in_corso:
+        yield fut.result()
+
+
+def carica_checkpoint(percorso: str, sorgente: str) -> dict:
+    if os.path.exists(percorso):
+        with open(percorso) as f:
+            stato = json.load(f)
+        if stato.get("source") == os.path.abspath(sorgente):
+            return stato
+    return {"source": os.path.abspath(sorgente), "last": None, "done": 0, "ok": 0, "duplicates": 0, "errors": 0}
+
+
+def salva_checkpoint(percorso: str, stato: dict):
+    # scrittura atomica: un'interruzione a metà non corrompe il checkpoint
+    tmp = percorso + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(stato, f)
+    os.replace(tmp, percorso)
+
+
+def da_riprendere(nomi: List[str], stato: dict) -> List[str]:
+    """I file (ordinati) che seguono l'ultimo salvato: il checkpoint vale anche se la sorgente cambia"""
+    ultimo = stato["last"]
+    if ultimo is None:
+        return nomi
+    return nomi[bisect.bisect_right(nomi, ultimo):]
+
+
+def salva_blocco(risultati: list, stato: dict, main) -> List[str]:
+    """
+    Una transazione per blocco: scarta i duplicati, salva il resto e pubblica
+    sul bus le notifiche delle nuove fatture in scadenza. Ritorna gli errori.
+    """
+    oggi = datetime.now(main.TZ).date()
+    errori = []
+    validi = []
+    for nome, xml, digest, info in risultati:
+        if xml is None:
+            errori.append(f"{nome}: {info}")
+            continue
+        try:
+            due = main.parse_due_date(date_payload(info))
+        except Exception as e:
+            errori.append(f"{nome}: {e}")
+            continue
+        validi.append((os.path.basename(nome), xml, due, digest, info.id_sdi, importo_payload(info)["importo"],
+                       info.nome_fornitore, main.supplier_ref(info)))
+
+    esistenti = main.find_invoices([item[3] for item in validi]) if validi else {}
+    nuovi = {}
+    for item in validi:
+        if item[3] not in esistenti:
+            nuovi.setdefault(item[3], item)
+    # importi assenti dall'XML: un solo lotto di richieste al modello
+    senza_importo = [digest for digest, item in nuovi.items() if item[5] is None]
+    if senza_importo:
+        stime = main.guess_amounts([nuovi[digest][1] for digest in senza_importo])
+        for digest, stima in zip(senza_importo, stime):
+            if stima:
+                nuovi[digest] = nuovi[digest][:5] + (stima,) + nuovi[digest][6:]
+    if nuovi:
+        righe, notifiche = main.store_receipts(list(nuovi.values()), oggi)
+        if notifiche:
+            try:
+                asyncio.run(main.bus.publish({"type": "batch", "notifications": notifiche}))
+            except Exception as e:
+                # le fatture sono salvate: le notifiche restano in /notifications
+                print(f"⚠️  Notifiche non pubblicate sul bus: {e}")
+        stato["duplicates"] += sum(1 for r in righe if r["duplicate"])
+        stato["ok"] += sum(1 for r in righe if not r["duplicate"])
+    stato["duplicates"] += len(validi) - len(nuovi)
+    stato["errors"] += len(errori)
+    return errori
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Importa fatture XML/.p7m da una cartella o da uno ZIP")
+    parser.add_argument("sorgente", help="cartella o archivio .zip")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processi di parsing")
+    parser.add_argument("--chunk", type=int, default=500, help="file per transazione")
+    parser.add_argument("--checkpoint", help="file di checkpoint (default: <sorgente>.ingest.json)")
+    parser.add_argument("--restart", action="store_true", help="ignora il checkpoint e ricomincia")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.sorgente):
+        print(f"❌ Sorgente non trovata: {args.sorgente}")
+        return 1
+
+    # importato qui: i processi del pool non hanno bisogno dell'app
+    import app.main as app_main
+    app_main.prepare_storage()
+    app_main.migrate_db()
+
+    checkpoint = args.checkpoint or os.path.abspath(args.sorgente).rstrip(os.sep) + ".ingest.json"
+    stato = carica_checkpoint(checkpoint, args.sorgente)
+    if args.restart:
+        stato.update(last=None, done=0, ok=0, duplicates=0, errors=0)
+
+    nomi, archivio = elenca_file(args.sorgente)
+    totale = len(nomi)
+    da_fare = da_riprendere(nomi, stato)
+    if len(da_fare) < totale:
+        print(f"↪️  Ripresa: restano {len(da_fare)} file su {totale}")
+
+    chunk = max(1, args.chunk)
+    inizio = time.perf_counter()
+    elaborati = 0
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            blocco = []
+            for risultato in in_ordine(pool, leggi_file(args.sorgente, da_fare, archivio), args.workers * 4):
+                blocco.append(risultato)
+                if len(blocco) < chunk:
+                    continue
+                elaborati += _chiudi_blocco(blocco, stato, app_main, checkpoint)
+                blocco = []
+                _progresso(stato, totale, elaborati, inizio)
+            if blocco:
+                elaborati += _chiudi_blocco(blocco, stato, app_main, checkpoint)
+    except KeyboardInterrupt:
+        print(f"\n⏸️  Interrotto: {stato['done']}/{totale} salvati, rilancia per riprendere")
+        return 130
+    finally:
+        if archivio is not None:
+            archivio.close()
+
+    _progresso(stato, totale, elaborati, inizio)
+    print(f"✅ Importazione completata ({checkpoint})")
+    return 0
+
+
+def _chiudi_blocco(blocco: list, stato: dict, app_main, checkpoint: str) -> int:
+    for errore in salva_blocco(blocco, stato, app_main):
+        print(f"⚠️  {errore}")
+    stato["done"] += len(blocco)
+    stato["last"] = blocco[-1][0]
+    salva_checkpoint(checkpoint, stato)
+    return len(blocco)
+
+
+def _progresso(stato: dict, totale: int, elaborati: int, inizio: float):
+    secondi = time.perf_counter() - inizio
+    velocita = elaborati / secondi if secondi > 0 else 0.0
+    print(
+        f"[{stato['done']}/{totale}] {velocita:.1f} file/s "
+        f"(nuove {stato['ok']}, duplicati {stato['duplicates']}, errori {stato['errors']})"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
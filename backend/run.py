@@ -1,5 +1,5 @@
 import uvicorn
-from app.main import app
+# the app is imported by the worker from "app.main:app": the reloader process does not need it
 
 if __name__ == "__main__":
   uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,9 +1,19 @@
-import xml.etree.ElementTree as ET
+from scripts.fattura_extractor import FatturaInfo, XmlSource, extract_fattura, is_path
 import os
+from typing import Optional
 
-def check_date_fornitore(xml_file: str):
+def fornitore_payload(info: FatturaInfo):
+    """Payload per frontend a partire dal risultato dell'estrattore"""
+    return {
+        "status": "ok",
+        "file": info.file,
+        "data_emissione": info.data_emissione,
+        "fornitore": info.fornitore
+    }
+
+def check_date_fornitore(xml_file: XmlSource, nome: Optional[str] = None):
     """Controlla il fornitore e la data di emissione da un file XML di fattura"""
-    if not os.path.exists(xml_file):
+    if is_path(xml_file) and not os.path.exists(xml_file):
         return {
             "status": "error",
             "message": f"File {xml_file} non trovato",
@@ -12,47 +22,5 @@ def check_date_fornitore(xml_file: str):
             "fornitore": None
         }
 
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
-
-    data = None
-    fornitore = None
-
-    # Cerca <Anagrafica>
-    for anagrafica in root.iter():
-        if anagrafica.tag.lower().endswith("anagrafica"):
-            denominazione_trovata = False
-            for child in anagrafica:
-                tag_name = child.tag.lower()
-                valore = (child.text or "").strip()
-
-                if not valore:
-                    continue
-
-                if tag_name.endswith("denominazione"):
-                    denominazione_trovata = True
-                    if "FORTUNY" not in valore.upper():
-                        fornitore = valore
-                else:
-                    # Se non c'è denominazione, prendiamo altri valori (se non contengono Fortuny)
-                    if not denominazione_trovata and "FORTUNY" not in valore.upper():
-                        # Se ci sono più valori concatenali
-                        if fornitore:
-                            fornitore += " " + valore
-                        else:
-                            fornitore = valore
-
-    # Cerca <Data> → la prima trovata
-    for elem in root.iter():
-        if elem.tag.lower().endswith("data"):
-            if elem.text and elem.text.strip():
-                data = elem.text.strip()
-                break
-
     # Payload pensato per il frontend
-    return {
-        "status": "ok",
-        "file": os.path.basename(xml_file),
-        "data_emissione": data,
-        "fornitore": fornitore
-    }
+    return fornitore_payload(extract_fattura(xml_file, campi=("fornitore", "data_emissione"), nome=nome))
@@ -1,9 +1,21 @@
-import xml.etree.ElementTree as ET
+from scripts.fattura_extractor import FatturaInfo, XmlSource, extract_fattura, is_path
 import os
+from typing import Optional
 
-def check_date(xml_file: str):
+def date_payload(info: FatturaInfo):
+    """Payload per frontend a partire dal risultato dell'estrattore"""
+    # tag assente o ultimo tag vuoto -> da verificare
+    data = info.data_scadenza if info.scadenza_trovata and info.data_scadenza else "Da verificare"
+
+    return {
+        "status": "ok",
+        "file": info.file,
+        "data_scadenza": data
+    }
+
+def check_date(xml_file: XmlSource, nome: Optional[str] = None):
     """Controlla se nel file XML compaiono i tag DataScadenzaPagamento e prepara payload per frontend"""
-    if not os.path.exists(xml_file):
+    if is_path(xml_file) and not os.path.exists(xml_file):
         return {
             "status": "error",
             "message": f"File {xml_file} non trovato",
@@ -11,28 +23,5 @@ def check_date(xml_file: str):
             "data_scadenza": None,
         }
 
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
-
-    data = None
-    found = False
-    for elem in root.iter():
-        if elem.tag.lower().endswith("datascadenzapagamento".lower()):
-            found = True
-            if elem.text and elem.text.strip():
-                data = elem.text.strip()
-            else:
-                data = "Da verificare"
-
-    # se non abbiamo trovato nessun tag
-    if not found:
-        data = "Da verificare"
-
-
-
     # Payload pensato per il frontend
-    return {
-        "status": "ok",
-        "file": os.path.basename(xml_file),
-        "data_scadenza": data
-    }
+    return date_payload(extract_fattura(xml_file, campi=("data_scadenza",), nome=nome))
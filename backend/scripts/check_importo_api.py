@@ -1,10 +1,47 @@
-import xml.etree.ElementTree as ET
-from utils.ollama_utils import deduci_importo_ai
+from scripts.fattura_extractor import FatturaInfo, XmlSource, extract_fattura, is_path
 import os
+from decimal import Decimal, InvalidOperation
+from typing import Optional, Tuple
 
-def check_importo(xml_file: str):
-    """Controlla se nel file XML compaiono 'MP09' o 'MP19' e prepara payload per frontend"""
-    if not os.path.exists(xml_file):
+def importo_deterministico(info: FatturaInfo) -> Tuple[Optional[float], Optional[str]]:
+    """Importo letto dall'XML e tag da cui proviene, in ordine di affidabilità"""
+    if info.importo_totale is not None:
+        try:
+            return float(Decimal(info.importo_totale)), "ImportoTotaleDocumento"
+        except InvalidOperation:
+            pass
+    if info.importo_pagamenti is not None:
+        return float(info.importo_pagamenti), "ImportoPagamento"
+    if info.importo_riepilogo is not None:
+        return float(info.importo_riepilogo), "DatiRiepilogo"
+    return None, None
+
+def importo_payload(info: FatturaInfo):
+    """Payload per frontend a partire dal risultato dell'estrattore"""
+    importo, fonte = importo_deterministico(info)
+
+    return {
+        "status": "ok",
+        "file": info.file,
+        "importo": importo,
+        "fonte_importo": fonte
+    }
+
+def _contenuto(xml_file: XmlSource) -> Optional[bytes]:
+    # Testo grezzo per il modello: percorso, bytes o file riavvolgibile
+    if isinstance(xml_file, (bytes, bytearray, memoryview)):
+        return bytes(xml_file)
+    if is_path(xml_file):
+        with open(xml_file, "rb") as f:
+            return f.read()
+    if xml_file.seekable():
+        xml_file.seek(0)
+        return xml_file.read()
+    return None
+
+def check_importo(xml_file: XmlSource, nome: Optional[str] = None):
+    """Legge l'importo dall'XML; solo se manca lo chiede al modello (deduci_importo_ai)"""
+    if is_path(xml_file) and not os.path.exists(xml_file):
         return {
             "status": "error",
             "message": f"File {xml_file} non trovato",
@@ -12,18 +49,14 @@ def check_importo(xml_file: str):
             "importo": None
         }
 
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
-
-
-    
-    importo = 10
-
-
     # Payload pensato per il frontend
-    return {
-        "status": "ok",
-        "file": os.path.basename(xml_file),
-        "importo": importo
-    }
-    
+    payload = importo_payload(extract_fattura(xml_file, campi=("importo",), nome=nome))
+    if payload["importo"] is None:
+        # importato solo qui: il client del modello serve di rado
+        from utils.ollama_utils import deduci_importo_ai
+        contenuto = _contenuto(xml_file)
+        importo = deduci_importo_ai(contenuto) if contenuto else 0.0
+        if importo:
+            payload["importo"] = importo
+            payload["fonte_importo"] = "ai"
+    return payload
@@ -1,9 +1,22 @@
-import xml.etree.ElementTree as ET
 import os
+from typing import Optional
+from scripts.fattura_extractor import FatturaInfo, XmlSource, extract_fattura, is_path
 
-def check_pagata(xml_file: str):
+def pagata_payload(info: FatturaInfo):
+    """Payload per frontend a partire dal risultato dell'estrattore"""
+    pagata = info.pagata
+    return {
+        "status": "ok",
+        "file": info.file,
+        "pagata": pagata,
+        "label": "Pagata" if pagata else "Non pagata",
+        "color": "green" if pagata else "red",  # utile per badge frontend
+        "dettagli": list(info.dettagli_pagata)
+    }
+
+def check_pagata(xml_file: XmlSource, nome: Optional[str] = None):
     """Controlla se nel file XML compaiono 'MP09' o 'MP19' e prepara payload per frontend"""
-    if not os.path.exists(xml_file):
+    if is_path(xml_file) and not os.path.exists(xml_file):
         return {
             "status": "error",
             "message": f"File {xml_file} non trovato",
@@ -12,26 +25,5 @@ def check_pagata(xml_file: str):
             "dettagli": []
         }
 
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
-    found = []
-
-    for elem in root.iter():
-        text = elem.text or ""
-        if "MP09" in text or "MP19" in text:
-            found.append(text.strip())
-        for val in elem.attrib.values():
-            if "MP09" in val or "MP19" in val:
-                found.append(str(elem.attrib))
-
-    pagata = len(found) > 0
-
     # Payload pensato per il frontend
-    return {
-        "status": "ok",
-        "file": os.path.basename(xml_file),
-        "pagata": pagata,
-        "label": "Pagata" if pagata else "Non pagata",
-        "color": "green" if pagata else "red",  # utile per badge frontend
-        "dettagli": found
-    }
+    return pagata_payload(extract_fattura(xml_file, campi=("pagata",), nome=nome))
@@ -0,0 +1,331 @@
+import xml.etree.ElementTree as ET
+import os
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import BinaryIO, Dict, FrozenSet, Iterable, Iterator, List, Optional, Union
+
+# Sorgenti accettate: percorso, contenuto in memoria o file binario già aperto
+XmlSource = Union[str, "os.PathLike[str]", bytes, bytearray, memoryview, BinaryIO]
+
+# Versione dell'estrazione: va incrementata quando cambia ciò che extract_fattura
+# restituisce, così i risultati salvati in cache con la versione precedente non valgono più
+EXTRACTOR_VERSION = 5
+
+# Dimensione dei blocchi passati al parser
+_CHUNK = 64 * 1024
+
+# Apertura di <Attachment> (con o senza prefisso): il testo che segue è il PDF
+# in base64, non contiene mai '<' e arriva fino al tag di chiusura
+_APERTURA_ATTACHMENT = re.compile(rb"<(?:[\w.-]+:)?Attachment(?:\s[^<>]*)?>")
+# Byte tenuti da un blocco al successivo: un tag <Attachment> può essere spezzato a metà
+_CODA = 64
+
+# Campi estraibili da una singola passata sul file
+CAMPI = frozenset({"pagata", "data_scadenza", "importo", "fornitore", "data_emissione", "id_sdi"})
+
+# Campi che non cambiano più una volta trovati: se sono gli unici richiesti
+# possiamo interrompere la lettura del file
+_CAMPI_DEFINITIVI = frozenset({"data_emissione"})
+
+# Tipi di tag che ci interessano (classificati per nome locale, come facevano i check_*)
+_ALTRO = 0
+_ANAGRAFICA = 1
+_SCADENZA = 2
+_DATA = 3
+_IMPORTO = 4
+_ID_SDI = 5
+_ID_TRASMITTENTE = 6
+_PROGRESSIVO = 7
+_IMPORTO_PAGAMENTO = 8
+_IMPONIBILE = 9
+_IMPOSTA = 10
+_ID_FISCALE = 11
+_CODICE_FISCALE = 12
+_DATI_ANAGRAFICI = 13
+_CEDENTE = 14
+
+# Cache tag completo (con namespace) -> tipo, i tag si ripetono in ogni fattura
+_tipi_tag: Dict[str, int] = {}
+
+
+def _tipo_tag(tag: str) -> int:
+    tipo = _tipi_tag.get(tag)
+    if tipo is None:
+        nome = tag.lower()
+        if nome.endswith("anagrafica"):
+            tipo = _ANAGRAFICA
+        elif nome.endswith("datascadenzapagamento"):
+            tipo = _SCADENZA
+        elif nome.endswith("data"):
+            tipo = _DATA
+        elif nome.endswith("importototaledocumento"):
+            tipo = _IMPORTO
+        elif nome.endswith("identificativosdi"):
+            tipo = _ID_SDI
+        elif nome.endswith("idtrasmittente"):
+            tipo = _ID_TRASMITTENTE
+        elif nome.endswith("progressivoinvio"):
+            tipo = _PROGRESSIVO
+        elif nome.endswith("importopagamento"):
+            tipo = _IMPORTO_PAGAMENTO
+        elif nome.endswith("imponibileimporto"):
+            tipo = _IMPONIBILE
+        elif nome.endswith("imposta"):
+            tipo = _IMPOSTA
+        elif nome.endswith("idfiscaleiva"):
+            tipo = _ID_FISCALE
+        elif nome.endswith("codicefiscale"):
+            tipo = _CODICE_FISCALE
+        elif nome.endswith("datianagrafici"):
+            tipo = _DATI_ANAGRAFICI
+        elif nome.endswith("cedenteprestatore"):
+            tipo = _CEDENTE
+        else:
+            tipo = _ALTRO
+        _tipi_tag[tag] = tipo
+    return tipo
+
+
+@dataclass(slots=True)
+class FatturaInfo:
+    """Risultato compatto dell'estrazione di una fattura FatturaPA"""
+    file: str
+    # Testi/attributi che contengono MP09 o MP19, in ordine di documento
+    dettagli_pagata: List[str] = field(default_factory=list)
+    # True se compare almeno un tag DataScadenzaPagamento
+    scadenza_trovata: bool = False
+    # Testo dell'ultima DataScadenzaPagamento (None se vuota)
+    data_scadenza: Optional[str] = None
+    # Primo ImportoTotaleDocumento, come testo
+    importo_totale: Optional[str] = None
+    # Somme di DettaglioPagamento/ImportoPagamento e di DatiRiepilogo (imponibile + imposta)
+    importo_pagamenti: Optional[Decimal] = None
+    importo_riepilogo: Optional[Decimal] = None
+    fornitore: Optional[str] = None
+    # Partita IVA (IdPaese + IdCodice) o, in mancanza, codice fiscale del
+    # CedentePrestatore, e la sua Denominazione (o Nome Cognome)
+    id_fornitore: Optional[str] = None
+    nome_fornitore: Optional[str] = None
+    data_emissione: Optional[str] = None
+    # IdentificativoSdI se presente, altrimenti <IdTrasmittente>_<ProgressivoInvio>
+    id_sdi: Optional[str] = None
+
+    @property
+    def pagata(self) -> bool:
+        return len(self.dettagli_pagata) > 0
+
+
+def _aggiorna_fornitore(anagrafica: ET.Element, fornitore: Optional[str]) -> Optional[str]:
+    # Stessa logica storica di check_date_fornitore: la Denominazione vince,
+    # altrimenti si concatenano gli altri valori (esclusa FORTUNY)
+    denominazione_trovata = False
+    for child in anagrafica:
+        valore = (child.text or "").strip()
+        if not valore:
+            continue
+
+        if child.tag.lower().endswith("denominazione"):
+            denominazione_trovata = True
+            if "FORTUNY" not in valore.upper():
+                fornitore = valore
+        elif not denominazione_trovata and "FORTUNY" not in valore.upper():
+            if fornitore:
+                fornitore += " " + valore
+            else:
+                fornitore = valore
+    return fornitore
+
+
+def _nome_anagrafica(anagrafica: ET.Element) -> Optional[str]:
+    # Denominazione, oppure Nome Cognome della persona fisica
+    valori = {}
+    for child in anagrafica:
+        valore = (child.text or "").strip()
+        if valore:
+            valori[child.tag.rsplit("}", 1)[-1].lower()] = valore
+    if "denominazione" in valori:
+        return valori["denominazione"]
+    nome = " ".join(v for v in (valori.get("nome"), valori.get("cognome")) if v)
+    return nome or None
+
+
+def _somma(totale: Optional[Decimal], text: Optional[str]) -> Optional[Decimal]:
+    try:
+        valore = Decimal(text.strip())
+    except (AttributeError, InvalidOperation):
+        return totale
+    return valore if totale is None else totale + valore
+
+
+def is_path(xml_file: XmlSource) -> bool:
+    return isinstance(xml_file, (str, os.PathLike))
+
+
+def _blocchi(xml_file: XmlSource) -> Iterator[bytes]:
+    if isinstance(xml_file, (bytes, bytearray, memoryview)):
+        # niente copie: il parser accetta direttamente le slice della memoryview
+        buf = memoryview(xml_file)
+        for i in range(0, len(buf), _CHUNK):
+            yield buf[i:i + _CHUNK]
+    elif is_path(xml_file):
+        with open(xml_file, "rb") as f:
+            yield from iter(lambda: f.read(_CHUNK), b"")
+    else:
+        yield from iter(lambda: xml_file.read(_CHUNK), b"")
+
+
+def _senza_allegati(blocchi: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Scarta il testo degli elementi <Attachment> mentre i blocchi passano:
+    il parser riceve l'elemento vuoto e l'allegato non viene mai tenuto in memoria.
+    """
+    dentro = False
+    resto = b""
+    for blocco in blocchi:
+        buf = resto + bytes(blocco)
+        resto = b""
+        pos = 0
+        while pos < len(buf):
+            if dentro:
+                fine = buf.find(b"<", pos)
+                if fine == -1:
+                    break  # tutto il blocco è testo dell'allegato
+                dentro = False
+                pos = fine
+            m = _APERTURA_ATTACHMENT.search(buf, pos)
+            if m is None:
+                # un tag aperto in fondo al blocco potrebbe essere <Attachment>
+                taglio = buf.rfind(b"<", max(pos, len(buf) - _CODA))
+                if taglio != -1 and b">" not in buf[taglio:]:
+                    resto = buf[taglio:]
+                    buf = buf[:taglio]
+                if pos < len(buf):
+                    yield buf[pos:]
+                break
+            yield buf[pos:m.end()]
+            pos = m.end()
+            dentro = True
+    if resto:
+        yield resto
+
+
+def _elementi(xml_file: XmlSource, allegati: bool = False) -> Iterator[ET.Element]:
+    # Equivalente di ET.iterparse(..., events=("end",)) ma per qualsiasi sorgente
+    parser = ET.XMLPullParser(events=("end",))
+    blocchi = _blocchi(xml_file) if allegati else _senza_allegati(_blocchi(xml_file))
+    for blocco in blocchi:
+        parser.feed(blocco)
+        for _, elem in parser.read_events():
+            yield elem
+    parser.close()
+    for _, elem in parser.read_events():
+        yield elem
+
+
+def extract_fattura(
+    xml_file: XmlSource,
+    campi: Optional[Iterable[str]] = None,
+    nome: Optional[str] = None,
+    allegati: bool = False,
+) -> FatturaInfo:
+    """
+    Legge la fattura XML in un'unica passata (iterparse) ed estrae tutti i campi
+    usati dai check_*: MP09/MP19, DataScadenzaPagamento, importi
+    (ImportoTotaleDocumento, ImportoPagamento, DatiRiepilogo), fornitore
+    (Anagrafica; partita IVA e nome solo dai DatiAnagrafici del
+    CedentePrestatore), data di emissione (primo <Data>) e identificativo SdI.
+    `xml_file` può essere un percorso, bytes/memoryview o un file binario già
+    aperto (es. l'upload di FastAPI); `nome` sovrascrive il nome file riportato.
+    Con `campi` si limita l'estrazione; se restano solo campi definitivi
+    la lettura si ferma appena sono stati trovati.
+    Il testo degli <Attachment> (PDF in base64, anche di molti MB) viene
+    scartato in lettura, così la memoria usata non dipende dagli allegati;
+    `allegati=True` lo passa comunque al parser.
+    """
+    richiesti: FrozenSet[str] = CAMPI if campi is None else frozenset(campi)
+    pagata = "pagata" in richiesti
+    scadenza = "data_scadenza" in richiesti
+    importo = "importo" in richiesti
+    fornitore = "fornitore" in richiesti
+    emissione = "data_emissione" in richiesti
+    id_sdi = "id_sdi" in richiesti
+    trasmittente = progressivo = None
+    # identificativi e nome dei DatiAnagrafici in corso, poi quelli dell'ultimo
+    # DatiAnagrafici chiuso: se il padre è il CedentePrestatore sono del fornitore
+    partita_iva = codice_fiscale = nome_anagrafica = None
+    anagrafica_chiusa = None
+    stop_anticipato = richiesti <= _CAMPI_DEFINITIVI
+
+    if nome is None:
+        nome = os.path.basename(xml_file) if is_path(xml_file) else "invoice.xml"
+    info = FatturaInfo(file=nome)
+    found = info.dettagli_pagata
+
+    for elem in _elementi(xml_file, allegati):
+        tipo = _tipo_tag(elem.tag)
+        text = elem.text
+
+        if pagata:
+            if text and ("MP09" in text or "MP19" in text):
+                found.append(text.strip())
+            if elem.attrib:
+                for val in elem.attrib.values():
+                    if "MP09" in val or "MP19" in val:
+                        found.append(str(elem.attrib))
+
+        if tipo == _ANAGRAFICA:
+            if fornitore:
+                info.fornitore = _aggiorna_fornitore(elem, info.fornitore)
+                nome_anagrafica = _nome_anagrafica(elem)
+        elif tipo == _DATI_ANAGRAFICI:
+            if fornitore:
+                anagrafica_chiusa = (partita_iva or codice_fiscale, nome_anagrafica)
+                partita_iva = codice_fiscale = nome_anagrafica = None
+        elif tipo == _CEDENTE:
+            if fornitore and anagrafica_chiusa is not None and info.id_fornitore is None:
+                info.id_fornitore, info.nome_fornitore = anagrafica_chiusa
+            anagrafica_chiusa = None
+        elif tipo == _ID_FISCALE:
+            if fornitore:
+                partita_iva = "".join((child.text or "").strip() for child in elem).upper() or None
+        elif tipo == _CODICE_FISCALE:
+            if fornitore and text and text.strip():
+                codice_fiscale = text.strip().upper()
+        elif tipo == _SCADENZA:
+            if scadenza:
+                info.scadenza_trovata = True
+                info.data_scadenza = text.strip() if text and text.strip() else None
+        elif tipo == _DATA:
+            if emissione and info.data_emissione is None and text and text.strip():
+                info.data_emissione = text.strip()
+                if stop_anticipato:
+                    break
+        elif tipo == _IMPORTO:
+            if importo and info.importo_totale is None and text and text.strip():
+                info.importo_totale = text.strip()
+        elif tipo == _IMPORTO_PAGAMENTO:
+            if importo:
+                info.importo_pagamenti = _somma(info.importo_pagamenti, text)
+        elif tipo == _IMPONIBILE or tipo == _IMPOSTA:
+            if importo:
+                info.importo_riepilogo = _somma(info.importo_riepilogo, text)
+        elif id_sdi and tipo != _ALTRO:
+            if tipo == _ID_SDI:
+                if text and text.strip():
+                    info.id_sdi = text.strip()
+            elif tipo == _ID_TRASMITTENTE:
+                # IdPaese + IdCodice, ancora attaccati al padre
+                trasmittente = "".join((child.text or "").strip() for child in elem)
+            elif text and text.strip():
+                progressivo = text.strip()
+
+        # Libera i sottoalberi già visitati (le foglie restano al padre finché
+        # non si chiude, così l'Anagrafica arriva completa)
+        if len(elem):
+            elem.clear()
+
+    if info.id_sdi is None and trasmittente and progressivo:
+        info.id_sdi = f"{trasmittente}_{progressivo}"
+
+    return info
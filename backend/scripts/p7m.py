@@ -0,0 +1,91 @@
+import base64
+import binascii
+from typing import Iterator, Tuple
+
+# Tag ASN.1 che ci servono: OCTET STRING (primitivo o costruito)
+_OCTET_STRING = 0x04
+_OCTET_STRING_COSTRUITO = 0x24
+
+
+def _leggi_tlv(data: bytes, pos: int, fine: int) -> Tuple[int, int, int, int]:
+    """Ritorna (tag, inizio contenuto, fine contenuto o -1 se lunghezza indefinita, prossima posizione)"""
+    tag = data[pos]
+    pos += 1
+    if tag & 0x1F == 0x1F:
+        # tag in forma lunga: non ci interessa, ma va saltato correttamente
+        while data[pos] & 0x80:
+            pos += 1
+        pos += 1
+    lung = data[pos]
+    pos += 1
+    if lung == 0x80:
+        return tag, pos, -1, pos
+    if lung & 0x80:
+        n = lung & 0x7F
+        lung = int.from_bytes(data[pos:pos + n], "big")
+        pos += n
+    if pos + lung > fine:
+        raise ValueError("struttura ASN.1 troncata")
+    return tag, pos, pos + lung, pos + lung
+
+
+def _octet_strings(data: bytes, pos: int, fine: int) -> Iterator[bytes]:
+    """Visita la struttura e restituisce il contenuto di ogni OCTET STRING"""
+    pila = [(pos, fine)]
+    while pila:
+        pos, fine = pila.pop()
+        while pos < fine:
+            if data[pos] == 0 and pos + 1 < fine and data[pos + 1] == 0:
+                # fine contenuto di una lunghezza indefinita
+                pos += 2
+                continue
+            tag, inizio, fine_contenuto, pos = _leggi_tlv(data, pos, fine)
+            if tag == _OCTET_STRING_COSTRUITO:
+                # firmato in streaming: il documento è spezzato in più OCTET STRING
+                pezzi = []
+                sotto = inizio
+                limite = fine_contenuto if fine_contenuto != -1 else fine
+                while sotto < limite:
+                    if data[sotto] == 0 and data[sotto + 1] == 0:
+                        sotto += 2
+                        break
+                    _, i, f, sotto = _leggi_tlv(data, sotto, limite)
+                    pezzi.append(data[i:f])
+                yield b"".join(pezzi)
+                pos = sotto
+            elif tag == _OCTET_STRING:
+                yield data[inizio:fine_contenuto]
+            elif tag & 0x20:
+                # tipo costruito: si scende dentro
+                if fine_contenuto == -1:
+                    pila.append((inizio, fine))
+                    break
+                pila.append((pos, fine))
+                pos, fine = inizio, fine_contenuto
+            # i tipi primitivi diversi da OCTET STRING vengono saltati
+
+
+def estrai_xml_p7m(data: bytes) -> bytes:
+    """
+    Estrae la fattura XML da un file firmato CAdES (.p7m), in DER o in base64,
+    senza verificare la firma: il documento è l'OCTET STRING più grande che
+    contiene XML.
+    """
+    if not data.lstrip().startswith(b"0"):
+        # .p7m salvato in base64 (con o senza a capo)
+        try:
+            data = base64.b64decode(b"".join(data.split()), validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError("file .p7m non valido")
+
+    migliore = b""
+    try:
+        for contenuto in _octet_strings(data, 0, len(data)):
+            if len(contenuto) > len(migliore) and b"<" in contenuto[:64]:
+                migliore = contenuto
+    except (IndexError, ValueError):
+        pass
+
+    if not migliore:
+        raise ValueError("nessun XML trovato nel file .p7m")
+    return migliore
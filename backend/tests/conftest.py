@@ -0,0 +1,19 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# app.main opens its databases, caches and content store from these at import:
+# keep them in a scratch directory, away from ./finance.db
+_SCRATCH = tempfile.mkdtemp(prefix="finance-tests-")
+atexit.register(shutil.rmtree, _SCRATCH, ignore_errors=True)
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_SCRATCH}/finance.db",
+    FILES_DIR=os.path.join(_SCRATCH, "files"),
+    PARSE_CACHE_PATH=os.path.join(_SCRATCH, "parse_cache.db"),
+    JOBS_DB_PATH=os.path.join(_SCRATCH, "jobs.db"),
+    BUS_DB_PATH=os.path.join(_SCRATCH, "bus.db"),
+    NOTIFY_BUS="local",
+    PARSE_EXECUTOR="thread",
+    OLLAMA_MODE="stub",
+)
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from benchmarks.fattura_generator import generate_invoice
+from scripts.fattura_extractor import _senza_allegati, extract_fattura
+
+FATTURA = (Path(__file__).resolve().parent.parent / "scripts" / "files" / "IT12878470157_GzFZ4.xml").read_bytes()
+
+
+def test_id_fornitore_dal_cedente():
+    info = extract_fattura(FATTURA)
+    assert info.id_fornitore == "IT12878470157"
+    assert info.nome_fornitore == "FASTWEB SpA"
+
+
+def test_id_fornitore_con_cessionario_diverso_da_fortuny():
+    # l'anagrafica del cessionario non è più scartata dall'euristica su FORTUNY
+    info = extract_fattura(FATTURA.replace(b"FORTUNY", b"ACME"))
+    assert info.id_fornitore == "IT12878470157"
+    assert info.nome_fornitore == "FASTWEB SpA"
+
+
+def test_id_fornitore_con_cessionario_persona_fisica():
+    cessionario = FATTURA.replace(
+        b"<Denominazione>s.r.l FORTUNY S.R.L.</Denominazione>",
+        b"<Nome>MARIO</Nome><Cognome>ROSSI</Cognome>",
+    )
+    info = extract_fattura(cessionario)
+    assert info.id_fornitore == "IT12878470157"
+    assert info.nome_fornitore == "FASTWEB SpA"
+
+
+def test_id_fornitore_da_codice_fiscale():
+    # senza IdFiscaleIVA vale il codice fiscale del cedente
+    inizio = FATTURA.index(b"<IdFiscaleIVA>")
+    fine = FATTURA.index(b"</IdFiscaleIVA>") + len(b"</IdFiscaleIVA>")
+    info = extract_fattura(FATTURA[:inizio] + FATTURA[fine:])
+    assert info.id_fornitore == "12878470157"
+
+
+def _con_allegato():
+    fattura = generate_invoice(seq=3, attachment_kb=4)
+    apertura = fattura.index(b"<Attachment>") + len(b"<Attachment>")
+    chiusura = fattura.index(b"</Attachment>")
+    return fattura, fattura[:apertura] + fattura[chiusura:]
+
+
+def test_senza_allegati_tag_spezzato_tra_blocchi():
+    # il taglio cade in ogni punto di <Attachment> e dei byte vicini
+    fattura, attesa = _con_allegato()
+    inizio = fattura.index(b"<Attachment>")
+    for taglio in range(inizio - 4, inizio + len(b"<Attachment>") + 4):
+        blocchi = [fattura[:taglio], fattura[taglio:]]
+        assert b"".join(_senza_allegati(blocchi)) == attesa, taglio
+
+
+def test_senza_allegati_blocchi_piccoli():
+    # blocchi più corti del tag e della coda tenuta tra un blocco e l'altro
+    fattura, attesa = _con_allegato()
+    for passo in (1, 7, 63):
+        blocchi = [fattura[i:i + passo] for i in range(0, len(fattura), passo)]
+        assert b"".join(_senza_allegati(blocchi)) == attesa, passo
+
+
+def test_estrazione_uguale_con_e_senza_allegati():
+    fattura, _ = _con_allegato()
+    assert extract_fattura(fattura) == extract_fattura(fattura, allegati=True)
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session, delete, func, select
+
+import app.main as m
+
+# events are registered against the real clock: a due date well ahead of it
+DUE = datetime.now(m.TZ).date() + timedelta(days=30)
+
+
+@pytest.fixture(autouse=True)
+def db():
+    m.prepare_storage()
+    m.migrate_db()
+    yield
+    with Session(m.engine) as sess:
+        for model in (m.Notification, m.NotificationLedger, m.DueEvent, m.InvoiceStat, m.Invoice, m.Supplier):
+            sess.exec(delete(model))
+        sess.commit()
+    m.supplier_registry._cache.clear()
+
+
+def _invoice(digest, id_sdi, due=DUE) -> m.Invoice:
+    return m.Invoice(filename=f"{digest}.xml", due_date=due, content_hash=digest, id_sdi=id_sdi, amount=10.0)
+
+
+def _receipt(name, digest, id_sdi):
+    return (name, f"<FatturaElettronica>{digest}</FatturaElettronica>".encode(), DUE, digest, id_sdi, 10.0,
+            "FASTWEB SpA", m.SupplierRef("IT12878470157", "FASTWEB SpA"))
+
+
+def _count(model) -> int:
+    with Session(m.engine) as sess:
+        return sess.exec(select(func.count()).select_from(model)).one()
+
+
+def test_same_file_stored_once():
+    first, _, duplicate = m._store_invoice(_invoice("h1", "S1"))
+    assert not duplicate
+    again, _, duplicate = m._store_invoice(_invoice("h1", None))
+    assert duplicate and again["id"] == first["id"]
+    assert _count(m.Invoice) == 1
+
+
+def test_same_sdi_id_stored_once():
+    # another file (e.g. the .p7m of the same invoice) with the same IdentificativoSdI
+    first, _, _ = m._store_invoice(_invoice("h1", "S1"))
+    again, _, duplicate = m._store_invoice(_invoice("h2", "S1"))
+    assert duplicate and again["id"] == first["id"]
+
+
+def test_receipts_batch_dedup_by_sdi_id():
+    rows, _ = m.store_receipts([_receipt("a.xml", "h1", "S1"), _receipt("b.xml", "h2", "S1"),
+                                _receipt("c.xml", "h3", "S2")], DUE - timedelta(days=30))
+    assert [r["duplicate"] for r in rows] == [False, True, False]
+    assert rows[1]["invoice_id"] == rows[0]["invoice_id"]
+
+    rows, _ = m.store_receipts([_receipt("d.xml", "h4", "S2")], DUE - timedelta(days=30))
+    assert rows[0]["duplicate"]
+    assert _count(m.Invoice) == 2
+    # one supplier for both invoices, one aggregate bucket per paid flag
+    assert _count(m.Supplier) == 1
+    with Session(m.engine) as sess:
+        stat = sess.exec(select(m.InvoiceStat).where(m.InvoiceStat.dimension == "supplier")).one()
+    assert (stat.count, stat.amount) == (2, 20.0)
+
+
+def test_rebuild_due_events_registers_missing_once():
+    with Session(m.engine) as sess:
+        sess.add(_invoice("h1", "S1"))  # stored without events, as before they existed
+        sess.commit()
+    assert m.rebuild_due_events() == 3  # due_soon, due_today, overdue
+    assert m.rebuild_due_events() == 0
+
+
+def test_due_events_fire_once():
+    m._store_invoice(_invoice("h1", "S1"))
+    due_soon = m._slot(DUE - timedelta(days=5))
+
+    payloads, _ = m._fire_due_events(due_soon)
+    assert [p["type"] for p in payloads] == ["due_soon"]
+    assert m._fire_due_events(due_soon)[0] == []
+
+    # events wiped and rebuilt the same day: due_soon was sent, it is not registered again
+    with Session(m.engine) as sess:
+        sess.exec(delete(m.DueEvent))
+        sess.commit()
+    m.rebuild_due_events()
+    assert m._fire_due_events(due_soon)[0] == []
+
+    asyncio.run(m.fire_due_events_job(m._slot(DUE)))
+    asyncio.run(m.fire_due_events_job(m._slot(DUE)))
+    with Session(m.engine) as sess:
+        kinds = sess.exec(select(m.Notification.kind).order_by(m.Notification.id)).all()
+    assert kinds == ["due_soon", "due_today"]
@@ -0,0 +1,57 @@
+import time
+
+from app.jobs import JobQueue
+
+
+def _queue(tmp_path, **kwargs) -> JobQueue:
+    return JobQueue(str(tmp_path / "jobs.db"), **kwargs)
+
+
+def _expire(queue: JobQueue, job_id: str):
+    # as if the worker holding the lease had died a while ago
+    conn = queue._open()
+    try:
+        conn.execute("UPDATE job SET lease_expires_at = ? WHERE id = ?", (time.time() - 1, job_id))
+    finally:
+        conn.close()
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.enqueue("receipts", {"files": []})
+    first = queue.claim("a")
+    assert first.id == job_id
+    assert queue.claim("b") is None  # leased to a
+
+    _expire(queue, job_id)
+    second = queue.claim("b")
+    assert second.id == job_id and second.attempts == 2
+    # a's lease is gone: its late result and heartbeats are refused
+    assert not queue.heartbeat(first)
+    assert not queue.complete(first, "a", {"ok": 1})
+    assert queue.complete(second, "b", {"ok": 1})
+    assert queue.get(job_id)["status"] == "done"
+
+
+def test_failures_retry_then_dead_letter(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2, retry_base_s=0)
+    job_id = queue.enqueue("reconcile", {})
+    assert queue.fail(queue.claim("a"), "a", "boom") == "queued"
+    assert queue.fail(queue.claim("a"), "a", "boom again") == "dead"
+    assert queue.claim("a") is None
+
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("dead", 2, "boom again")
+    assert queue.retry(job_id)
+    assert queue.claim("a").attempts == 1
+
+
+def test_lease_expired_on_last_attempt_is_dead_lettered(tmp_path):
+    queue = _queue(tmp_path, max_attempts=1)
+    job_id = queue.enqueue("backfill", {})
+    queue.claim("a")
+    _expire(queue, job_id)
+
+    assert queue.claim("b") is None
+    job = queue.get(job_id)
+    assert (job["status"], job["error"]) == ("dead", "lease expired")
@@ -0,0 +1,56 @@
+import base64
+
+import pytest
+
+from benchmarks.fattura_generator import generate_invoice
+from scripts.p7m import estrai_xml_p7m
+
+FATTURA = generate_invoice(seq=5)
+
+OID_SIGNED_DATA = bytes.fromhex("06092a864886f70d010702")
+OID_DATA = bytes.fromhex("06092a864886f70d010701")
+
+
+def _tlv(tag: int, contenuto: bytes) -> bytes:
+    n = len(contenuto)
+    if n < 0x80:
+        return bytes([tag, n]) + contenuto
+    lunghezza = n.to_bytes((n.bit_length() + 7) // 8, "big")
+    return bytes([tag, 0x80 | len(lunghezza)]) + lunghezza + contenuto
+
+
+def _indefinito(tag: int, *parti: bytes) -> bytes:
+    return bytes([tag, 0x80]) + b"".join(parti) + b"\x00\x00"
+
+
+def _firmato(documento: bytes) -> bytes:
+    # ContentInfo / SignedData ridotto all'osso: versione, algoritmi, contenuto e una firma
+    firma = _tlv(0x31, _tlv(0x30, _tlv(0x02, b"\x01") + _tlv(0x04, b"\x5a" * 256)))
+    contenuto = _tlv(0x30, OID_DATA + _tlv(0xA0, documento))
+    signed_data = _tlv(0x30, _tlv(0x02, b"\x01") + _tlv(0x31, b"") + contenuto + firma)
+    return _tlv(0x30, OID_SIGNED_DATA + _tlv(0xA0, signed_data))
+
+
+def test_p7m_der():
+    assert estrai_xml_p7m(_firmato(_tlv(0x04, FATTURA))) == FATTURA
+
+
+def test_p7m_base64_con_a_capo():
+    der = base64.encodebytes(_firmato(_tlv(0x04, FATTURA)))
+    assert b"\n" in der
+    assert estrai_xml_p7m(der) == FATTURA
+
+
+def test_p7m_firmato_in_streaming():
+    # lunghezze indefinite e documento spezzato in più OCTET STRING (BER)
+    pezzi = [_tlv(0x04, FATTURA[i:i + 1000]) for i in range(0, len(FATTURA), 1000)]
+    contenuto = _indefinito(0x30, OID_DATA, _indefinito(0xA0, _indefinito(0x24, *pezzi)))
+    p7m = _indefinito(0x30, OID_SIGNED_DATA, _indefinito(0xA0, _indefinito(0x30, _tlv(0x02, b"\x01"), contenuto)))
+    assert estrai_xml_p7m(p7m) == FATTURA
+
+
+def test_p7m_senza_xml():
+    with pytest.raises(ValueError):
+        estrai_xml_p7m(_firmato(_tlv(0x04, b"\x00" * 100)))
+    with pytest.raises(ValueError):
+        estrai_xml_p7m(b"non e' un p7m")
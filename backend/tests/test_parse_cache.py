@@ -0,0 +1,56 @@
+import sqlite3
+
+from app.parse_cache import ParseCache, dump_info
+from scripts.fattura_extractor import FatturaInfo
+
+
+def _info(n: int) -> FatturaInfo:
+    return FatturaInfo(file=f"{n}.xml", data_scadenza="2025-01-31", importo_totale=f"{n}.00", id_sdi=str(n))
+
+
+def _usage(path) -> tuple:
+    conn = sqlite3.connect(path)
+    try:
+        return (
+            conn.execute("SELECT bytes FROM parse_usage").fetchone()[0],
+            conn.execute("SELECT COALESCE(SUM(size), 0) FROM parse_result").fetchone()[0],
+        )
+    finally:
+        conn.close()
+
+
+def test_evicts_least_recently_used_past_max_bytes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    size = len(dump_info(_info(10)))
+    cache = ParseCache(path, memory_items=0, max_bytes=size * 5)
+    for n in range(10, 15):
+        cache.put(str(n), _info(n))
+    assert cache.get("10") is not None  # now the most recently used
+    cache.put("15", _info(15))
+
+    assert cache.evictions > 0
+    assert cache.get("10") is not None
+    assert cache.get("11") is None
+    stored, total = _usage(path)
+    assert stored == total <= size * 5
+
+
+def test_byte_limit_shared_between_processes(tmp_path):
+    # two caches on one file, as two workers: each sees what the other stored
+    path = str(tmp_path / "cache.db")
+    size = len(dump_info(_info(10)))
+    a = ParseCache(path, memory_items=0, max_bytes=size * 4)
+    b = ParseCache(path, memory_items=0, max_bytes=size * 4)
+    for n in range(10, 20):
+        (a if n % 2 else b).put(str(n), _info(n))
+    stored, total = _usage(path)
+    assert stored == total <= size * 4
+
+
+def test_put_again_replaces_the_size(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ParseCache(path, memory_items=0, max_bytes=1 << 20)
+    cache.put("10", _info(10))
+    cache.put("10", FatturaInfo(file="10.xml", fornitore="X" * 500))
+    stored, total = _usage(path)
+    assert stored == total > 500
@@ -1,48 +1,151 @@
-import subprocess
+import hashlib
+import http.client
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlsplit
 
-def deduci_importo_ai(xml_content: str, model: str = "tinyllama:latest") -> float:
-    """
-    Chiama Ollama (modello tinyllama:latest ) per dedurre l'importo totale da un file XML.
-    Ritorna un float con l'importo (0.0 se non trovato o errore).
-    Funziona su Windows, Linux e macOS.
-    """
-    prompt = f"""
+# Server Ollama locale (o "stub" per non chiamare nessun modello)
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODE = os.getenv("OLLAMA_MODE", "http")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "tinyllama:latest")
+# Richieste contemporanee al modello, da qualsiasi thread
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", 2))
+OLLAMA_TIMEOUT_S = float(os.getenv("OLLAMA_TIMEOUT_S", 120))
+# Risultati tenuti in memoria (chiave: modello + sha256 del contenuto)
+OLLAMA_CACHE_SIZE = int(os.getenv("OLLAMA_CACHE_SIZE", 1024))
+# Lunghezza massima della fattura nel prompt
+OLLAMA_PROMPT_MAX_CHARS = int(os.getenv("OLLAMA_PROMPT_MAX_CHARS", 8000))
+
+XmlContent = Union[str, bytes, bytearray, memoryview]
+
+_semaforo = threading.BoundedSemaphore(max(1, OLLAMA_CONCURRENCY))
+_locale = threading.local()
+# Thread dei lotti, vivi quanto il processo: ognuno tiene aperta la sua connessione keep-alive
+_pool = ThreadPoolExecutor(max_workers=max(1, OLLAMA_CONCURRENCY), thread_name_prefix="ollama")
+_cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Gli allegati (PDF in base64) non servono al modello e gonfiano il prompt
+_ALLEGATI = re.compile(r"<(\w+:)?Allegati\b.*?</(\w+:)?Allegati>", re.DOTALL | re.IGNORECASE)
+_SPAZI_TRA_TAG = re.compile(r">\s+<")
+
+
+def _testo(xml_content: XmlContent) -> str:
+    if isinstance(xml_content, str):
+        return xml_content
+    return bytes(xml_content).decode("utf-8", errors="replace")
+
+
+def _chiave(testo: str, model: str) -> Tuple[str, str]:
+    return model, hashlib.sha256(testo.encode("utf-8")).hexdigest()
+
+
+def _prompt(testo: str) -> str:
+    fattura = _SPAZI_TRA_TAG.sub("><", _ALLEGATI.sub("", testo)).strip()
+    return f"""
 Sei un assistente che legge fatture XML.
 Ti fornisco il contenuto del file e devi restituire SOLO l'importo totale da pagare,
 in formato numerico puro (senza simboli, lettere o testo extra).
 
 Fattura XML:
-{xml_content}
+{fattura[:OLLAMA_PROMPT_MAX_CHARS]}
     """
 
-    try:
-        process = subprocess.Popen(
-            ["ollama", "run", model],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True  # cross-platform (gestisce encoding automaticamente)
-        )
 
-        stdout, stderr = process.communicate(input=prompt)
+def _estrai_numero(risposta: str) -> Optional[float]:
+    # Primo token numerico della risposta
+    for token in risposta.replace("\n", " ").split():
+        token = token.replace(",", ".").strip()
+        try:
+            return float(token)
+        except ValueError:
+            continue
+    return None
+
 
-        if stderr:
-            print("⚠️ Errore Ollama:", stderr.strip())
+def _connessione() -> http.client.HTTPConnection:
+    # Una connessione keep-alive per thread, riusata tra le chiamate
+    conn = getattr(_locale, "conn", None)
+    if conn is None:
+        url = urlsplit(OLLAMA_URL)
+        cls = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        conn = cls(url.hostname or "localhost", url.port, timeout=OLLAMA_TIMEOUT_S)
+        _locale.conn = conn
+    return conn
 
-        risposta = (stdout or "").strip()
 
-        # Estrazione numero dalla risposta
-        importo = None
-        for token in risposta.replace("\n", " ").split():
-            token = token.replace(",", ".").strip()
-            try:
-                importo = float(token)
-                break
-            except ValueError:
-                continue
+def _genera(prompt: str, model: str) -> str:
+    body = json.dumps({"model": model, "prompt": prompt, "stream": False})
+    for tentativo in range(2):
+        conn = _connessione()
+        try:
+            conn.request("POST", "/api/generate", body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            data = resp.read()
+        except (http.client.HTTPException, OSError):
+            # connessione chiusa dal server: si riapre una volta sola
+            conn.close()
+            _locale.conn = None
+            if tentativo:
+                raise
+            continue
+        if resp.status != 200:
+            raise RuntimeError(f"HTTP {resp.status}: {data[:200]!r}")
+        return json.loads(data).get("response", "")
+    return ""
 
-        return importo if importo is not None else 0.0
 
+def deduci_importo_ai(xml_content: XmlContent, model: str = OLLAMA_MODEL) -> float:
+    """
+    Chiede al server Ollama (di default tinyllama:latest) l'importo totale della fattura.
+    Usato solo quando l'XML non contiene importi leggibili.
+    Ritorna un float con l'importo (0.0 se non trovato o errore).
+    I risultati sono in cache per contenuto; con OLLAMA_MODE=stub non chiama il modello.
+    """
+    testo = _testo(xml_content)
+    chiave = _chiave(testo, model)
+    with _cache_lock:
+        if chiave in _cache:
+            _cache.move_to_end(chiave)
+            return _cache[chiave]
+
+    if OLLAMA_MODE == "stub":
+        return 0.0
+
+    try:
+        with _semaforo:
+            risposta = _genera(_prompt(testo), model)
     except Exception as e:
         print("❌ Errore durante la chiamata a Ollama:", str(e))
         return 0.0
+
+    importo = _estrai_numero(risposta.strip())
+    if importo is None:
+        return 0.0
+
+    with _cache_lock:
+        _cache[chiave] = importo
+        while len(_cache) > OLLAMA_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return importo
+
+
+def deduci_importi_ai(contenuti: Sequence[XmlContent], model: str = OLLAMA_MODEL) -> List[float]:
+    """
+    Versione a lotti di deduci_importo_ai: i contenuti identici vengono chiesti
+    una volta sola e le richieste partono in parallelo (al massimo OLLAMA_CONCURRENCY)
+    sui thread del modulo, che riusano le connessioni tra una chiamata e l'altra.
+    Ritorna gli importi nello stesso ordine di `contenuti`.
+    """
+    testi = [_testo(c) for c in contenuti]
+    unici = list(dict.fromkeys(testi))
+    if not unici:
+        return []
+
+    risultati = dict(zip(unici, _pool.map(lambda t: deduci_importo_ai(t, model), unici)))
+    return [risultati[t] for t in testi]
@@ -0,0 +1,52 @@
+"""
+Job worker separato dall'API: esegue i job di upload accodati da /receipts/upload.
+
+    cd backend && NOTIFY_BUS=sqlite python worker.py --concurrency 2
+
+Con worker separati l'API va avviata con JOB_WORKERS=0 e NOTIFY_BUS=sqlite
+(le notifiche partono da qui e devono raggiungere i WebSocket dell'API).
+Si possono avviare più worker: ogni job viene preso da uno solo (lease), e
+se un worker muore il job torna disponibile alla scadenza del lease.
+"""
+import argparse
+import asyncio
+import signal
+import sys
+from typing import List, Optional
+
+
+async def esegui(concorrenza: int):
+    import app.main as app_main
+
+    app_main.prepare_storage()
+    app_main.migrate_db()
+    await app_main.bus.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    tasks = app_main.start_job_workers(concorrenza)
+    print(f"👷 Worker avviato: {concorrenza} job in parallelo")
+    try:
+        await stop.wait()
+    finally:
+        # un job interrotto a metà viene ripreso da un altro worker alla scadenza del lease
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await app_main.bus.stop()
+        app_main.pools.shutdown()
+    print("👋 Worker fermato")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Esegue i job di upload accodati")
+    parser.add_argument("--concurrency", type=int, default=1, help="job eseguiti in parallelo")
+    args = parser.parse_args(argv)
+    asyncio.run(esegui(max(1, args.concurrency)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())